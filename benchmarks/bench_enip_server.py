@@ -0,0 +1,261 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import random
+import struct
+import time
+from typing import Any, Dict, List
+
+from pylogix import PLC
+
+from enip_cip_interface.cip_client import ATOMIC_TYPES
+from enip_cip_interface.enip_server import EnipServer, EnipTag
+
+from common import print_table, summarise_times, write_results
+
+"""
+Latency and throughput benchmark of the application's ENIP server.
+
+For each tag count the server is started with that many REAL tags, timing how long the
+constructor takes (laying out the tag table and spawning the server process) and how long until
+a client can read the last tag. It is then restarted and timed again.
+
+Each workload then runs `--clients` pylogix clients, each in its own process, sending requests
+back to back for `--duration` seconds. A request reads or writes `--batch` random tags, and the
+mixed workload does each half the time. Clients know the tag types up front, as they would from
+a tag list, so pylogix's type discovery is not timed. While clients are writing, the main process
+drains `pop_write_operations` as the application does, timing how long each write takes to reach
+it from the server. Finally a single client writes one tag at a time and waits for each write to
+be popped, timing the whole trip.
+
+    python benchmarks/bench_enip_server.py --tag-counts 10 1000 10000 --clients 8 --output results.json
+
+Results go to stdout (or `--output`) as JSON, with summary tables on stderr.
+"""
+
+WORKLOADS = ("read", "write", "mixed")
+PROBE_TAG = "Probe" # Tag written by the write to pop probe
+REAL_TYPE = next(code for code, (name, _) in ATOMIC_TYPES.items() if name == "REAL")
+REAL_SIZE = struct.calcsize(ATOMIC_TYPES[REAL_TYPE][1])
+
+STARTUP_COLUMNS = ["tags", "start_ms", "ready_ms", "restart_ms", "restart_ready_ms"]
+LOAD_COLUMNS = [
+    "tags", "workload", "clients", "requests", "errors", "requests_per_second",
+    "latency_p50_ms", "latency_p99_ms", "write_to_pop_p50_ms", "write_to_pop_p99_ms",
+]
+
+
+def tag_name(index: int) -> str:
+    return f"Tag{index}"
+
+
+def connect(port: int, num_tags: int, timeout: float) -> PLC:
+    plc = PLC("127.0.0.1")
+    plc.Port = port
+    plc.SocketTimeout = timeout
+    for name in [PROBE_TAG, *map(tag_name, range(num_tags))]:
+        plc.KnownTags[name] = (REAL_TYPE, REAL_SIZE)
+    return plc
+
+
+def client_main(port: int, workload: str, num_tags: int, batch: int, duration: float, timeout: float, seed: int, go: Any, results: multiprocessing.Queue):
+    """A load client, run in its own process so clients do not share a GIL with each other or the server"""
+    rng = random.Random(seed)
+    plc = connect(port, num_tags, timeout)
+    ## Connect before the clock starts
+    plc.Read(tag_name(0))
+    results.put("ready")
+    go.wait()
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        tags = [tag_name(rng.randrange(num_tags)) for _ in range(batch)]
+        write = workload == "write" or (workload == "mixed" and rng.random() < 0.5)
+        started = time.perf_counter()
+        if write:
+            responses = plc.Write([(tag, rng.random()) for tag in tags])
+        else:
+            responses = plc.Read(tags)
+        latencies.append(time.perf_counter() - started)
+        responses = responses if isinstance(responses, list) else [responses]
+        errors += sum(r.Status != "Success" for r in responses)
+    plc.Close()
+    results.put((latencies, errors))
+
+
+async def wait_until_readable(port: int, num_tags: int, timeout: float = 60.0):
+    """Wait until a client can read the last tag registered with the server"""
+    loop = asyncio.get_running_loop()
+    plc = connect(port, num_tags, 1.0)
+    deadline = time.perf_counter() + timeout
+    try:
+        while time.perf_counter() < deadline:
+            response = await loop.run_in_executor(None, plc.Read, tag_name(num_tags - 1))
+            if response.Status == "Success":
+                return
+            plc.Close()
+            await asyncio.sleep(0.01)
+        raise TimeoutError(f"Server did not serve tag {tag_name(num_tags - 1)} within {timeout}s")
+    finally:
+        plc.Close()
+
+
+async def run_startup(args: argparse.Namespace, num_tags: int) -> tuple:
+    tags = [EnipTag(tag_name(i), float(i)) for i in range(num_tags)] + [EnipTag(PROBE_TAG, 0.0)]
+    started = time.perf_counter()
+    server = EnipServer(port=args.port, tags=tags, run_in_thread=args.thread, workers=args.workers)
+    start = time.perf_counter() - started
+    await wait_until_readable(args.port, num_tags)
+    ready = time.perf_counter() - started
+
+    started = time.perf_counter()
+    server.restart_server()
+    restart = time.perf_counter() - started
+    await wait_until_readable(args.port, num_tags)
+    restart_ready = time.perf_counter() - started
+
+    return server, {
+        "tags": num_tags,
+        "start_ms": start * 1000,
+        "ready_ms": ready * 1000,
+        "restart_ms": restart * 1000,
+        "restart_ready_ms": restart_ready * 1000,
+    }
+
+
+async def drain_writes(server: EnipServer, delays: List[float]):
+    """Pop client writes as the application does, recording how long each took to arrive"""
+    while True:
+        await server.await_write_received()
+        now = time.time()
+        delays.extend(now - op.timestamp for op in server.pop_write_operations())
+
+
+async def run_load(args: argparse.Namespace, server: EnipServer, num_tags: int, workload: str) -> Dict[str, Any]:
+    context = multiprocessing.get_context("spawn")
+    go = context.Event()
+    results = context.Queue()
+    clients = [
+        context.Process(
+            target=client_main,
+            args=(args.port, workload, num_tags, args.batch, args.duration, args.timeout, args.seed + i, go, results),
+            daemon=True,
+        )
+        for i in range(args.clients)
+    ]
+    for client in clients:
+        client.start()
+
+    loop = asyncio.get_running_loop()
+    for _ in clients:
+        await loop.run_in_executor(None, results.get)
+
+    delays = []
+    server.pop_write_operations()
+    drain = asyncio.create_task(drain_writes(server, delays))
+    go.set()
+    latencies = []
+    errors = 0
+    for _ in clients:
+        client_latencies, client_errors = await loop.run_in_executor(None, results.get)
+        latencies.extend(client_latencies)
+        errors += client_errors
+    for client in clients:
+        client.join()
+    await asyncio.sleep(0.1)
+    drain.cancel()
+
+    return {
+        "tags": num_tags,
+        "workload": workload,
+        "clients": args.clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_second": len(latencies) / args.duration,
+        **summarise_times(latencies, "latency"),
+        **summarise_times(delays, "write_to_pop"),
+    }
+
+
+async def run_write_probe(args: argparse.Namespace, server: EnipServer, num_tags: int) -> Dict[str, Any]:
+    """Time a write from a client until it is popped by the main process, one at a time"""
+    loop = asyncio.get_running_loop()
+    plc = connect(args.port, num_tags, args.timeout)
+    server.pop_write_operations()
+    trips = []
+    try:
+        for i in range(args.write_probes):
+            ## The server only forwards writes that change a value
+            value = float(server.read_tag(PROBE_TAG) + 1)
+            started = time.perf_counter()
+            await loop.run_in_executor(None, plc.Write, PROBE_TAG, value)
+            while not any(op.tag_name == PROBE_TAG and op.value == value for op in server.pop_write_operations()):
+                await asyncio.wait_for(server.await_write_received(), args.timeout)
+            trips.append(time.perf_counter() - started)
+    finally:
+        plc.Close()
+    return {
+        "tags": num_tags,
+        "workload": "write_probe",
+        "clients": 1,
+        "requests": len(trips),
+        "errors": 0,
+        "requests_per_second": len(trips) / sum(trips) if trips else 0.0,
+        ## Here the latency is the whole trip, from the client writing to the write being popped
+        **summarise_times(trips, "latency"),
+        **summarise_times(trips, "write_to_pop"),
+    }
+
+
+async def run(args: argparse.Namespace) -> tuple:
+    startup_results = []
+    load_results = []
+    for num_tags in args.tag_counts:
+        server, startup = await run_startup(args, num_tags)
+        startup_results.append(startup)
+        try:
+            for workload in args.workloads:
+                result = await run_load(args, server, num_tags, workload)
+                logging.info(f"{num_tags} tags, {workload}: {result['requests_per_second']:.1f} requests/s")
+                load_results.append(result)
+            if args.write_probes:
+                load_results.append(await run_write_probe(args, server, num_tags))
+        finally:
+            server.stop()
+    return startup_results, load_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ENIP server's latency and throughput under load")
+    parser.add_argument("--tag-counts", nargs="+", type=int, default=[10, 1000, 10000], help="Numbers of tags to serve, each benchmarked in turn")
+    parser.add_argument("--workloads", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--clients", type=int, default=4, help="Number of concurrent clients")
+    parser.add_argument("--batch", type=int, default=1, help="Tags read or written by each request")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run each workload for")
+    parser.add_argument("--write-probes", type=int, default=50, help="Writes to time from the client to pop_write_operations, 0 to skip")
+    parser.add_argument("--workers", type=int, default=1, help="ENIP server worker processes")
+    parser.add_argument("--thread", action="store_true", help="Run the server on a thread in this process")
+    parser.add_argument("--timeout", type=float, default=5.0, help="Client request timeout in seconds")
+    parser.add_argument("--port", type=int, default=44930)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="File to write the JSON results to, or - for stdout")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    multiprocessing.set_start_method("spawn", force=True)
+
+    started = time.time()
+    startup_results, load_results = asyncio.run(run(args))
+    print_table(startup_results, STARTUP_COLUMNS)
+    print_table(load_results, LOAD_COLUMNS)
+    parameters = {k: v for k, v in vars(args).items() if k not in ("output", "log_level")}
+    results = [{"kind": "startup", **r} for r in startup_results] + [{"kind": "load", **r} for r in load_results]
+    write_results("enip_server", parameters, results, args.output, started)
+
+
+if __name__ == "__main__":
+    main()
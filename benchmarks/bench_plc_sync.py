@@ -0,0 +1,205 @@
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from enip_cip_interface.app_config import EnipCipInterfaceConfig, EnipTagSyncMode, PlcClientBackend
+from enip_cip_interface.enip_server import EnipServer, EnipTag
+from enip_cip_interface.plc_sync import PlcSyncTask
+from enip_cip_interface.plc_worker import PlcWorkerApp, WorkerConfig
+
+from common import LatencyProxy, print_table, summarise_times, wait_for_port, write_results
+
+"""
+End to end benchmark of the PLC sync engine against a local simulated controller.
+
+The controller is the application's own cpppo based ENIP server, serving `--tags` REAL tags in
+a separate process, optionally behind a proxy adding `--latency` to every round trip. For each
+sync mode and client a `PlcSyncTask` maps every controller tag, and its sync cycle is run back to
+back for `--duration` seconds, after a few warmup cycles to connect and learn the tag types.
+
+Before each cycle, `--change-fraction` of the values are changed on the side the mode reads
+from: the controller for Read from PLC and Sync (PLC Preferred), the Doover tag values for Write
+to PLC and Sync (Doover Preferred). Requests are counted by the controller, and publishes by a
+stand-in for the application, which never sends anything anywhere.
+
+    python benchmarks/bench_plc_sync.py --tags 500 --latency 0.005 --output results.json
+
+Results go to stdout (or `--output`) as JSON, with a summary table on stderr.
+"""
+
+SYNC_MODES = {
+    "from_plc": EnipTagSyncMode.FROM_PLC,
+    "to_plc": EnipTagSyncMode.TO_PLC,
+    "sync_plc_preferred": EnipTagSyncMode.SYNC_PLC_PREFERRED,
+    "sync_doover_preferred": EnipTagSyncMode.SYNC_DOOVER_PREFERRED,
+}
+## Modes whose changes come from the controller, the others change the Doover tag values
+PLC_SOURCED_MODES = ("from_plc", "sync_plc_preferred")
+
+CLIENTS = {
+    "pylogix": PlcClientBackend.PYLOGIX,
+    "asyncio": PlcClientBackend.ASYNCIO,
+}
+
+APP_KEY = "bench"
+
+SUMMARY_COLUMNS = [
+    "mode", "client", "cycles", "cycles_per_second", "cycle_p50_ms", "cycle_p99_ms",
+    "requests_per_cycle", "publishes_per_cycle", "values_published_per_cycle",
+]
+
+
+class BenchmarkApp(PlcWorkerApp):
+    """Stands in for the application, counting publishes instead of sending them to the device agent."""
+
+    def __init__(self, config: WorkerConfig, tag_values: Dict[str, Any]):
+        super().__init__(config, results=None)
+        self.tag_values = {APP_KEY: tag_values}
+        self.tag_snapshot.update(self.tag_values)
+        self.publishes = 0
+        self.values_published = 0
+
+    async def publish_plc_values(self, plc_name: str, values: List[Tuple[Tuple[str, ...], Any]]):
+        self.publishes += 1
+        self.values_published += len(values)
+
+
+def plc_tag(index: int) -> str:
+    return f"Tag{index}"
+
+
+def doover_tag(index: int) -> str:
+    return f"tag{index}"
+
+
+def make_config() -> EnipCipInterfaceConfig:
+    config = EnipCipInterfaceConfig()
+    config.tag_namespace_separator.load_data("__")
+    config.tag_cache_directory.load_data("")
+    return config
+
+
+def make_plc_config(config: EnipCipInterfaceConfig, port: int, mode: str, client: str, num_tags: int, timeout: float):
+    plc_config = config.construct_plc()
+    plc_config.load_data({
+        "name": f"bench-{mode}-{client}",
+        "address": "127.0.0.1",
+        "port": port,
+        "timeout": timeout,
+        "micro800": False,
+        "username": None,
+        "password": None,
+        "client": CLIENTS[client],
+        "tag_mappings": [
+            {"mode": SYNC_MODES[mode], "plc_tag": plc_tag(i), "doover_tag": f"{APP_KEY}__{doover_tag(i)}"}
+            for i in range(num_tags)
+        ],
+    })
+    return plc_config
+
+
+async def run_case(args: argparse.Namespace, config: EnipCipInterfaceConfig, server: EnipServer, port: int, mode: str, client: str) -> Dict[str, Any]:
+    app = BenchmarkApp(WorkerConfig(config), {doover_tag(i): float(i) + 0.5 for i in range(args.tags)})
+    task = PlcSyncTask(app, make_plc_config(config, port, mode, client, args.tags, args.timeout))
+    rng = random.Random(args.seed)
+    num_changes = round(args.tags * args.change_fraction)
+
+    def change_values():
+        indexes = rng.sample(range(args.tags), num_changes)
+        if mode in PLC_SOURCED_MODES:
+            server.write_tags({plc_tag(i): server.read_tag(plc_tag(i)) + 1.0 for i in indexes})
+        else:
+            for i in indexes:
+                app.tag_values[APP_KEY][doover_tag(i)] += 1.0
+            ## As the application does on each tag_values channel update
+            app.tag_snapshot.update(app.tag_values)
+        ## The controller forwards every client write, keep its pipe drained
+        server.pop_write_operations()
+
+    cycle_times = []
+    async with task.create_client() as plc_client:
+        for _ in range(args.warmup):
+            change_values()
+            await task._sync_from_plc(plc_client)
+
+        requests_before = sum(c["requests"] for c in server.client_stats())
+        publishes_before, values_before = app.publishes, app.values_published
+        started = time.perf_counter()
+        while time.perf_counter() - started < args.duration:
+            change_values()
+            cycle_started = time.perf_counter()
+            await task._sync_from_plc(plc_client)
+            cycle_times.append(time.perf_counter() - cycle_started)
+        requests = sum(c["requests"] for c in server.client_stats()) - requests_before
+
+    cycles = len(cycle_times)
+    return {
+        "mode": mode,
+        "client": client,
+        "cycles": cycles,
+        ## Only the time spent in sync cycles, not changing values between them
+        "cycles_per_second": cycles / sum(cycle_times) if cycle_times else 0.0,
+        **summarise_times(cycle_times, "cycle"),
+        "requests_per_cycle": requests / cycles if cycles else 0.0,
+        "publishes_per_cycle": (app.publishes - publishes_before) / cycles if cycles else 0.0,
+        "values_published_per_cycle": (app.values_published - values_before) / cycles if cycles else 0.0,
+    }
+
+
+async def run(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    ## pydoover schemas share their elements between instances, so only build the config once
+    config = make_config()
+    initial_values = {plc_tag(i): float(i) for i in range(args.tags)}
+    server = EnipServer(port=args.port, tags=[EnipTag(name, value) for name, value in initial_values.items()])
+    try:
+        wait_for_port(args.port)
+        results = []
+        for mode in args.modes:
+            for client in args.clients:
+                ## Every case starts from the same controller values
+                server.write_tags(initial_values)
+                if args.latency > 0:
+                    with LatencyProxy(args.proxy_port, args.port, args.latency):
+                        result = await run_case(args, config, server, args.proxy_port, mode, client)
+                else:
+                    result = await run_case(args, config, server, args.port, mode, client)
+                logging.info(f"{mode} with {client}: {result['cycles_per_second']:.1f} cycles/s")
+                results.append(result)
+        return results
+    finally:
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PLC sync engine against a local simulated controller")
+    parser.add_argument("--tags", type=int, default=100, help="Number of controller tags, each with a tag mapping")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of latency added to every round trip to the controller")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds to run each sync mode and client for")
+    parser.add_argument("--warmup", type=int, default=3, help="Cycles to run before measuring")
+    parser.add_argument("--change-fraction", type=float, default=0.1, help="Fraction of the values changed before each cycle")
+    parser.add_argument("--modes", nargs="+", choices=list(SYNC_MODES), default=list(SYNC_MODES))
+    parser.add_argument("--clients", nargs="+", choices=list(CLIENTS), default=list(CLIENTS))
+    parser.add_argument("--timeout", type=float, default=5.0, help="PLC request timeout in seconds")
+    parser.add_argument("--port", type=int, default=44920, help="Port for the simulated controller")
+    parser.add_argument("--proxy-port", type=int, default=44921, help="Port for the latency proxy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="-", help="File to write the JSON results to, or - for stdout")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level)
+    multiprocessing.set_start_method("spawn", force=True)
+
+    started = time.time()
+    results = asyncio.run(run(args))
+    print_table(results, SUMMARY_COLUMNS)
+    parameters = {k: v for k, v in vars(args).items() if k not in ("output", "log_level")}
+    write_results("plc_sync", parameters, results, args.output, started)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+import asyncio
+import json
+import math
+import multiprocessing
+import platform
+import socket
+import sys
+import time
+from datetime import datetime, timezone
+from importlib import metadata
+from typing import Any, Dict, List
+
+"""
+Helpers shared by the benchmarks: timing summaries, machine readable results, and a TCP proxy that
+adds latency between a client and the local simulated controller.
+
+Results are written as a single JSON document, so runs from different releases can be compared:
+
+    {"benchmark": ..., "version": ..., "python": ..., "platform": ..., "started": ...,
+     "parameters": {...}, "results": [{...}, ...]}
+"""
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """The nearest rank percentile of some values, 0 if there are none"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarise_times(times: List[float], prefix: str) -> Dict[str, float]:
+    """Mean, p50, p99 and max of some durations in seconds, in milliseconds"""
+    return {
+        f"{prefix}_mean_ms": sum(times) / len(times) * 1000 if times else 0.0,
+        f"{prefix}_p50_ms": percentile(times, 50) * 1000,
+        f"{prefix}_p99_ms": percentile(times, 99) * 1000,
+        f"{prefix}_max_ms": max(times, default=0.0) * 1000,
+    }
+
+
+def write_results(benchmark: str, parameters: Dict[str, Any], results: List[Dict[str, Any]], output: str = None, started: float = None):
+    try:
+        version = metadata.version("enip-cip-interface")
+    except metadata.PackageNotFoundError:
+        version = None
+    document = {
+        "benchmark": benchmark,
+        "version": version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": multiprocessing.cpu_count(),
+        "started": datetime.fromtimestamp(started or time.time(), timezone.utc).isoformat(),
+        "parameters": parameters,
+        "results": results,
+    }
+    text = json.dumps(document, indent=2)
+    if output is None or output == "-":
+        print(text)
+    else:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+
+
+def print_table(results: List[Dict[str, Any]], columns: List[str]):
+    """A human readable summary of the results, on stderr so stdout stays machine readable"""
+    widths = [max(len(c), *(len(_format(r.get(c))) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)), file=sys.stderr)
+    for result in results:
+        print("  ".join(_format(result.get(c)).ljust(w) for c, w in zip(columns, widths)), file=sys.stderr)
+
+
+def _format(value: Any) -> str:
+    return f"{value:.2f}" if isinstance(value, float) else str(value)
+
+
+def wait_for_port(port: int, timeout: float = 30.0, host: str = "127.0.0.1"):
+    """Wait until something is listening on a TCP port"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+            time.sleep(0.1)
+
+
+class LatencyProxy:
+    """
+    Forwards TCP connections on `listen_port` to `target_port`, holding back the data in each
+    direction for half of `latency` seconds, so every request and reply round trip takes `latency`
+    longer. Runs in its own process so it does not compete with the benchmark's event loop.
+    """
+
+    def __init__(self, listen_port: int, target_port: int, latency: float):
+        self.listen_port = listen_port
+        self.target_port = target_port
+        self.latency = latency
+        self._process: multiprocessing.Process = None
+
+    def __enter__(self):
+        self._process = multiprocessing.Process(
+            target=_run_latency_proxy,
+            args=(self.listen_port, self.target_port, self.latency),
+            daemon=True,
+        )
+        self._process.start()
+        wait_for_port(self.listen_port)
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._process.terminate()
+        self._process.join()
+
+
+def _run_latency_proxy(listen_port: int, target_port: int, latency: float):
+    asyncio.run(_latency_proxy(listen_port, target_port, latency))
+
+
+async def _latency_proxy(listen_port: int, target_port: int, latency: float):
+    async def forward(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        ## Queue each chunk with the time it is due, so the delay never reorders the stream
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        async def send():
+            while True:
+                due, data = await queue.get()
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not data:
+                    writer.close()
+                    return
+                writer.write(data)
+                await writer.drain()
+
+        sender = asyncio.create_task(send())
+        try:
+            while True:
+                data = await reader.read(65536)
+                queue.put_nowait((loop.time() + latency / 2, data))
+                if not data:
+                    break
+            await sender
+        except (ConnectionError, asyncio.CancelledError):
+            sender.cancel()
+            writer.close()
+
+    async def handle(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        server_reader, server_writer = await asyncio.open_connection("127.0.0.1", target_port)
+        await asyncio.gather(
+            forward(client_reader, server_writer),
+            forward(server_reader, client_writer),
+        )
+
+    server = await asyncio.start_server(handle, "127.0.0.1", listen_port)
+    async with server:
+        await server.serve_forever()
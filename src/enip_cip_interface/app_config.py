@@ -1,6 +1,8 @@
 from pathlib import Path
+from typing import Any
 
 from pydoover import config
+from pydoover.config import NotSet
 
 class EnipTagSyncMode(config.Enum):
     FROM_PLC = "Read from PLC"
@@ -8,12 +10,60 @@ class EnipTagSyncMode(config.Enum):
     SYNC_PLC_PREFERRED = "Sync (PLC Preferred)"
     SYNC_DOOVER_PREFERRED = "Sync (Doover Preferred)"
 
+class DeadbandType(config.Enum):
+    ABSOLUTE = "Absolute"
+    PERCENT = "Percent"
+
+class OverrunPolicy(config.Enum):
+    SKIP = "Skip missed cycles"
+    CATCH_UP = "Catch up"
+    STRETCH = "Stretch period"
+
+class EnipServerMode(config.Enum):
+    PROCESS = "Separate process"
+    THREAD = "In-process thread"
+
+class PlcClientBackend(config.Enum):
+    PYLOGIX = "pylogix"
+    ASYNCIO = "Native asyncio (pipelined)"
+
+
+def get_config_value(element: config.ConfigElement, default: Any = None):
+    """
+    Get the value of a config element, falling back to its schema default if it is not set.
+
+    Deployed configs only hold the keys that existed when they were saved, so options added
+    to the schema since then should be read through this rather than `.value`.
+    """
+    try:
+        return element.value
+    except ValueError:
+        if element.default is NotSet or element.default is None:
+            return default
+        return element.default
+
 class EnipCipInterfaceConfig(config.Schema):
 
     def __init__(self):
         self.port = config.Integer("Port", default=44818, description="The port to host an ENIP server on")
         self.enable_enip_server = config.Boolean("Enable ENIP Server", default=False, description="Whether to enable the ENIP server")
+        self.enip_server_mode = config.Enum(
+            "ENIP Server Mode",
+            default=EnipServerMode.PROCESS,
+            description="Run the ENIP server in its own process, or on a thread in the application's process. A thread starts faster and uses less memory, which suits smaller deployments (up to about a thousand tags) on constrained devices.",
+            choices=[
+                EnipServerMode.PROCESS,
+                EnipServerMode.THREAD,
+            ]
+        )
+        self.enip_server_workers = config.Integer("ENIP Server Workers", default=1, description="Run the ENIP server as this many worker processes sharing the port, so serving many clients at once scales across CPU cores. Each client connection is served by one worker. Only used when the server runs in its own process.")
+        self.enip_tag_types = config.String("ENIP Tag Types", default="", description="Explicit types for tags served by the ENIP server, as comma separated name=TYPE pairs (eg. my_app__total=LINT, my_app__trend=LREAL). TYPE is one of BOOL, SINT, INT, DINT, LINT, REAL, LREAL or STRING, and sets the element type of list values. Other tags are typed from their values: whole numbers as DINT (or LINT), other numbers as REAL and lists as arrays.")
+        self.enip_write_coalesce_window = config.Number("ENIP Write Coalesce Window", default=0.05, description="How long in seconds to collect writes from ENIP clients before publishing them together. Repeated writes to a tag within the window only publish the last value.")
         self.tag_namespace_separator = config.String("Tag Namespace Separator", default="__", description="The separator to use between tag namespaces")
+        self.tag_cache_directory = config.String("Tag Cache Directory", default="/app/tag_cache", description="Directory to persist PLC tag metadata in, so tag types do not have to be rediscovered after a reconnect or restart. Leave empty to disable.")
+        self.metrics_port = config.Integer("Metrics Port", default=0, description="Port to serve sync and ENIP server metrics on, in the Prometheus text format at /metrics. Set to 0 to disable.")
+        self.metrics_publish_period = config.Number("Metrics Publish Period", default=0.0, description="How often in seconds to publish a compact summary of the metrics to the enip_cip_metrics channel. Set to 0 to disable.")
+        self.plc_worker_processes = config.Integer("PLC Worker Processes", default=0, description="Spread the PLCs across this many worker processes, so syncing scales across CPU cores. Set to 0 to sync every PLC in the main process.")
         self.plcs = config.Array("PLCs", element=self.construct_plc(), description="The PLCs to connect to")
 
     def construct_plc(self):
@@ -32,23 +82,68 @@ class EnipCipInterfaceConfig(config.Schema):
             ),
             config.String("Doover Tag", description="The tag to map to the PLC. Namespaces are separated by the tag namespace separator."),
             config.String("PLC Tag", description="The tag to map to the PLC"),
+            config.Number("Deadband", default=0.01, description="The amount a numeric value must change by before it is reported"),
+            config.Enum(
+                "Deadband Type",
+                default=DeadbandType.ABSOLUTE,
+                description="Whether the deadband is an absolute amount or a percentage of the last reported value",
+                choices=[
+                    DeadbandType.ABSOLUTE,
+                    DeadbandType.PERCENT,
+                ]
+            ),
+            config.Number("Heartbeat Period", default=0.0, description="Report a value read from the PLC after this many seconds even if it has not changed. Set to 0 to only report changes."),
+            config.Number("Poll Period", default=0.0, description="How often in seconds to sync this mapping. Mappings with the same period are polled together. Set to 0 to use the PLC's Sync Period."),
         )
 
         plc_elem = config.Object("PLC")
         plc_elem.add_elements(
             config.String("Name", default=None, description="The name of the PLC. This is used to identify the PLC in the Doover config."),
             config.String("Address", description="IP address or domain name of the PLC"),
+            config.String("Secondary Address", default=None, description="Another address for the PLC, eg. the partner chassis of a redundant pair. After a connection fails the next attempt goes to the other address."),
             config.Integer("Port", default=44818, description="Port to connect on the PLC"),
             config.Boolean("Micro800", default=False, description="Whether the PLC is a Micro800"),
             config.String("Username", default=None, description="Username to connect to the PLC"),
             config.String("Password", default=None, description="Password to connect to the PLC"),
             config.Number("Sync Period", default=1.0, description="The period in seconds to sync the PLC"),
             config.Number("Timeout", default=0.2, description="The timeout in seconds to wait for a response from the PLC"),
+            config.Enum(
+                "Overrun Policy",
+                default=OverrunPolicy.SKIP,
+                description="What to do when a sync cycle takes longer than its poll period. Skip drops the missed cycles and keeps to the original schedule, Catch Up runs them late back to back (at most 10), and Stretch starts the next cycle straight away and restarts the schedule from there.",
+                choices=[
+                    OverrunPolicy.SKIP,
+                    OverrunPolicy.CATCH_UP,
+                    OverrunPolicy.STRETCH,
+                ]
+            ),
+            config.Number("Min Publish Interval", default=0.0, description="The minimum time in seconds between publishing values read from the PLC. Changes in between are held and published together."),
+            config.Number("Write Refresh Period", default=0.0, description="Rewrite unchanged values to the PLC after this many seconds. Set to 0 to only write values when they change."),
+            config.Enum(
+                "Client",
+                default=PlcClientBackend.PYLOGIX,
+                description="The EtherNet/IP client used to talk to the PLC. The native asyncio client keeps several requests in flight at once, which suits high latency links.",
+                choices=[
+                    PlcClientBackend.PYLOGIX,
+                    PlcClientBackend.ASYNCIO,
+                ]
+            ),
+            config.Integer("Max Outstanding Requests", default=4, description="The maximum number of requests the native asyncio client keeps in flight at once"),
+            config.Boolean("Connected Messaging", default=True, description="Only used by the native asyncio client. Open a CIP connection (Forward Open) to the PLC and reuse it for all cyclic reads and writes, falling back to unconnected messaging if the PLC refuses the connection. The pylogix client always opens a connection."),
+            config.Integer("Connection Size", default=4002, description="The CIP connection size in bytes to request. Sizes above 511 use a Large Forward Open, falling back to 504 bytes if the PLC does not support it."),
+            config.Number("Reconnect Delay", default=0.5, description="Seconds to wait before reconnecting once every address has failed. The delay doubles (with some jitter) after each failed attempt, until a sync cycle succeeds."),
+            config.Number("Max Reconnect Delay", default=30.0, description="The longest delay in seconds between reconnect attempts"),
+            config.Number("Health Check Period", default=5.0, description="Check the connection with a small request when it has been idle for this many seconds, so a lost connection is recovered before the next sync cycle. Set to 0 to disable."),
             config.Array("Tag Mappings", element=plc_tag_mapping),
         )
         return plc_elem
 
 
+def plc_config_name(plc_config: config.Object) -> str:
+    """The name a PLC is known by, its address if it has not been given one"""
+    return str(get_config_value(plc_config.name) or plc_config.address.value)
+
+
 def export():
     EnipCipInterfaceConfig().export(Path(__file__).parents[2] / "doover_config.json", "enip_cip_interface")
 
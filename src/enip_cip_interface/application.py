@@ -7,28 +7,45 @@ from typing import Dict, Any, List
 
 from pydoover.docker import Application
 
-from .app_config import EnipCipInterfaceConfig
-from .enip_server import EnipServer, EnipTag
+from .app_config import EnipCipInterfaceConfig, EnipServerMode, get_config_value, plc_config_name
+from .doover_tags import DooverTagAccess, TagSnapshot
+from .enip_server import EnipServer, EnipTag, diff_tag_values
+from .metrics import REGISTRY, compact_metrics, start_metrics_server
+from .tag_table import ELEMENT_FORMATS
 from .plc_sync import PlcSyncTask
+from .plc_worker import PlcWorkerPool, RemotePlcSyncTask
 
 log = logging.getLogger()
 
-class EnipCipInterfaceApplication(Application):
+METRICS_CHANNEL = "enip_cip_metrics"
+
+PUBLISH_SECONDS = REGISTRY.histogram("doover_publish_seconds", "Time taken to publish tag values to the tag_values channel", ("source",))
+CHANNEL_UPDATES = REGISTRY.counter("tag_values_updates_total", "Updates received from the tag_values channel")
+ENIP_READ_RATE = REGISTRY.gauge("enip_server_read_rate", "Tag reads per second by ENIP clients, over the last main loop")
+ENIP_WRITE_RATE = REGISTRY.gauge("enip_server_write_rate", "Tag writes per second by ENIP clients, over the last main loop")
+ENIP_CLIENTS = REGISTRY.gauge("enip_server_clients", "ENIP clients seen recently")
+
+class EnipCipInterfaceApplication(DooverTagAccess, Application):
     config: EnipCipInterfaceConfig  # not necessary, but helps your IDE provide autocomplete!
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.started: float = time.time()
         self.tags = []
+        self.enip_tag_values: Dict[str, Any] = {} # The flattened tag_values last sent to the ENIP server
+        self.enip_tag_types: Dict[str, str] = {} # Explicit ENIP tag types from the config, by tag name
+        self.tag_snapshot = TagSnapshot() # The tag_values aggregate, indexed for the PLC sync tasks
         self.channel_update_ts = []
-        self.enip_read_ts = []
-        self.enip_write_ts = []
         self._max_ts = 30 # Max number of timestamps to keep track of
 
         self.enip_server = None
         self._write_task = None
+        self._metrics_server: asyncio.AbstractServer = None
+        self._metrics_task = None
 
-        self._plc_sync_tasks: List[PlcSyncTask] = []
+        self._plc_sync_tasks: List[PlcSyncTask | RemotePlcSyncTask] = []
+        self._plc_worker_pool: PlcWorkerPool = None
+        self._plc_configs: List[Any] = [] # The PLC config elements the sync tasks were last given
 
     async def setup(self):
         """Initialize the EtherNet/IP server"""
@@ -41,26 +58,51 @@ class EnipCipInterfaceApplication(Application):
         logging.debug("Adding subscription to tag_values")
         self.device_agent.add_subscription("tag_values", self.on_tag_update)
         tag_contents = await self.device_agent.get_channel_aggregate_async("tag_values")
+        self.tag_snapshot.update(tag_contents)
         if tag_contents is None or len(tag_contents) == 0:
             logging.warning("No initial tag contents found, using default")
             tag_contents = {"TEST": True}
+        self.enip_tag_types = self.parse_enip_tag_types(get_config_value(self.config.enip_tag_types, ""))
         self.tags = self.generate_tags(tag_contents)
+        self.enip_tag_values = {tag.name: tag.current_value for tag in self.tags}
         logging.info(f"Generated initial tags: {self.tags}")
 
         if self.config.enable_enip_server.value:
-            self.enip_server = EnipServer(port=self.config.port.value, tags=self.tags)
+            self.enip_server = EnipServer(
+                port=self.config.port.value,
+                tags=self.tags,
+                tag_type_overrides=self.enip_tag_types,
+                run_in_thread=get_config_value(self.config.enip_server_mode) == EnipServerMode.THREAD,
+                workers=get_config_value(self.config.enip_server_workers, 1),
+            )
             self._write_task = asyncio.create_task(self.enip_write_task())
 
-        for plc_config in self.config.plcs.elements:
-            new_plc = PlcSyncTask(self, plc_config)
-            await new_plc.start()
-            self._plc_sync_tasks.append(new_plc)
+        self._plc_configs = list(self.config.plcs.elements)
+        num_workers = get_config_value(self.config.plc_worker_processes, 0)
+        if num_workers > 0 and self.config.plcs.elements:
+            ## Sharded mode, the PLCs are synced in worker processes which send their updates back here
+            self._plc_worker_pool = PlcWorkerPool(self, self.config.plcs.elements, num_workers)
+            await self._plc_worker_pool.start()
+            self._plc_sync_tasks.extend(self._plc_worker_pool.tasks.values())
+        else:
+            for plc_config in self.config.plcs.elements:
+                new_plc = PlcSyncTask(self, plc_config)
+                await new_plc.start()
+                self._plc_sync_tasks.append(new_plc)
+
+        metrics_port = get_config_value(self.config.metrics_port, 0)
+        if metrics_port:
+            self._metrics_server = await start_metrics_server(metrics_port, self.collect_metrics)
+        if get_config_value(self.config.metrics_publish_period, 0.0) > 0:
+            self._metrics_task = asyncio.create_task(self.metrics_publish_task())
 
         self.on_tag_update("tag_values", tag_contents)
 
     async def main_loop(self):
         """Main application loop"""
 
+        await self.update_plc_configs()
+
         ## Every 10 seconds publish some analytics about the interactions
 
         channel_rate = self.get_loop_rate(self.channel_update_ts)
@@ -70,31 +112,80 @@ class EnipCipInterfaceApplication(Application):
             logging.info(f"PLC Sync Task {plc_sync_task.plc_name} running at {plc_sync_task.sync_speed_hz:.2f} Hz: Average task time: {plc_sync_task.average_task_time:.2f} seconds")
         
         if self.config.enable_enip_server.value:
-            read_rate = self.get_loop_rate([op.timestamp for op in self.enip_server.pop_read_operations()])
-            write_rate = self.get_loop_rate(self.enip_write_ts)
+            read_rate, write_rate = self.enip_server.request_rates()
+            ENIP_READ_RATE.set(read_rate)
+            ENIP_WRITE_RATE.set(write_rate)
             logging.info(f"ENIP Server Read rate: {read_rate:.2f} Hz")
             logging.info(f"ENIP Server Write rate: {write_rate:.2f} Hz")
+            client_stats = self.enip_server.client_stats()
+            ENIP_CLIENTS.set(len(client_stats))
+            for client in client_stats:
+                logging.info(f"ENIP client {client['client']}: {client['reads']} reads, {client['writes']} writes, last seen {time.time() - client['last_seen']:.1f}s ago")
         
         await asyncio.sleep(10)
 
+    async def update_plc_configs(self):
+        """
+        Hand the PLC sync tasks their new config after a deployment config update.
+
+        A config update replaces every PLC config element, so the tasks would otherwise keep syncing
+        with the config they were started with until the application restarts.
+        """
+        plc_configs = list(self.config.plcs.elements)
+        if len(plc_configs) == len(self._plc_configs) and all(a is b for a, b in zip(plc_configs, self._plc_configs)):
+            return
+        self._plc_configs = plc_configs
+        logging.info("PLC config updated")
+
+        if self._plc_worker_pool is not None:
+            self._plc_worker_pool.update_configs(plc_configs)
+            self._plc_sync_tasks = list(self._plc_worker_pool.tasks.values())
+            return
+
+        by_name = {plc_config_name(plc_config): plc_config for plc_config in plc_configs}
+        for task in list(self._plc_sync_tasks):
+            plc_config = by_name.pop(task.plc_name, None)
+            if plc_config is None:
+                logging.info(f"PLC {task.plc_name} removed from config, stopping its sync task")
+                await task.stop()
+                self._plc_sync_tasks.remove(task)
+            else:
+                task.update_config(plc_config)
+        for plc_config in by_name.values():
+            new_plc = PlcSyncTask(self, plc_config)
+            await new_plc.start()
+            self._plc_sync_tasks.append(new_plc)
+
     async def enip_write_task(self):
         logging.debug("Starting ENIP write task")
         while True:
             try:
                 logging.debug("Waiting for ENIP write")
                 await self.enip_server.await_write_received()
+                ## Give a burst of writes (eg. a recipe download) a moment to arrive, then publish them together
+                coalesce_window = get_config_value(self.config.enip_write_coalesce_window, 0.0)
+                if coalesce_window > 0:
+                    await asyncio.sleep(coalesce_window)
                 writes = self.enip_server.pop_write_operations()
-                logging.debug(f"Forwarding ENIP writes to channel: {writes}")
-                for w in writes:
-                    msg = self.to_channel_message(w.tag_name, w.value)
-                    logging.debug(f"Publishing to channel: {msg}")
-                    await self.device_agent.publish_to_channel_async(
-                        "tag_values",
-                        msg,
-                        record_log=False,
-                        max_age=None,
-                    )
-                    self.enip_write_ts = self.log_ts(self.enip_write_ts)
+                if not writes:
+                    continue
+
+                delimiter = self.config.tag_namespace_separator.value
+                msg = self.paths_to_channel_message((w.tag_name.split(delimiter), w.value) for w in writes)
+                logging.debug(f"Publishing {len(writes)} ENIP writes to channel: {msg}")
+                started = time.monotonic()
+                await self.device_agent.publish_to_channel_async(
+                    "tag_values",
+                    msg,
+                    record_log=False,
+                    max_age=None,
+                )
+                PUBLISH_SECONDS.labels("enip").observe(time.monotonic() - started)
+
+                ## Don't wait for the channel to echo the writes back before the PLC sync tasks see them
+                changed = self.tag_snapshot.merge(msg)
+                if self._plc_worker_pool is not None:
+                    self._plc_worker_pool.update_tag_values(changed)
             except asyncio.CancelledError:
                 logging.debug("ENIP write task cancelled")
                 break
@@ -103,6 +194,42 @@ class EnipCipInterfaceApplication(Application):
                 traceback.print_exc()
                 await asyncio.sleep(1)
 
+    async def publish_plc_values(self, plc_name: str, values: list[tuple[tuple[str, ...], Any]]):
+        """Publish a batch of (doover path, value) pairs read from a PLC to the tag_values channel."""
+        updates_to_publish = self.paths_to_channel_message(values)
+
+        logging.debug(f"Synced from PLC {plc_name}: {updates_to_publish}")
+        logging.info(f"{plc_name} PLC TASK: Publishing updates to channel: {updates_to_publish}")
+        started = time.monotonic()
+        await self.device_agent.publish_to_channel_async(
+            "tag_values",
+            updates_to_publish,
+            record_log=False,
+            max_age=None,
+        )
+        PUBLISH_SECONDS.labels("plc").observe(time.monotonic() - started)
+
+    def collect_metrics(self) -> List[list]:
+        """Metrics snapshots from this process and every PLC worker process"""
+        snapshots = [REGISTRY.snapshot()]
+        if self._plc_worker_pool is not None:
+            snapshots.extend(self._plc_worker_pool.metrics.values())
+        return snapshots
+
+    async def metrics_publish_task(self):
+        while True:
+            try:
+                await asyncio.sleep(get_config_value(self.config.metrics_publish_period, 60.0))
+                await self.device_agent.publish_to_channel_async(
+                    METRICS_CHANNEL,
+                    {"ts": time.time(), "metrics": compact_metrics(self.collect_metrics())},
+                    record_log=False,
+                )
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logging.error(f"Error publishing metrics: {e}")
+
     def log_ts(self, records: list[float]):
         ## Do some logging
         records.append(time.time())
@@ -114,68 +241,60 @@ class EnipCipInterfaceApplication(Application):
         if len(records) > 1:
             first_ts = records[0]
             dt = records[-1] - first_ts
+            if dt <= 0:
+                return 0.0
             rate = len(records) / dt
             return rate
         return 0.0
 
     def on_tag_update(self, channel_name: str, channel_values: Dict[str, Any]):
         self.channel_update_ts = self.log_ts(self.channel_update_ts)
+        CHANNEL_UPDATES.inc()
+        changed = self.tag_snapshot.update(channel_values)
+        if self._plc_worker_pool is not None:
+            self._plc_worker_pool.update_tag_values(changed)
         if not self.config.enable_enip_server.value:
             return
         if self.enip_server is None:
             logging.warning("ENIP server not initialized, skipping tag update")
             return
         logging.debug(f"Channel update from channel {channel_name}: {channel_values}")
-        self.tags = self.generate_tags(channel_values)
-        logging.debug(f"Generated tags: {self.tags}")
-        self.enip_server.set_tags(self.tags)
 
-        tag_values = {tag.name: tag.current_value for tag in self.tags}
-        logging.debug(f"Writing tag values: {tag_values}")
-        self.enip_server.write_tags(tag_values)
+        ## Only send the server the leaves that have changed since the last update
+        tag_values = dict(self.flatten_tag_values(channel_values))
+        changed, removed = diff_tag_values(self.enip_tag_values, tag_values)
+        self.enip_tag_values = tag_values
+        if not changed and not removed:
+            return
+        logging.debug(f"Updating ENIP tags: {changed}, removing: {removed}")
+        self.enip_server.update_tags(changed, removed)
 
-    def generate_tags(self, value: Any, prefixes: list[str] = []):
-        tags = []
+    @staticmethod
+    def parse_enip_tag_types(tag_types: str) -> Dict[str, str]:
+        """Parse the `name=TYPE, ...` ENIP tag types config"""
+        result = {}
+        for entry in tag_types.split(","):
+            if not entry.strip():
+                continue
+            name, _, tag_type = entry.partition("=")
+            tag_type = tag_type.strip().upper()
+            if tag_type not in ELEMENT_FORMATS:
+                logging.warning(f"Ignoring ENIP tag type {entry.strip()!r}, the type must be one of {', '.join(ELEMENT_FORMATS)}")
+                continue
+            result[name.strip()] = tag_type
+        return result
+
+    def flatten_tag_values(self, value: Any, prefixes: list[str] = []):
+        """Yield (ENIP tag name, value) for each leaf of a nested tag_values aggregate"""
         if isinstance(value, dict):
             for k, v in value.items():
-                tags.extend(self.generate_tags(v, prefixes + [k]))
+                yield from self.flatten_tag_values(v, prefixes + [k])
         else:
             delimiter = self.config.tag_namespace_separator.value
-            tags.append(EnipTag(f"{delimiter.join(prefixes)}", current_value=value))
-        return tags
-
-    def to_channel_message(self, enip_tag_name: str, enip_tag_value: Any):
-        delimiter = self.config.tag_namespace_separator.value
-        s = enip_tag_name.split(delimiter)
-        if len(s) == 1:
-            res = {
-                enip_tag_name: enip_tag_value
-            }
-            return res
-        # Compose a nested dictionary for as many more elements as there are
-        result = {}
-        for i in range(0, len(s)-1):
-            result[s[i]] = {
-                s[i+1]: enip_tag_value
-            }
-        return result
-    
-    def retreive_doover_tag_value(self, delimited_tag_name: str):
-        try:
-            delimiter = self.config.tag_namespace_separator.value
-            s = delimited_tag_name.split(delimiter)
-            if len(s) < 1:
-                raise ValueError(f"Invalid tag name: {delimited_tag_name}")
-            if len(s) == 1:
-                return self.get_global_tag(s[0])
-            if len(s) >= 2:
-                result = self.get_tag(s[1], app_key=s[0])
-                for i in range(2, len(s)):
-                    if isinstance(result, dict):
-                        result = result[s[i]]
-                    else:
-                        raise ValueError(f"Tag {delimited_tag_name} not found")
-            return result
-        except Exception as e:
-            logging.exception(f"Error retrieving tag value: {e}", exc_info=True)
-            return None
+            yield f"{delimiter.join(prefixes)}", value
+
+    def generate_tags(self, value: Any, prefixes: list[str] = []):
+        return [
+            EnipTag(name, current_value=v, tag_type=self.enip_tag_types.get(name))
+            for name, v in self.flatten_tag_values(value, prefixes)
+        ]
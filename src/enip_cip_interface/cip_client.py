@@ -0,0 +1,805 @@
+import asyncio
+import itertools
+import logging
+import random
+import re
+import struct
+from typing import Any, Dict, List, Optional, Tuple
+
+from pylogix.lgx_response import Response
+
+from .app_config import get_config_value
+from .tag_cache import TagInfo, base_tag_name, parse_identity
+
+"""
+Native asyncio EtherNet/IP (CIP) client for the sync engine.
+
+Unlike pylogix, which sends one request and blocks for its reply, this client keeps several
+requests outstanding on a single EtherNet/IP session. Every request carries a unique sender
+context and a background reader matches each reply back to its request, so a high latency
+link can carry many requests per round trip without opening extra connections.
+
+It implements the subset of the Logix tag services needed by `PlcSyncTask`:
+- Read Tag (0x4C) and Write Tag (0x4D) by symbolic name, including array elements
+- Read Modify Write Tag (0x4E) for writing individual bits of an integer
+- Multiple Service Packet (0x0A) to pack many reads or writes into one request
+
+Results are returned as pylogix `Response` objects so the two clients are interchangeable.
+
+By default a CIP class 3 connection is opened with a (Large) Forward Open and all requests are
+sent as connected messages, which lets a single packet carry up to the negotiated connection
+size rather than the 504 byte unconnected limit. If the session or connection is lost it is
+re-established on the next request.
+"""
+
+## Encapsulation commands
+REGISTER_SESSION = 0x65
+UNREGISTER_SESSION = 0x66
+SEND_RR_DATA = 0x6F
+SEND_UNIT_DATA = 0x70
+
+## CIP services
+GET_ATTRIBUTES_ALL = 0x01
+GET_ATTRIBUTE_LIST = 0x03
+GET_INSTANCE_ATTRIBUTE_LIST = 0x55
+READ_TAG = 0x4C
+READ_TAG_FRAGMENTED = 0x52
+WRITE_TAG = 0x4D
+READ_MODIFY_WRITE_TAG = 0x4E
+MULTIPLE_SERVICE_PACKET = 0x0A
+UNCONNECTED_SEND = 0x52
+FORWARD_OPEN = 0x54
+LARGE_FORWARD_OPEN = 0x5B
+FORWARD_CLOSE = 0x4E
+
+## CIP general status codes
+SUCCESS = 0x00
+CONNECTION_FAILURE = 0x01
+PARTIAL_TRANSFER = 0x06
+EMBEDDED_SERVICE_ERROR = 0x1E
+
+## Common packet format item types
+NULL_ADDRESS_ITEM = 0x0000
+CONNECTED_ADDRESS_ITEM = 0x00A1
+CONNECTED_DATA_ITEM = 0x00B1
+UNCONNECTED_DATA_ITEM = 0x00B2
+
+MESSAGE_ROUTER_PATH = bytes([0x20, 0x02, 0x24, 0x01])
+CONNECTION_MANAGER_PATH = bytes([0x20, 0x06, 0x24, 0x01])
+IDENTITY_PATH = bytes([0x20, 0x01, 0x24, 0x01])
+## Logix controller object, whose attributes change whenever the program is edited or downloaded
+CONTROLLER_PATH = bytes([0x20, 0xAC, 0x24, 0x01])
+SYMBOL_CLASS = 0x6B
+
+ENCAPSULATION_HEADER = struct.Struct("<HHIIQI")
+
+## Largest unconnected message a Logix controller will accept or reply with
+UNCONNECTED_MESSAGE_SIZE = 504
+## Largest connection size a standard (not Large) Forward Open can request
+MAX_SMALL_CONNECTION_SIZE = 511
+DEFAULT_CONNECTION_SIZE = 4002
+VENDOR_ID = 0x1337
+## Reply size assumed for tags whose type has not been seen yet (matches pylogix)
+UNKNOWN_REPLY_SIZE = 88
+
+STRUCT_TYPE = 0xA0
+STRING_STRUCT_HANDLE = 0x0FCE
+LOGIX_STRING_LENGTH = 82
+
+## type code: (type name, struct format)
+ATOMIC_TYPES = {
+    0xC1: ("BOOL", "<B"),
+    0xC2: ("SINT", "<b"),
+    0xC3: ("INT", "<h"),
+    0xC4: ("DINT", "<i"),
+    0xC5: ("LINT", "<q"),
+    0xC6: ("USINT", "<B"),
+    0xC7: ("UINT", "<H"),
+    0xC8: ("UDINT", "<I"),
+    0xC9: ("LWORD", "<Q"),
+    0xCA: ("REAL", "<f"),
+    0xCB: ("LREAL", "<d"),
+    0xD1: ("BYTE", "<B"),
+    0xD2: ("WORD", "<H"),
+    0xD3: ("DWORD", "<I"),
+}
+CIP_STRING = 0xD0
+CIP_SHORT_STRING = 0xDA
+
+_TAG_PART = re.compile(r"^([^\[\]]+)(?:\[([\d,\s]+)\])?$")
+
+
+class TagType:
+    """The data type of a tag, as learnt from a read reply."""
+
+    __slots__ = ("type_code", "struct_handle", "size")
+
+    def __init__(self, type_code: int, struct_handle: Optional[int] = None, size: int = 0):
+        self.type_code = type_code
+        self.struct_handle = struct_handle
+        self.size = size
+
+    @property
+    def type_bytes(self) -> bytes:
+        if self.type_code == STRUCT_TYPE:
+            return struct.pack("<BBH", STRUCT_TYPE, 0x02, self.struct_handle or 0)
+        return struct.pack("<H", self.type_code)
+
+
+def encode_element(index: int) -> bytes:
+    if index < 0x100:
+        return struct.pack("<BB", 0x28, index)
+    if index < 0x10000:
+        return struct.pack("<BBH", 0x29, 0x00, index)
+    return struct.pack("<BBI", 0x2A, 0x00, index)
+
+
+def encode_instance(class_id: int, instance: int) -> bytes:
+    path = struct.pack("<BB", 0x20, class_id)
+    if instance < 0x100:
+        return path + struct.pack("<BB", 0x24, instance)
+    return path + struct.pack("<BBH", 0x25, 0x00, instance)
+
+
+def encode_tag_path(tag: str, instance_ids: Dict[str, int] = None) -> Tuple[bytes, Optional[int]]:
+    """
+    Encode a Logix tag name into a symbolic request path.
+
+    A trailing numeric member (eg. `MyDint.3`) addresses a single bit; the path then addresses
+    the word and the bit index is returned separately. If the symbol instance ID of the
+    controller scoped base tag is known, it is addressed by instance rather than by name.
+    """
+    parts = tag.split(".")
+    bit = None
+    if len(parts) > 1 and parts[-1].isdigit():
+        bit = int(parts.pop())
+
+    path = b""
+    for i, part in enumerate(parts):
+        match = _TAG_PART.match(part)
+        if match is None:
+            raise ValueError(f"Invalid tag name: {tag}")
+        if i == 0 and instance_ids and match.group(1) in instance_ids:
+            path += encode_instance(SYMBOL_CLASS, instance_ids[match.group(1)])
+        else:
+            name = match.group(1).encode("utf-8")
+            path += struct.pack("<BB", 0x91, len(name)) + name
+            if len(name) % 2:
+                path += b"\x00"
+        if match.group(2):
+            for index in match.group(2).split(","):
+                path += encode_element(int(index))
+    return path, bit
+
+
+def cip_request(service: int, path: bytes, data: bytes = b"") -> bytes:
+    return struct.pack("<BB", service, len(path) // 2) + path + data
+
+
+def parse_cpf_data(body: bytes) -> bytes:
+    """Return the data item of a SendRRData / SendUnitData reply (address item then data item)."""
+    ## interface handle, timeout, item count, then the address and data items
+    offset = 8
+    _, address_len = struct.unpack_from("<HH", body, offset)
+    offset += 4 + address_len
+    _, data_len = struct.unpack_from("<HH", body, offset)
+    offset += 4
+    return body[offset:offset + data_len]
+
+
+def parse_cip_reply(reply: bytes) -> Tuple[int, int, bytes]:
+    """Split a CIP reply into its service, general status and reply data."""
+    service, _, status, ext_size = struct.unpack_from("<BBBB", reply, 0)
+    return service, status, reply[4 + ext_size * 2:]
+
+
+def encode_value(tag_type: TagType, value: Any, tag: str) -> bytes:
+    if tag_type.type_code in ATOMIC_TYPES:
+        _, fmt = ATOMIC_TYPES[tag_type.type_code]
+        if tag_type.type_code == 0xC1:
+            value = 1 if value else 0
+        elif fmt in ("<f", "<d"):
+            value = float(value)
+        else:
+            value = int(value)
+        return struct.pack(fmt, value)
+    if tag_type.type_code == CIP_STRING:
+        data = str(value).encode("utf-8")
+        return struct.pack("<H", len(data)) + data + b"\x00" * (len(data) % 2)
+    if tag_type.type_code == CIP_SHORT_STRING:
+        data = str(value).encode("utf-8")
+        return struct.pack("<B", len(data)) + data
+    if tag_type.type_code == STRUCT_TYPE and tag_type.struct_handle == STRING_STRUCT_HANDLE:
+        data = str(value).encode("utf-8")[:LOGIX_STRING_LENGTH]
+        return struct.pack("<i", len(data)) + data.ljust(LOGIX_STRING_LENGTH, b"\x00")
+    raise ValueError(f"Writing to tag {tag} of type 0x{tag_type.type_code:02X} is not supported")
+
+
+def decode_value(tag_type: TagType, data: bytes) -> Any:
+    if tag_type.type_code in ATOMIC_TYPES:
+        _, fmt = ATOMIC_TYPES[tag_type.type_code]
+        size = struct.calcsize(fmt)
+        values = [v[0] for v in struct.iter_unpack(fmt, data[:len(data) - len(data) % size])]
+        if tag_type.type_code == 0xC1:
+            values = [bool(v) for v in values]
+        return values[0] if len(values) == 1 else values
+    if tag_type.type_code == CIP_STRING:
+        length = struct.unpack_from("<H", data, 0)[0]
+        return data[2:2 + length].decode("utf-8", errors="replace")
+    if tag_type.type_code == CIP_SHORT_STRING:
+        length = data[0]
+        return data[1:1 + length].decode("utf-8", errors="replace")
+    if tag_type.type_code == STRUCT_TYPE and tag_type.struct_handle == STRING_STRUCT_HANDLE:
+        length = struct.unpack_from("<i", data, 0)[0]
+        return data[4:4 + length].decode("utf-8", errors="replace")
+    return bytes(data)
+
+
+class AsyncCipClient:
+
+    def __init__(
+            self,
+            address: str,
+            port: int = 44818,
+            timeout: float = 5.0,
+            micro800: bool = False,
+            slot: int = 0,
+            max_outstanding: int = 4,
+            connected: bool = True,
+            connection_size: int = DEFAULT_CONNECTION_SIZE,
+        ):
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.micro800 = micro800
+        self.slot = slot
+        self.max_outstanding = max(1, max_outstanding)
+        self.connected = connected
+        self.connection_size = connection_size
+
+        self.known_types: Dict[str, TagType] = {}
+        ## Symbol instance IDs of controller scoped tags, from the tag metadata cache
+        self.instance_ids: Dict[str, int] = {}
+
+        self._reader: asyncio.StreamReader = None
+        self._writer: asyncio.StreamWriter = None
+        self._read_task: asyncio.Task = None
+        self._session_handle = 0
+        self._contexts = itertools.count(1)
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._outstanding: asyncio.Semaphore = None
+        self._reconnect_lock = asyncio.Lock()
+        self._generation = 0 # Incremented every time a session is opened
+        self.bytes_sent = 0 # Encapsulated bytes sent and received over every session, for metrics
+        self.bytes_received = 0
+
+        ## Connected messaging state, set once a Forward Open succeeds
+        self._ot_connection_id: Optional[int] = None
+        self._connection_serial = 0
+        self._originator_serial = random.randrange(1, 0xFFFFFFFF)
+        self._negotiated_size = 0
+        self._sequence = itertools.count(1)
+        self._pending_connected: Dict[int, asyncio.Future] = {}
+
+    @classmethod
+    def from_config(cls, plc_config: Any, max_outstanding: int = 4, address: str = None):
+        return cls(
+            address or plc_config.address.value,
+            port=plc_config.port.value,
+            timeout=plc_config.timeout.value,
+            micro800=plc_config.micro800.value,
+            max_outstanding=max_outstanding,
+            connected=get_config_value(plc_config.connected_messaging, True),
+            connection_size=get_config_value(plc_config.connection_size, DEFAULT_CONNECTION_SIZE),
+        )
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def is_open(self):
+        return self._writer is not None and self._read_task is not None and not self._read_task.done()
+
+    @property
+    def is_connected(self):
+        """Whether requests are being sent over a CIP connection rather than unconnected."""
+        return self._ot_connection_id is not None
+
+    @property
+    def message_size(self) -> int:
+        """The largest request or reply that fits in a single message."""
+        if self.is_connected:
+            ## The connected data item also carries the 2 byte sequence count
+            return self._negotiated_size - 2
+        return UNCONNECTED_MESSAGE_SIZE
+
+    async def open(self):
+        self._generation += 1
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.address, self.port), self.timeout
+        )
+        self._outstanding = asyncio.Semaphore(self.max_outstanding)
+        self._read_task = asyncio.create_task(self._read_loop())
+
+        status, session, _ = await self._transact(REGISTER_SESSION, struct.pack("<HH", 1, 0))
+        if status != 0:
+            await self.close()
+            raise ConnectionError(f"Failed to register EtherNet/IP session with {self.address}: status {status}")
+        self._session_handle = session
+
+        if self.connected:
+            await self._open_connection()
+
+    async def close(self):
+        if self._writer is not None:
+            try:
+                if self.is_connected and self.is_open:
+                    await asyncio.wait_for(self._forward_close(), self.timeout)
+            except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+                logging.debug(f"Forward Close to {self.address} failed: {e}")
+            try:
+                if self._session_handle:
+                    self._writer.write(ENCAPSULATION_HEADER.pack(UNREGISTER_SESSION, 0, self._session_handle, 0, 0, 0))
+                    await self._writer.drain()
+                self._writer.close()
+            except (ConnectionError, OSError):
+                pass
+        if self._read_task is not None:
+            self._read_task.cancel()
+        self._reader = self._writer = self._read_task = None
+        self._session_handle = 0
+        self._ot_connection_id = None
+
+    async def reconnect(self):
+        """Tear down and re-establish the session (and connection), unless another request already has."""
+        async with self._reconnect_lock:
+            if self.is_open:
+                return
+            logging.info(f"Re-establishing EtherNet/IP session with {self.address}")
+            await self.close()
+            await self.open()
+
+    ## Connection management
+    def _connection_path(self) -> bytes:
+        route = b"" if self.micro800 else struct.pack("<BB", 0x01, self.slot)
+        return route + MESSAGE_ROUTER_PATH
+
+    def _forward_open_request(self, connection_size: int) -> bytes:
+        self._connection_serial = random.randrange(1, 0xFFFF)
+        to_connection_id = random.randrange(1, 0xFFFFFFFF)
+        rpi = 0x00201234
+        if connection_size > MAX_SMALL_CONNECTION_SIZE:
+            service = LARGE_FORWARD_OPEN
+            parameters = struct.pack("<I", (0x4200 << 16) | connection_size)
+        else:
+            service = FORWARD_OPEN
+            parameters = struct.pack("<H", 0x4200 | connection_size)
+
+        path = self._connection_path()
+        data = struct.pack("<BBIIHHIB3x", 0x0A, 0x0E, 0, to_connection_id, self._connection_serial, VENDOR_ID, self._originator_serial, 0x03)
+        data += struct.pack("<I", rpi) + parameters + struct.pack("<I", rpi) + parameters
+        data += struct.pack("<BB", 0xA3, len(path) // 2) + path
+        return cip_request(service, CONNECTION_MANAGER_PATH, data)
+
+    async def _forward_open(self, connection_size: int) -> bool:
+        _, status, reply = parse_cip_reply(await self._send_unconnected(self._forward_open_request(connection_size), route=False))
+        if status != SUCCESS:
+            logging.debug(f"Forward Open of {connection_size} bytes to {self.address} refused: status 0x{status:02X}")
+            return False
+        self._ot_connection_id = struct.unpack_from("<I", reply, 0)[0]
+        self._negotiated_size = connection_size
+        return True
+
+    async def _open_connection(self):
+        sizes = [self.connection_size]
+        if self.connection_size > MAX_SMALL_CONNECTION_SIZE:
+            sizes.append(UNCONNECTED_MESSAGE_SIZE)
+        for size in sizes:
+            if await self._forward_open(size):
+                logging.info(f"Opened CIP connection to {self.address} with a connection size of {size} bytes")
+                return
+        logging.warning(f"{self.address} refused a CIP connection, falling back to unconnected messaging")
+
+    async def _forward_close(self):
+        path = self._connection_path()
+        data = struct.pack("<BBHHIBB", 0x0A, 0x0E, self._connection_serial, VENDOR_ID, self._originator_serial, len(path) // 2, 0) + path
+        self._ot_connection_id = None
+        await self._send_unconnected(cip_request(FORWARD_CLOSE, CONNECTION_MANAGER_PATH, data), route=False)
+
+    ## Transport
+    async def _read_loop(self):
+        error = ConnectionError(f"Connection to {self.address} closed")
+        try:
+            while True:
+                header = await self._reader.readexactly(ENCAPSULATION_HEADER.size)
+                command, length, session, status, context, _ = ENCAPSULATION_HEADER.unpack(header)
+                body = await self._reader.readexactly(length)
+                self.bytes_received += ENCAPSULATION_HEADER.size + length
+                if command == SEND_UNIT_DATA:
+                    ## Connected replies are matched on the sequence count echoed in the data item
+                    data = parse_cpf_data(body)
+                    future = self._pending_connected.pop(struct.unpack_from("<H", data, 0)[0], None)
+                    body = data[2:]
+                else:
+                    future = self._pending.pop(context, None)
+                if future is not None and not future.done():
+                    future.set_result((status, session, body))
+        except asyncio.CancelledError:
+            pass
+        except (asyncio.IncompleteReadError, ConnectionError, OSError) as e:
+            error = ConnectionError(f"Connection to {self.address} lost: {e}")
+        finally:
+            for pending in (self._pending, self._pending_connected):
+                for future in pending.values():
+                    if not future.done():
+                        future.set_exception(error)
+                pending.clear()
+
+    async def _transact(self, command: int, data: bytes) -> Tuple[int, int, bytes]:
+        if self._writer is None:
+            raise ConnectionError(f"Not connected to {self.address}")
+        async with self._outstanding:
+            context = next(self._contexts)
+            future = asyncio.get_running_loop().create_future()
+            self._pending[context] = future
+            self._writer.write(ENCAPSULATION_HEADER.pack(command, len(data), self._session_handle, 0, context, 0) + data)
+            self.bytes_sent += ENCAPSULATION_HEADER.size + len(data)
+            try:
+                await self._writer.drain()
+                return await asyncio.wait_for(future, self.timeout)
+            finally:
+                self._pending.pop(context, None)
+
+    async def _transact_connected(self, request: bytes) -> bytes:
+        if self._writer is None or not self.is_connected:
+            raise ConnectionError(f"No CIP connection to {self.address}")
+        async with self._outstanding:
+            sequence = next(self._sequence) & 0xFFFF
+            future = asyncio.get_running_loop().create_future()
+            self._pending_connected[sequence] = future
+            cpf = struct.pack(
+                "<IHHHHIHHH", 0, 0, 2, CONNECTED_ADDRESS_ITEM, 4, self._ot_connection_id,
+                CONNECTED_DATA_ITEM, len(request) + 2, sequence,
+            ) + request
+            self._writer.write(ENCAPSULATION_HEADER.pack(SEND_UNIT_DATA, len(cpf), self._session_handle, 0, 0, 0) + cpf)
+            self.bytes_sent += ENCAPSULATION_HEADER.size + len(cpf)
+            try:
+                await self._writer.drain()
+                status, _, reply = await asyncio.wait_for(future, self.timeout)
+            finally:
+                self._pending_connected.pop(sequence, None)
+        if status != 0:
+            ## Most likely the controller timed the connection out
+            raise ConnectionError(f"EtherNet/IP encapsulation error from {self.address}: status {status}")
+        return reply
+
+    def _route(self, request: bytes) -> bytes:
+        """Wrap a message router request in an Unconnected Send to the controller's slot."""
+        if self.micro800:
+            return request
+        data = struct.pack("<BBH", 0x0A, 0x0E, len(request)) + request
+        if len(request) % 2:
+            data += b"\x00"
+        data += struct.pack("<BBBB", 1, 0, 0x01, self.slot)
+        return cip_request(UNCONNECTED_SEND, CONNECTION_MANAGER_PATH, data)
+
+    async def _send_unconnected(self, request: bytes, route: bool = True) -> bytes:
+        message = self._route(request) if route else request
+        cpf = struct.pack("<IHHHHHH", 0, 0, 2, NULL_ADDRESS_ITEM, 0, UNCONNECTED_DATA_ITEM, len(message)) + message
+        status, _, body = await self._transact(SEND_RR_DATA, cpf)
+        if status != 0:
+            raise ConnectionError(f"EtherNet/IP encapsulation error from {self.address}: status {status}")
+        return parse_cpf_data(body)
+
+    async def send(self, request: bytes) -> bytes:
+        """
+        Send a single CIP request, returning its reply.
+
+        If the session has been lost it is re-established first, and a request that fails
+        because the connection dropped is retried once on a fresh connection.
+        """
+        for attempt in range(2):
+            if not self.is_open:
+                await self.reconnect()
+            generation = self._generation
+            try:
+                if self.is_connected:
+                    return await self._transact_connected(request)
+                return await self._send_unconnected(request)
+            except ConnectionError as e:
+                if attempt:
+                    raise
+                ## Other requests in flight fail together, only the first should tear the session down
+                if generation == self._generation and self.is_open:
+                    logging.warning(f"Lost connection to {self.address}, reconnecting: {e}")
+                    await self.close()
+
+    ## Packing
+    def _estimated_reply_size(self, tag: str) -> int:
+        tag_type = self._tag_type(tag)
+        if tag_type is None:
+            return 4 + 2 + UNKNOWN_REPLY_SIZE
+        return 4 + len(tag_type.type_bytes) + tag_type.size
+
+    def pack_requests(self, requests: List[Tuple[Any, bytes, int]]) -> List[List[Tuple[Any, bytes, int]]]:
+        """
+        Group (key, request, estimated reply size) tuples into packets that each fit within a
+        single message, both for the request and the expected reply.
+        """
+        if self.micro800:
+            ## Micro800 controllers do not support Multiple Service Packets
+            return [[item] for item in requests]
+
+        message_size = self.message_size
+        ## Unconnected requests are wrapped in an Unconnected Send to the controller's slot
+        route_overhead = 0 if self.is_connected else 16
+        packets = []
+        current = []
+        request_size = reply_size = 0
+        for item in requests:
+            _, request, reply_estimate = item
+            next_request = request_size + len(request) + 2
+            next_reply = reply_size + reply_estimate + 2
+            if current and (
+                8 + next_request + route_overhead > message_size
+                or 6 + next_reply > message_size
+            ):
+                packets.append(current)
+                current = []
+                next_request = len(request) + 2
+                next_reply = reply_estimate + 2
+            current.append(item)
+            request_size, reply_size = next_request, next_reply
+        if current:
+            packets.append(current)
+        return packets
+
+    async def send_packets(self, packets: List[List[Tuple[Any, bytes, int]]]) -> List[Any]:
+        """
+        Send packed requests concurrently, returning each packet's replies or its timeout. A
+        packet that times out is a per-tag failure, but if every packet times out the controller
+        has stopped answering, and that is raised as the connection error it is.
+        """
+        replies = await asyncio.gather(
+            *(self.send_packet([request for _, request, _ in packet]) for packet in packets),
+            return_exceptions=True,
+        )
+        if replies and all(isinstance(reply, asyncio.TimeoutError) for reply in replies):
+            raise ConnectionError(f"No reply from {self.address} within {self.timeout}s")
+        for reply in replies:
+            if isinstance(reply, BaseException) and not isinstance(reply, asyncio.TimeoutError):
+                raise reply
+        return replies
+
+    async def send_packet(self, requests: List[bytes]) -> List[Tuple[int, bytes]]:
+        """
+        Send one or more requests as a single message, using a Multiple Service Packet when there
+        is more than one. Returns the (status, reply data) of each embedded service.
+        """
+        if len(requests) == 1:
+            _, status, data = parse_cip_reply(await self.send(requests[0]))
+            return [(status, data)]
+
+        offsets = []
+        offset = 2 + 2 * len(requests)
+        for request in requests:
+            offsets.append(offset)
+            offset += len(request)
+        data = struct.pack(f"<H{len(requests)}H", len(requests), *offsets) + b"".join(requests)
+        _, status, reply = parse_cip_reply(await self.send(cip_request(MULTIPLE_SERVICE_PACKET, MESSAGE_ROUTER_PATH, data)))
+        if status not in (SUCCESS, EMBEDDED_SERVICE_ERROR):
+            return [(status, b"")] * len(requests)
+
+        count = struct.unpack_from("<H", reply, 0)[0]
+        reply_offsets = list(struct.unpack_from(f"<{count}H", reply, 2)) + [len(reply)]
+        results = []
+        for i in range(count):
+            _, service_status, service_data = parse_cip_reply(reply[reply_offsets[i]:reply_offsets[i + 1]])
+            results.append((service_status, service_data))
+        return results
+
+    ## Tag metadata
+    def _tag_type(self, tag: str) -> Optional[TagType]:
+        tag_type = self.known_types.get(tag)
+        if tag_type is None and tag != base_tag_name(tag):
+            ## An element or bit of an atomic array or integer has the type of its base tag
+            base_type = self.known_types.get(base_tag_name(tag))
+            if base_type is not None and base_type.type_code in ATOMIC_TYPES:
+                _, fmt = ATOMIC_TYPES[base_type.type_code]
+                tag_type = TagType(base_type.type_code, size=struct.calcsize(fmt))
+        return tag_type
+
+    def load_tag_metadata(self, tags: Dict[str, TagInfo]):
+        """Seed the known tag types and symbol instance IDs, eg. from the tag metadata cache."""
+        for name, info in tags.items():
+            if info.instance_id is not None:
+                self.instance_ids[name] = info.instance_id
+            if info.type_code in ATOMIC_TYPES or info.type_code in (CIP_STRING, CIP_SHORT_STRING):
+                self.known_types.setdefault(name, TagType(info.type_code, size=info.size))
+            elif info.type_code == STRUCT_TYPE and info.struct_handle is not None:
+                self.known_types.setdefault(name, TagType(info.type_code, info.struct_handle, info.size))
+
+    def tag_metadata(self) -> Dict[str, TagInfo]:
+        """The tag types learnt so far, for the tag metadata cache."""
+        return {
+            name: TagInfo(name, t.type_code, t.struct_handle, t.size, self.instance_ids.get(name))
+            for name, t in self.known_types.items()
+        }
+
+    async def probe(self):
+        """Check the connection is alive with a small request, raising ConnectionError if it is not."""
+        await self.send(cip_request(GET_ATTRIBUTES_ALL, IDENTITY_PATH))
+
+    async def controller_key(self) -> Optional[str]:
+        """Identify the controller and its current program, or None if it cannot be identified."""
+        _, status, reply = parse_cip_reply(await self.send(cip_request(GET_ATTRIBUTES_ALL, IDENTITY_PATH)))
+        if status != SUCCESS:
+            return None
+        key = parse_identity(reply)
+        ## Not every controller exposes a change counter, the identity alone still has to match
+        request = cip_request(GET_ATTRIBUTE_LIST, CONTROLLER_PATH, struct.pack("<6H", 5, 1, 2, 3, 4, 10))
+        _, status, reply = parse_cip_reply(await self.send(request))
+        if status == SUCCESS:
+            key += f":{reply.hex()}"
+        return key
+
+    async def list_tags(self) -> Dict[str, TagInfo]:
+        """Read the controller scoped tag list with Get Instance Attribute List on the symbol class."""
+        tags = {}
+        instance = 0
+        ## symbol name, symbol type and array dimensions
+        attributes = struct.pack("<4H", 3, 1, 2, 8)
+        while True:
+            request = cip_request(GET_INSTANCE_ATTRIBUTE_LIST, encode_instance(SYMBOL_CLASS, instance), attributes)
+            _, status, reply = parse_cip_reply(await self.send(request))
+            if status not in (SUCCESS, PARTIAL_TRANSFER):
+                raise ConnectionError(f"Failed to read tag list from {self.address}: status 0x{status:02X}")
+            offset = 0
+            while offset < len(reply):
+                instance, name_len = struct.unpack_from("<IH", reply, offset)
+                name = reply[offset + 6:offset + 6 + name_len].decode("utf-8", errors="replace")
+                symbol_type, dim0 = struct.unpack_from("<HI", reply, offset + 6 + name_len)
+                offset += 20 + name_len
+                ## Skip system, program and routine entries
+                if name.startswith("__") or ":" in name:
+                    continue
+                is_struct = bool(symbol_type & 0x8000)
+                is_array = bool(symbol_type & 0x6000)
+                type_code = STRUCT_TYPE if is_struct else symbol_type & 0xFF
+                size = 0
+                if type_code in ATOMIC_TYPES:
+                    size = struct.calcsize(ATOMIC_TYPES[type_code][1])
+                tags[name] = TagInfo(name, type_code, None, size, instance, dim0 if is_array else 0)
+            if status == SUCCESS:
+                return tags
+            instance += 1
+
+    ## Tag services
+    def _parse_read(self, tag: str, bit: Optional[int], status: int, data: bytes) -> Response:
+        if status != SUCCESS or len(data) < 2:
+            return Response(tag, None, status)
+        type_code = data[0]
+        if type_code == STRUCT_TYPE:
+            tag_type = TagType(type_code, struct.unpack_from("<H", data, 2)[0], len(data) - 4)
+            value_data = data[4:]
+        else:
+            tag_type = TagType(type_code, size=len(data) - 2)
+            value_data = data[2:]
+        self.known_types[tag] = tag_type
+        value = decode_value(tag_type, value_data)
+        if bit is not None:
+            value = bool((int(value) >> bit) & 1)
+        return Response(tag, value, SUCCESS)
+
+    async def _read_fragmented(self, tag: str, bit: Optional[int], path: bytes, data: bytes) -> Response:
+        """Finish reading a tag too large for one reply with Read Tag Fragmented, from where the first reply stopped."""
+        header_size = 4 if data[:1] == bytes([STRUCT_TYPE]) else 2
+        if len(data) < header_size:
+            return Response(tag, None, PARTIAL_TRANSFER)
+        header, value = data[:header_size], bytearray(data[header_size:])
+        while True:
+            request = cip_request(READ_TAG_FRAGMENTED, path, struct.pack("<HI", 1, len(value)))
+            _, status, reply = parse_cip_reply(await self.send(request))
+            if status not in (SUCCESS, PARTIAL_TRANSFER):
+                return Response(tag, None, status)
+            fragment = reply[header_size:]
+            value += fragment
+            if status == SUCCESS:
+                return self._parse_read(tag, bit, SUCCESS, header + bytes(value))
+            if not fragment:
+                ## Never report a truncated value as read
+                return Response(tag, None, PARTIAL_TRANSFER)
+
+    async def read_tags(self, tags: List[str]) -> Dict[str, Response]:
+        results = {}
+        requests = []
+        for tag in tags:
+            try:
+                path, bit = encode_tag_path(tag, self.instance_ids)
+            except ValueError as e:
+                results[tag] = Response(tag, None, str(e))
+                continue
+            request = cip_request(READ_TAG, path, struct.pack("<H", 1))
+            requests.append(((tag, bit, path), request, self._estimated_reply_size(tag)))
+
+        packets = self.pack_requests(requests)
+        replies = await self.send_packets(packets)
+        fragmented = []
+        for packet, reply in zip(packets, replies):
+            if isinstance(reply, asyncio.TimeoutError):
+                for (tag, _, _), _, _ in packet:
+                    results[tag] = Response(tag, None, CONNECTION_FAILURE)
+                continue
+            for ((tag, bit, path), _, _), (status, data) in zip(packet, reply):
+                if status == PARTIAL_TRANSFER:
+                    fragmented.append((tag, bit, path, data))
+                else:
+                    results[tag] = self._parse_read(tag, bit, status, data)
+
+        ## Tags larger than a reply come back partial, read the rest of each in fragments
+        responses = await asyncio.gather(*(self._read_fragmented(*item) for item in fragmented))
+        for response in responses:
+            results[response.TagName] = response
+        return results
+
+    async def read(self, read_plan: Any) -> Dict[str, Response]:
+        return await self.read_tags(read_plan.tags)
+
+    def _write_request(self, tag: str, value: Any) -> bytes:
+        path, bit = encode_tag_path(tag, self.instance_ids)
+        tag_type = self._tag_type(tag)
+        if tag_type is None:
+            raise ValueError("Unable to determine tag data type")
+
+        if bit is not None:
+            _, fmt = ATOMIC_TYPES[tag_type.type_code]
+            if fmt in ("<f", "<d"):
+                raise ValueError(f"Cannot address a bit of {tag}, it is not an integer tag")
+            size = struct.calcsize(fmt)
+            full_mask = (1 << (size * 8)) - 1
+            or_mask = (1 << bit) if value else 0
+            and_mask = full_mask if value else full_mask & ~(1 << bit)
+            data = struct.pack("<H", size) + or_mask.to_bytes(size, "little") + and_mask.to_bytes(size, "little")
+            return cip_request(READ_MODIFY_WRITE_TAG, path, data)
+
+        values = value if isinstance(value, (list, tuple)) else [value]
+        data = tag_type.type_bytes + struct.pack("<H", len(values))
+        data += b"".join(encode_value(tag_type, v, tag) for v in values)
+        return cip_request(WRITE_TAG, path, data)
+
+    async def write_tags(self, values: Dict[str, Any]) -> Dict[str, Response]:
+        ## Learn the data type of any tag we have not seen yet, in one batched read
+        unknown = [tag for tag in values if self._tag_type(tag) is None]
+        if unknown:
+            await self.read_tags(unknown)
+
+        results = {}
+        requests = []
+        for tag, value in values.items():
+            try:
+                request = self._write_request(tag, value)
+            except (ValueError, KeyError, struct.error) as e:
+                results[tag] = Response(tag, value, str(e))
+                continue
+            ## A write reply is only the 4 byte reply header
+            requests.append((tag, request, 4))
+
+        packets = self.pack_requests(requests)
+        replies = await self.send_packets(packets)
+        for packet, reply in zip(packets, replies):
+            if isinstance(reply, asyncio.TimeoutError):
+                reply = [(CONNECTION_FAILURE, b"")] * len(packet)
+            for (tag, _, _), (status, _) in zip(packet, reply):
+                results[tag] = Response(tag, values[tag], status)
+        return results
+
+    async def write_tag(self, tag: str, value: Any) -> Response:
+        results = await self.write_tags({tag: value})
+        return results[tag]
+
+    async def write(self, write_plan: Any) -> Dict[str, Response]:
+        return await self.write_tags(write_plan.values)
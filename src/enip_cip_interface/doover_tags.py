@@ -0,0 +1,134 @@
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Set, Tuple
+
+"""
+Doover tag lookups and channel message building by tag path.
+
+A Doover tag is addressed by a path of keys into the tag_values channel, written as a single name
+with the path separated by the configured tag namespace separator (eg. `my_app__pump__speed`).
+The first key is the app key, or a global tag if the path has only one key.
+
+Lookups are served from a `TagSnapshot`, a local copy of the tag_values aggregate kept current
+from the channel subscription. It indexes every path in the aggregate, so a lookup is one
+dictionary access, and it counts versions, so a sync task can tell which paths have changed since
+its last cycle and skip the mappings whose values have not.
+
+Used by the application and by the stand-in application of PLC worker processes. Classes using
+it provide `config.tag_namespace_separator` and a `tag_snapshot`.
+"""
+
+TagPath = Tuple[str, ...]
+
+
+def _index_paths(value: Any, prefix: TagPath, index: Dict[TagPath, Any]):
+    for key, child in value.items():
+        path = prefix + (key,)
+        index[path] = child
+        if isinstance(child, dict):
+            _index_paths(child, path, index)
+
+
+def _same_value(value1: Any, value2: Any) -> bool:
+    ## True == 1 in Python, but a tag changing type is still a change
+    return type(value1) is type(value2) and value1 == value2
+
+
+def _merged(values: Dict[str, Any], update: Dict[str, Any]) -> Dict[str, Any]:
+    ## Copies the dicts on the way down, the snapshot's values may be held elsewhere
+    result = dict(values)
+    for key, value in update.items():
+        if isinstance(value, dict) and isinstance(result.get(key), dict):
+            value = _merged(result[key], value)
+        result[key] = value
+    return result
+
+
+class TagSnapshot:
+    """A local copy of the tag_values aggregate, indexed by tag path and versioned."""
+
+    def __init__(self, history: int = 64):
+        self.values: Dict[str, Any] = {}
+        self.index: Dict[TagPath, Any] = {} # Every path in the aggregate, including those of nested dicts
+        self.version = 0 # Incremented by every update that changes a value
+        self._history: Deque[Tuple[int, Set[TagPath]]] = deque(maxlen=history) # (version, paths changed by it)
+
+    def get(self, tag_path: Iterable[str], default: Any = None) -> Any:
+        return self.index.get(tuple(tag_path), default)
+
+    def update(self, tag_values: Dict[str, Any]) -> Set[TagPath]:
+        """Replace the snapshot with a new aggregate, returning the paths whose values changed"""
+        index = {}
+        if isinstance(tag_values, dict):
+            _index_paths(tag_values, (), index)
+
+        ## Compare the leaves, a changed leaf changes every dict above it too
+        previous = self.index
+        changed = set()
+        for path, value in index.items():
+            if isinstance(value, dict):
+                if path in previous and not isinstance(previous[path], dict):
+                    changed.add(path)
+            elif path not in previous or not _same_value(previous[path], value):
+                changed.add(path)
+        changed.update(path for path in previous if path not in index)
+        for path in list(changed):
+            for i in range(1, len(path)):
+                changed.add(path[:i])
+
+        self.values = tag_values if isinstance(tag_values, dict) else {}
+        self.index = index
+        if changed:
+            self.version += 1
+            self._history.append((self.version, changed))
+        return changed
+
+    def merge(self, tag_values: Dict[str, Any]) -> Set[TagPath]:
+        """Merge a partial update, as published to the channel, into the snapshot"""
+        return self.update(_merged(self.values, tag_values))
+
+    def changed_since(self, version: int) -> Optional[Set[TagPath]]:
+        """The paths changed after a version, or None if the snapshot no longer remembers that far back"""
+        if version == self.version:
+            return set()
+        if not self._history or self._history[0][0] > version + 1 or version > self.version:
+            return None
+        changed = set()
+        for update_version, paths in self._history:
+            if update_version > version:
+                changed.update(paths)
+        return changed
+
+
+class DooverTagAccess:
+
+    def to_channel_message(self, enip_tag_name: str, enip_tag_value: Any):
+        delimiter = self.config.tag_namespace_separator.value
+        return self.path_to_channel_message(enip_tag_name.split(delimiter), enip_tag_value)
+
+    def path_to_channel_message(self, tag_path: tuple[str, ...], enip_tag_value: Any):
+        # Compose a nested dictionary, from the innermost key outwards
+        result = enip_tag_value
+        for key in reversed(tag_path):
+            result = {key: result}
+        return result
+
+    def paths_to_channel_message(self, values: Iterable[tuple[tuple[str, ...], Any]]):
+        """Build a single nested message from (tag path, value) pairs. A later value for the same tag wins."""
+        result = {}
+        for tag_path, value in values:
+            node = result
+            for key in tag_path[:-1]:
+                child = node.get(key)
+                if not isinstance(child, dict):
+                    child = node[key] = {}
+                node = child
+            node[tag_path[-1]] = value
+        return result
+    
+    def retreive_doover_tag_value(self, delimited_tag_name: str):
+        delimiter = self.config.tag_namespace_separator.value
+        return self.retreive_doover_path_value(delimited_tag_name.split(delimiter))
+
+    def retreive_doover_path_value(self, tag_path: tuple[str, ...]):
+        """The value at a tag path, or None if there is nothing there"""
+        return self.tag_snapshot.get(tag_path)
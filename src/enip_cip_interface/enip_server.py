@@ -3,32 +3,103 @@ import random
 import sys
 import logging
 import asyncio
+import itertools
+import socket
+import struct
+import threading
 import traceback
-from typing import List, Any, Dict
+from typing import List, Any, Dict, Iterable, Tuple
 
-from multiprocessing import Process, Manager, Event, Lock
+from multiprocessing import Process, Lock, Pipe, Queue
+from multiprocessing.connection import Connection
 
 import cpppo
-from cpppo.server.enip import device
+from cpppo.server.enip import device, logix, parser
 from cpppo.server.enip.main import tags, main as enip_main
 
+from .metrics import REGISTRY
+from .tag_table import FLOAT_TYPES, INTEGER_TYPES, SPARE_SIZE, TagTable, split_tag_type
+from .telemetry import ClientTable
+
 """
 Ethernet/IP Server For Doover
 Based on cpppo server example:
 https://github.com/pjkundert/cpppo/blob/master/server/enip/simulator_example.py
 
 This implementation uses:
-1. A cpppo server that runs in a separate process (cpppo)
-2. Shared memory for communication between the main process and the server process
-3. External clients (like pylogix) can connect to read/write tags
+1. A cpppo server that runs in one or more separate processes (cpppo), or on a thread in the application's process
+2. A typed tag table in shared memory holding the tag values, read and written by both processes
+3. A control queue into the server process, so tags can be added and removed while it keeps running
+4. Fixed size request counters per tag and per client, in shared memory
+5. A pipe carrying client writes back to the main process, watched by its event loop
+6. External clients (like pylogix) can connect to read/write tags
+
+Tags added at runtime are laid out in the spare space of the tag table, or the slots of removed
+tags, and are registered with the running cpppo server without disturbing connected clients. A
+new segment of the table is only created once the existing ones are full.
+
+Running the server on a thread saves starting a second interpreter and its memory, which suits
+small deployments on constrained devices, at the cost of sharing the GIL with the application.
+cpppo keeps its objects in module globals, so only one server can run on a thread per process.
+
+With many clients polling at once, parsing CIP keeps a single server process busy. The server can
+run as several worker processes instead, each listening on the same port with SO_REUSEPORT so the
+kernel spreads client connections between them. Every worker maps the same tag table and sends
+client writes down the same pipe, so the main process sees one stream of writes. UDP cannot be
+shared in the same way, so only the first worker answers UDP List Identity requests.
 """
 
+## Loggers used by cpppo, quietened without touching the application's own logging in thread mode
+CPPPO_LOGGERS = ("cpppo", "enip", "network", "parser")
+
+## Seconds to wait for a server process to stop before terminating it
+STOP_TIMEOUT = 5.0
+
+## An EtherNet/IP List Identity request, sent to wake cpppo's UDP thread so it notices it has been stopped
+LIST_IDENTITY_REQUEST = struct.pack("<HHII8sI", 0x63, 0, 0, 0, bytes(8), 0)
+
+SERVER_RESTARTS = REGISTRY.counter("enip_server_restarts_total", "Times the ENIP server has been restarted after stopping")
+SERVER_TAGS = REGISTRY.gauge("enip_server_tags", "Tags registered with the ENIP server")
+CLIENT_WRITES = REGISTRY.counter("enip_server_client_writes_total", "Tag writes from ENIP clients received by the main process")
+
+## cpppo parser class and default value for each tag type the tag table can hold
+TAG_PARSERS = {
+    "BOOL": (parser.BOOL, 0),
+    "SINT": (parser.SINT, 0),
+    "INT": (parser.INT, 0),
+    "DINT": (parser.DINT, 0),
+    "LINT": (parser.LINT, 0),
+    "REAL": (parser.REAL, 0.0),
+    "LREAL": (parser.LREAL, 0.0),
+    "STRING": (parser.STRING, ''),
+}
+
+def diff_tag_values(previous: Dict[str, Any], current: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """
+    Compare two {tag name: value} snapshots, returning the new or changed values and the names
+    of the tags that have gone. A value that changes type (eg. True to 1) counts as changed.
+    """
+    changed = {
+        name: value for name, value in current.items()
+        if name not in previous or type(previous[name]) is not type(value) or previous[name] != value
+    }
+    removed = [name for name in previous if name not in current]
+    return changed, removed
+
+
 class EnipTag:
+    __slots__ = ("name", "_tag_type", "_inferred_type", "_default_value", "_current_value")
+
     def __init__(self, name: str, current_value: Any = None, default_value: str = None, tag_type: str = None):
+        """
+        The tag's type is inferred from its value unless `tag_type` is given, which sets the type
+        of a scalar tag or the element type of an array tag (eg. `LREAL`).
+        """
         self.name = name
         self._tag_type = tag_type
+        self._inferred_type = None
         self._default_value = default_value or 0.0
-        self._current_value = current_value
+        self.current_value = current_value
 
     def has_changed(self, compare: Any, exclude_values: bool = True):
         if not isinstance(compare, EnipTag):
@@ -50,20 +121,58 @@ class EnipTag:
 
     @property
     def tag_type(self):
-        return self.get_tag_type(self.current_value)
+        if self._tag_type is None:
+            return self._inferred_type
+        if isinstance(self.current_value, list):
+            return f"{self._tag_type}[{len(self.current_value)}]"
+        return self._tag_type
 
     @staticmethod
     def get_tag_type(value: Any):
         if isinstance(value, bool):
             return "BOOL"
-        elif isinstance(value, float) or isinstance(value, int):
+        elif isinstance(value, int):
+            if -2**31 <= value < 2**31:
+                return "DINT"
+            return "LINT" if -2**63 <= value < 2**63 else "LREAL"
+        elif isinstance(value, float):
             return "REAL"
-        if isinstance(value, list):
-            inner_type = EnipTag.get_tag_type(value[0])
-            return f"{inner_type}[{len(value)}]"
+        if isinstance(value, list) and value:
+            return f"{EnipTag.get_element_type(value)}[{len(value)}]"
         else:
             return "STRING"
 
+    @staticmethod
+    def get_element_type(values: List[Any]):
+        """The narrowest type that can hold every element of a list"""
+        types = {EnipTag.get_tag_type(v) for v in values}
+        if len(types) == 1:
+            return types.pop()
+        if not types <= {"BOOL", *INTEGER_TYPES, *FLOAT_TYPES}:
+            return "STRING"
+        if types & set(FLOAT_TYPES):
+            return "LREAL" if "LREAL" in types else "REAL"
+        return max(types - {"BOOL"}, key=INTEGER_TYPES.index)
+
+    @staticmethod
+    def widen_tag_type(current_type: str, new_type: str):
+        """
+        The type a tag should have for a new value, keeping its current type while that can hold
+        the value. A REAL tag given a whole number stays REAL, and a LINT tag stays LINT, so a tag
+        is not re-registered with clients every time a value's type flips.
+        """
+        if current_type is None:
+            return new_type
+        current_base, current_count = split_tag_type(current_type)
+        new_base, new_count = split_tag_type(new_type)
+        if current_count != new_count or current_base == new_base:
+            return new_type
+        if current_base in FLOAT_TYPES and new_base in INTEGER_TYPES:
+            return current_type
+        if current_base in INTEGER_TYPES and new_base in INTEGER_TYPES:
+            return current_type if INTEGER_TYPES.index(current_base) > INTEGER_TYPES.index(new_base) else new_type
+        return new_type
+
     @property
     def cppp0_arg(self):
         return f"{self.name}={self.tag_type}"
@@ -83,6 +192,8 @@ class EnipTag:
     @current_value.setter
     def current_value(self, value: Any):
         self._current_value = value
+        if self._tag_type is None:
+            self._inferred_type = self.widen_tag_type(self._inferred_type, self.get_tag_type(self.current_value))
 
     def to_dict(self):
         return {
@@ -99,11 +210,6 @@ class EnipTag:
     def __repr__(self):
         return f"{self.name} ({self.tag_type}) {self.current_value}"
 
-class EnipReadOp:
-    def __init__(self, tag: str, timestamp: float):
-        self.tag_name: str = tag
-        self.timestamp: float = timestamp
-
 class EnipWriteOp:
     def __init__(self, tag: str, value: Any, timestamp: float):
         self.tag_name: str = tag
@@ -112,20 +218,42 @@ class EnipWriteOp:
 
 class EnipServer:
 
-    def __init__(self, port: int = 44818, tags: List[EnipTag] = None, cpppo_log_level: int = logging.WARNING):
+    def __init__(
+            self,
+            port: int = 44818,
+            tags: List[EnipTag] = None,
+            cpppo_log_level: int = logging.WARNING,
+            tag_type_overrides: Dict[str, str] = None,
+            run_in_thread: bool = False,
+            workers: int = 1,
+        ):
         self.port = port
+        self.run_in_thread = run_in_thread
+        if run_in_thread and workers > 1:
+            logging.warning(f"The ENIP server can only run one worker on a thread, ignoring {workers} workers")
+            workers = 1
+        self.workers = max(1, workers)
+        self.tag_type_overrides = tag_type_overrides or {} # Explicit types for tags added later, by name
 
         self.tags: Dict[str, EnipTag] = {tag.name: tag for tag in tags}
-        self._prev_tags = tags
         
         # Shared state for the cpppo server which is run in a separate process
         self._process_lock = Lock()
-        self._process = None
-        self._manager = Manager()
-        self._shared_tags = self._manager.dict()
-        self._read_operations = self._manager.list()
-        self._write_operations = self._manager.list()
-        self._write_received = self._manager.Event()
+        self._processes: List[Process | threading.Thread] = [] # Each worker's Process, or a Thread if running in this process
+        self._server_control = None # cpppo's server control, used to stop a server running on a thread
+        self._table_lock = None
+        self._segments: List[TagTable] = []
+        self._tag_segments: Dict[str, TagTable] = {}
+        self._registered_types: Dict[str, str] = {} # The type each tag is registered with in the server
+        self._controls: List[Queue] = [] # Tag changes for each worker
+        self._clients: List[ClientTable] = [] # Request counts for each worker's clients
+        self._writes: Connection = None # Receiving end of the pipe client writes are sent down
+        self._writes_lock = None # Held by a worker while it sends down the write pipe
+        self._pending_writes: List[EnipWriteOp] = []
+        self._write_received = asyncio.Event()
+        self._write_loop: asyncio.AbstractEventLoop = None # The loop watching the write pipe
+        self._last_totals = None # (time, reads, writes) when request rates were last sampled
+        self.create_shared_memory()
         
         self.cpppo_log_level = cpppo_log_level # Logging level for cpppo, it is very verbose
         # Remove pylogix client - we don't need it since we control the server directly
@@ -135,128 +263,295 @@ class EnipServer:
     # Remove the open_client method since we don't need the pylogix client
 
     def write_tags(self, values: Dict[str, Any]):
-        """Update tag values directly in shared memory - no need for external client"""
+        """Update tag values directly in the shared tag table - no need for external client"""
         for k, v in values.items():
             if k not in self.tags.keys():
                 raise ValueError(f"Tag {k} not found")
             ## Update the current value for the tag
             self.tags[k].current_value = v
 
-        self._maybe_restart()
+        self._update_server_tags(values.keys())
         # Sync the updated values to shared memory for the cpppo server
-        self._sync_shared_tags()
+        self._write_values(values)
+
+    def update_tags(self, values: Dict[str, Any], removed: Iterable[str] = ()):
+        """
+        Apply a delta to the tags: set the values of new or changed tags and drop removed ones.
+        Only the given tags are touched, so the cost follows the size of the delta.
+        """
+        removed = list(removed)
+        for name in removed:
+            self.tags.pop(name, None)
+        for name, value in values.items():
+            tag = self.tags.get(name)
+            if tag is None:
+                self.tags[name] = EnipTag(name, current_value=value, tag_type=self.tag_type_overrides.get(name))
+            else:
+                tag.current_value = value
+
+        self._update_server_tags(list(values) + removed)
+        self._write_values(values)
+
+    def read_tag(self, name: str) -> Any:
+        """Read a tag's current value from the shared tag table, including any writes from ENIP clients"""
+        return self._tag_segments[name].read(name)
 
     def set_tags(self, tags: List[EnipTag]):
         self.tags = {tag.name: tag for tag in tags}
-        self._maybe_restart()
+        self._update_server_tags()
 
     def add_tag(self, tag: EnipTag):
         logging.info(f"Adding tag: {tag.name}")
         self.tags[tag.name] = tag
-        self._maybe_restart()
+        self._update_server_tags()
+
+    def tag_stats(self, name: str) -> Dict[str, Any]:
+        """Client read and write counts for a tag, and when it was last read and written"""
+        return self._tag_segments[name].stats(name)
+
+    def client_stats(self) -> List[Dict[str, Any]]:
+        """Request counts for each client seen recently, most recent first"""
+        clients = [client for table in self._clients for client in table.clients()]
+        return sorted(clients, key=lambda c: c["last_seen"], reverse=True)
+
+    def request_rates(self) -> Tuple[float, float]:
+        """Client tag reads and writes per second since this was last called"""
+        now = time.time()
+        totals = [table.totals() for table in self._clients]
+        reads, writes = sum(t[0] for t in totals), sum(t[1] for t in totals)
+        last_totals, self._last_totals = self._last_totals, (now, reads, writes)
+        if last_totals is None or now <= last_totals[0]:
+            return 0.0, 0.0
+        last_ts, last_reads, last_writes = last_totals
+        ## The counts start again from zero if the server is restarted
+        return max(reads - last_reads, 0) / (now - last_ts), max(writes - last_writes, 0) / (now - last_ts)
 
-    def pop_read_operations(self) -> List[EnipReadOp]:
-        result = [EnipReadOp(**op) for op in self._read_operations]
-        self._read_operations[:] = []  # Clear the list safely
-        return result
-    
     def pop_write_operations(self) -> List[EnipWriteOp]:
-        result = [EnipWriteOp(**op) for op in self._write_operations]
+        self._receive_writes()
+        result, self._pending_writes = self._pending_writes, []
         self._write_received.clear()
-        self._write_operations[:] = []  # Clear the list safely
         return result
     
     async def await_write_received(self):
-        while not self._write_received.is_set():
-            await asyncio.sleep(0.2)
+        loop = asyncio.get_running_loop()
+        if self._write_loop is not loop:
+            self._watch_writes(loop)
+        while not self._pending_writes:
+            self._write_received.clear()
+            await self._write_received.wait()
+
+    def _watch_writes(self, loop: asyncio.AbstractEventLoop):
+        """Have the event loop wake whenever the server process sends a write"""
+        self._unwatch_writes()
+        self._write_loop = loop
+        if self._writes is not None:
+            loop.add_reader(self._writes.fileno(), self._receive_writes)
+
+    def _unwatch_writes(self):
+        if self._write_loop is not None and self._writes is not None:
+            self._write_loop.remove_reader(self._writes.fileno())
+
+    def _receive_writes(self):
+        if self._writes is None:
+            return
+        already_pending = len(self._pending_writes)
+        try:
+            while self._writes.poll():
+                self._pending_writes.append(EnipWriteOp(*self._writes.recv()))
+        except (EOFError, OSError):
+            ## Every server process has gone, stop watching until they are restarted
+            self._unwatch_writes()
+            self._writes.close()
+            self._writes = None
+        if self._pending_writes:
+            CLIENT_WRITES.inc(len(self._pending_writes) - already_pending)
+            self._write_received.set()
 
     def create_shared_memory(self):
-        self._manager = Manager()
-        self._shared_tags = self._manager.dict()
-        self._read_operations = self._manager.list()
-        self._write_operations = self._manager.list()
-        self._write_received = self._manager.Event()
-
-    def _is_shared_memory_valid(self):
-        """Check if shared memory objects are still valid"""
-        try:
-            # Try to access the shared objects to see if they're still valid
-            _ = len(self._shared_tags)
-            _ = len(self._read_operations)
-            _ = len(self._write_operations)
-            return True
-        except Exception:
-            return False
+        self._unwatch_writes()
+        if self._writes is not None:
+            self._writes.close()
+        self._writes, self._server_writes = Pipe(duplex=False)
+        self._writes_lock = Lock()
+        if self._write_loop is not None:
+            self._watch_writes(self._write_loop)
+        self._controls = [Queue() for _ in range(self.workers)]
+        for table in self._clients:
+            table.close()
+        self._clients = [ClientTable() for _ in range(self.workers)]
+        self._create_tag_table()
+
+    def _create_tag_table(self):
+        """Lay out a fresh tag table holding every current tag, for a new server process"""
+        self._close_tag_table()
+        self._table_lock = Lock()
+        table = TagTable({name: tag.tag_type for name, tag in self.tags.items()}, lock=self._table_lock, spare=SPARE_SIZE)
+        self._segments = [table]
+        self._tag_segments = {name: table for name in table.tag_types}
+        self._registered_types = dict(table.tag_types)
+        SERVER_TAGS.set(len(self._registered_types))
+
+    def _close_tag_table(self):
+        for segment in self._segments:
+            segment.close()
+        self._segments = []
+        self._tag_segments = {}
+        self._registered_types = {}
+
+    def _has_server_died(self):
+        return any(not process.is_alive() for process in self._processes)
+
+    def _send_control(self, command: str, payload: Any):
+        for control in self._controls:
+            control.put((command, payload))
 
     def _sync_shared_tags(self):
-        if not self._is_shared_memory_valid():
+        self._write_values({k: v.current_value for k, v in self.tags.items()})
+
+    def _write_values(self, values: Dict[str, Any]):
+        if self._has_server_died():
             self.restart_server()
 
-        for k, v in self.tags.items():
-            self._shared_tags[k] = v.to_dict()
+        for k, v in values.items():
+            self._tag_segments[k].write(k, v)
 
-    def _have_tags_changed(self):
-        result = False
-        if len(self.tags) != len(self._prev_tags):
-            result = True
-        else:
-            for k, v in self.tags.items():
-                if k not in self._prev_tags:
-                    result = True
-                    break
-                if v.has_changed(self._prev_tags[k]):
-                    result = True
-                    break
-        self._prev_tags = self.tags.copy()
-        return result
-    
-    def _maybe_restart(self):
-        if not self._have_tags_changed():
+    def _update_server_tags(self, names: Iterable[str] = None):
+        """
+        Register new tags, and retire removed ones, in the running server without restarting it.
+        Only the named tags are checked if given, otherwise every tag is.
+        """
+        if names is None:
+            names = set(self.tags) | set(self._registered_types)
+        tag_types = {name: self.tags[name].tag_type for name in names if name in self.tags}
+        ## A tag whose type changed is retired and registered again with its new type
+        removed = [
+            name for name in names
+            if name in self._registered_types and tag_types.get(name) != self._registered_types[name]
+        ]
+        added = {name: tag_type for name, tag_type in tag_types.items() if self._registered_types.get(name) != tag_type}
+        if not removed and not added:
             return
-        self.restart_server()
+
+        with self._process_lock:
+            if removed:
+                self._send_control("remove", removed)
+                for name in removed:
+                    del self._registered_types[name]
+                    self._tag_segments.pop(name).remove([name])
+                self._close_retired_segments()
+
+            if added:
+                ## Fill the existing segments before mapping another one into every server process
+                segment = next((s for s in self._segments if s.fits(added)), None)
+                if segment is None:
+                    segment = TagTable({}, lock=self._table_lock, spare=max(TagTable.size_of(added), SPARE_SIZE))
+                    self._segments.append(segment)
+                offsets = segment.add(added)
+                for name in added:
+                    segment.write(name, self.tags[name].current_value)
+                self._tag_segments.update({name: segment for name in added})
+                self._registered_types.update(added)
+                self._send_control("add", (added, segment.name, offsets))
+
+        SERVER_TAGS.set(len(self._registered_types))
+        logging.info(f"Updated ENIP server tags: {len(added)} added, {len(removed)} removed")
+
+    def _close_retired_segments(self):
+        for segment in [s for s in self._segments if not len(s)]:
+            ## The server processes keep their own mapping of the segment until they retire the tags too
+            segment.close()
+            self._segments.remove(segment)
 
     def restart_server(self):
-        self.create_shared_memory()
-        logging.warning("RESTARTING CPPPO SERVER FOR NEW TAGS")
+        logging.warning("CPPPO SERVER HAS STOPPED, RESTARTING")
+        SERVER_RESTARTS.inc()
         with self._process_lock:
             self.stop()
+            self.create_shared_memory()
             self.start()
 
     def start(self):
+        if not self._segments:
+            self._create_tag_table()
         self._sync_shared_tags()
-        self._process = Process(
-            target=self.main,
-            args=(
-                self._shared_tags,
-                self._read_operations,
-                self._write_operations,
-                self._write_received,
-                self.port,
-                self.cpppo_log_level
+        tag_table_args = [segment.attach_args() for segment in self._segments]
+        if self.run_in_thread:
+            self._server_control = cpppo.dotdict({"control": cpppo.dotdict()})
+            process = threading.Thread(
+                target=self.main,
+                args=(tag_table_args, self._controls[0], self._clients[0].name, self._server_writes, self._writes_lock, self.port, self.cpppo_log_level),
+                kwargs={"in_thread": True, "server": self._server_control},
+                name="enip-server",
+                daemon=True,
             )
-        )
-        self._process.daemon = True
-        self._process.start()
+            process.start()
+            self._processes = [process]
+            return
+
+        for worker_id in range(self.workers):
+            process = Process(
+                target=self.main,
+                args=(tag_table_args, self._controls[worker_id], self._clients[worker_id].name, self._server_writes, self._writes_lock, self.port, self.cpppo_log_level),
+                ## Only one worker can bind the UDP port
+                kwargs={"udp": worker_id == 0},
+                name=f"enip-server-{worker_id}",
+            )
+            process.daemon = True
+            process.start()
+            self._processes.append(process)
+        ## Only the server processes write to the pipe, so the main process sees it close if they all die
+        self._server_writes.close()
 
     def stop(self):
-        if self._process is not None:
-            self._process.terminate()
-            self._process = None
+        if self._processes:
+            ## Each worker's control thread tells its server it is done, so the worker exits cleanly
+            self._send_control("stop", None)
+            if self.run_in_thread:
+                self._server_control["control"]["done"] = True
+            ## cpppo's UDP thread only checks for done once a packet arrives
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.sendto(LIST_IDENTITY_REQUEST, ("127.0.0.1", self.port))
+            if self.run_in_thread:
+                self._processes[0].join(timeout=5)
+                self._server_writes.close()
+            else:
+                for process, control in zip(self._processes, self._controls):
+                    process.join(timeout=STOP_TIMEOUT)
+                    if process.is_alive():
+                        logging.warning(f"ENIP server {process.name} did not stop, terminating it")
+                        process.terminate()
+                        process.join()
+                    if process.exitcode != 0:
+                        ## Nothing is left to read the worker's queue, so don't wait to flush it
+                        control.cancel_join_thread()
+                    process.close()
+            self._processes = []
+        for control in self._controls:
+            control.close()
+            control.join_thread()
+        self._controls = []
+        self._close_tag_table()
+        for table in self._clients:
+            table.close()
+        self._clients = []
 
     @staticmethod
     def main(
-            tags_dict: Dict[str, Any],
-            read_operations: List[str],
-            write_operations: List[str],
-            write_received: Event,
+            tag_table_args: List[tuple],
+            control: Queue,
+            clients_name: str,
+            writes: Connection,
+            writes_lock: Any,
             port: int = 44818,
             cpppo_log_level: int = logging.WARNING,
+            in_thread: bool = False,
+            udp: bool = True,
             argv=None,
             idle_service=None,
             **kwargs
         ):
         """
-        The main function for the cpppo server that is run in a separate process.
+        The main function for a cpppo server worker that is run in a separate process, or on a thread.
         More info here:
         https://github.com/pjkundert/cpppo/blob/master/server/enip/main.py
         """
@@ -265,39 +560,49 @@ class EnipServer:
             argv = []
         
         argv.append(f"--address=0.0.0.0:{port}")
+        if not udp:
+            argv.append("--no-udp")
 
-        ## For each tag, get add them to the argv
-        for name, tag in tags_dict.items():
-            argv.append(tag['cpppo_arg'])
+        ## Attach to the tag table segments shared with the main process
+        segments = [TagTable(*args) for args in tag_table_args]
+        table_lock = segments[0].lock
+        tag_segments = {name: segment for segment in segments for name in segment.tag_types}
+        clients = ClientTable(clients_name)
+        ## The client record of the request being handled on each server thread
+        current = threading.local()
 
         # Configure logging for this process - Cpppo is very verbose, so we need to set the level to WARNING
-        cpppo.log_cfg['level'] = cpppo_log_level
-        logging.getLogger().setLevel(cpppo_log_level)
-
-        # Create a custom attribute class that has access to the tags
+        if in_thread:
+            for name in CPPPO_LOGGERS:
+                logging.getLogger(name).setLevel(cpppo_log_level)
+        else:
+            cpppo.log_cfg['level'] = cpppo_log_level
+            logging.getLogger().setLevel(cpppo_log_level)
+        ## Start from an empty cpppo object registry, in case a previous server ran on a thread of
+        ## this process, or of the process this worker was forked from
+        device.lookup_reset()
+        logix.setup_reset()
+
+        # Create a custom attribute class that reads and writes the shared tag table
         class TaggedAttribute(device.Attribute):
             def __init__(self, name, type_cls, default=0, error=0, mask=0):
                 super().__init__(name, type_cls, default, error, mask)
 
-            @property
-            def enip_tag(self):
-                return tags_dict.get(self.name)
-
-            @property
-            def __current_value(self):
-                if not self.enip_tag:
-                    return None
-                return self.enip_tag.get("current_value")
-
             def __setitem__(self, key, value):
                 """Override to catch write operations"""
                 try:
-                    if isinstance(value, list):
-                        value_to_write = value[0]
-                    if self.enip_tag and value_to_write != self.__current_value:
-                        self.enip_tag["current_value"] = value_to_write
-                        write_operations.append({"tag": self.name, "value": value_to_write, "timestamp": time.time()})
-                        write_received.set()
+                    table = tag_segments.get(self.name)
+                    client_slot = getattr(current, "slot", None)
+                    if table is not None and client_slot is not None:
+                        table.count_write(self.name, time.time())
+                        clients.count_write(client_slot)
+                    ## Other workers can be writing other elements of the same tag, so patch it under the table lock
+                    if table is not None and table.write_elements(self.name, key, value):
+                        ## Forward the value as stored, converted to the tag's type
+                        value_written = table.read(self.name)
+                        ## Server threads, and other workers, share the sending end of the write pipe
+                        with writes_lock:
+                            writes.send((self.name, value_written, time.time()))
                 except Exception as e:
                     print(f"Error setting item {key}: {e}")
                     traceback.print_exc()
@@ -306,15 +611,98 @@ class EnipServer:
             def __getitem__(self, key):
                 """Override to catch read operations"""
                 try:
-                    if self.enip_tag:
-                        read_operations.append({"tag": self.name, "timestamp": time.time()})
-                        return [self.__current_value]
+                    table = tag_segments.get(self.name)
+                    if table is not None:
+                        client_slot = getattr(current, "slot", None)
+                        if client_slot is not None:
+                            table.count_read(self.name, time.time())
+                            clients.count_read(client_slot)
+                        return table.read_elements(self.name)[key]
                 except Exception as e:
                     print(f"Error getting item {key}: {e}")
                     traceback.print_exc()
                 result = super().__getitem__(key)
                 return result
 
+        ## Create the Logix objects, then number the tag attributes ourselves. Left to pick the next
+        ## free attribute, cpppo sorts every existing one for each new tag.
+        logix.setup()
+        router = device.lookup(0x02, 1)
+        attribute_ids = itertools.count(max(int(a) for a in router.attribute) + 1)
+
+        def register_tag(name: str, tag_type: str):
+            """Create the tag's attribute and register it with the Logix message router"""
+            base_type, count = split_tag_type(tag_type)
+            type_cls, default = TAG_PARSERS[base_type]
+            tag_entry = cpppo.dotdict()
+            tag_entry.attribute = TaggedAttribute(name, type_cls, default=default if count is None else [default] * count)
+            tag_entry.path = {"segment": [{"class": 0x02}, {"instance": 1}, {"attribute": next(attribute_ids)}]}
+            tag_entry.error = 0x00
+            logix.setup(tags={name: tag_entry})
+
+        def retire_tag(name: str):
+            with logix.setup.lock:
+                address = device.resolve_tag(name)
+                if address is None:
+                    return
+                cls, ins, att = address
+                device.symbol.pop(device.canonicalize_tag(name), None)
+                instance = device.lookup(cls, ins)
+                if instance is not None:
+                    instance.attribute.pop(str(att), None)
+
+        ## cpppo's own server control is built on multiprocessing locks, which leak if the worker is
+        ## killed, so give it a plain one that the control thread can stop the server through
+        server = kwargs.setdefault("server", cpppo.dotdict({"control": cpppo.dotdict()}))
+
+        def handle_control():
+            """Apply tag changes sent from the main process while the server keeps running"""
+            while True:
+                command, payload = control.get()
+                if command == "stop":
+                    server["control"]["done"] = True
+                    break
+                try:
+                    if command == "add":
+                        tag_types, name, offsets = payload
+                        segment = next((s for s in segments if s.name == name), None)
+                        if segment is None:
+                            segment = TagTable({}, name, table_lock)
+                            segments.append(segment)
+                        segment.add(tag_types, offsets)
+                        for tag_name, tag_type in tag_types.items():
+                            tag_segments[tag_name] = segment
+                            register_tag(tag_name, tag_type)
+                    elif command == "remove":
+                        for tag_name in payload:
+                            segment = tag_segments.pop(tag_name, None)
+                            if segment is not None:
+                                segment.remove([tag_name])
+                            retire_tag(tag_name)
+                        for segment in [s for s in segments if not len(s)]:
+                            try:
+                                segment.close()
+                                segments.remove(segment)
+                            except BufferError:
+                                pass # Still being read, try again on the next removal
+                except Exception as e:
+                    print(f"Error handling tag update {command}: {e}")
+                    traceback.print_exc()
+
+        ## Register the tags up front rather than passing them in the argv. cpppo re-checks every
+        ## tag in its argv on each request, which gets slow with many tags.
+        for name, segment in tag_segments.items():
+            register_tag(name, segment.tag_types[name])
+        threading.Thread(target=handle_control, name="enip-tag-control", daemon=True).start()
+
+        def enip_process(addr, data, **kwds):
+            """Count each request against its client, then process it as usual"""
+            now = time.time()
+            current.slot = clients.client_slot(addr, now)
+            if data:
+                clients.count_request(current.slot, now)
+            return logix.process(addr, data, **kwds)
+
         def idle_init():
             """Initialize the tags with their current values after the server starts"""
             if idle_init.complete:
@@ -324,7 +712,7 @@ class EnipServer:
         idle_init.complete = False
 
         print(f"Starting cpppo server with args: {argv}")
-        return enip_main( argv=argv, attribute_class=TaggedAttribute, idle_service=idle_init, **kwargs )
+        return enip_main( argv=argv, attribute_class=TaggedAttribute, idle_service=idle_init, enip_process=enip_process, **kwargs )
 
 
 if __name__ == "__main__":
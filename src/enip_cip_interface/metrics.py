@@ -0,0 +1,242 @@
+import asyncio
+import bisect
+import logging
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+"""
+Metrics for the sync engine and ENIP server.
+
+Metrics are declared once, at module level, in the process wide `REGISTRY`. A metric can have
+labels (eg. the PLC name), with each combination of label values holding its own value:
+
+    CYCLE_SECONDS = REGISTRY.histogram("plc_sync_cycle_seconds", "Time taken by each PLC sync cycle", ("plc",))
+    CYCLE_SECONDS.labels("pump-station").observe(0.012)
+
+Updating a metric is a dictionary lookup and an addition, cheap enough for every request on the
+hot paths. Metrics are only updated from the event loop, so they are not locked. Histograms count
+into fixed buckets, so their size never grows with the number of observations.
+
+A registry's `snapshot()` is plain data, so PLC worker processes can send theirs to the main
+process, which serves every snapshot in the Prometheus text format and can publish a compact form
+of them to a channel.
+"""
+
+## Bucket upper bounds in seconds, from 1 ms to 10 s
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Gauge:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+    def snapshot(self):
+        return self.value
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last bucket counts values above every bound
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        return list(self.counts), self.sum, self.count
+
+
+METRIC_TYPES = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+class MetricFamily:
+
+    def __init__(self, name: str, help: str, kind: str, label_names: Tuple[str, ...] = (), buckets: Tuple[float, ...] = None):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) if buckets is not None else None
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: Any):
+        """The metric for the given label values, created the first time they are used"""
+        key = tuple(map(str, values))
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.label_names):
+                raise ValueError(f"Metric {self.name} has labels {self.label_names}, got {values}")
+            child = self._children[key] = Histogram(self.buckets) if self.kind == "histogram" else METRIC_TYPES[self.kind]()
+        return child
+
+    ## Unlabelled metrics can be updated directly
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def snapshot(self) -> tuple:
+        samples = [(key, child.snapshot()) for key, child in self._children.items()]
+        return self.name, self.kind, self.help, self.label_names, self.buckets, samples
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._families: Dict[str, MetricFamily] = {}
+
+    def _register(self, name: str, help: str, kind: str, labels: Iterable[str], buckets: Tuple[float, ...] = None) -> MetricFamily:
+        family = self._families.get(name)
+        if family is not None:
+            if family.kind != kind:
+                raise ValueError(f"Metric {name} is already registered as a {family.kind}")
+            return family
+        family = self._families[name] = MetricFamily(name, help, kind, tuple(labels), buckets)
+        return family
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> MetricFamily:
+        return self._register(name, help, "counter", labels)
+
+    def gauge(self, name: str, help: str, labels: Iterable[str] = ()) -> MetricFamily:
+        return self._register(name, help, "gauge", labels)
+
+    def histogram(self, name: str, help: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> MetricFamily:
+        return self._register(name, help, "histogram", labels, buckets)
+
+    def snapshot(self) -> List[tuple]:
+        """Every metric's current value, as plain data that can be sent between processes"""
+        return [family.snapshot() for family in self._families.values()]
+
+
+REGISTRY = MetricsRegistry()
+
+
+def _merge(snapshots: Iterable[List[tuple]]) -> Dict[str, tuple]:
+    """Combine snapshots from several processes, keeping each metric's samples from all of them"""
+    merged = {}
+    for snapshot in snapshots:
+        for name, kind, help, label_names, buckets, samples in snapshot:
+            if name in merged:
+                merged[name][5].extend(samples)
+            else:
+                merged[name] = (name, kind, help, label_names, buckets, list(samples))
+    return merged
+
+
+def _format_labels(label_names: Tuple[str, ...], values: Tuple[str, ...], extra: str = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(label_names, values)]
+    if extra is not None:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def render_prometheus(snapshots: Iterable[List[tuple]]) -> str:
+    """Render registry snapshots in the Prometheus text exposition format"""
+    lines = []
+    for name, kind, help, label_names, buckets, samples in _merge(snapshots).values():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for values, value in samples:
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(label_names, values)} {_format_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{name}_bucket{_format_labels(label_names, values, le)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(label_names, values)} {_format_value(total)}")
+            lines.append(f"{name}_count{_format_labels(label_names, values)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def compact_metrics(snapshots: Iterable[List[tuple]]) -> Dict[str, Any]:
+    """
+    A compact form of registry snapshots for publishing to a channel: {metric: {labels: value}},
+    where the labels are the label values joined by commas. Histograms are summarised as their
+    count and mean.
+    """
+    result = {}
+    for name, kind, _, _, _, samples in _merge(snapshots).values():
+        values = {}
+        for label_values, value in samples:
+            if kind == "histogram":
+                _, total, count = value
+                value = {"count": count, "mean": total / count if count else 0.0}
+            values[",".join(label_values)] = value
+        if values:
+            result[name] = values
+    return result
+
+
+async def start_metrics_server(port: int, collect: Callable[[], Iterable[List[tuple]]], host: str = "0.0.0.0") -> asyncio.AbstractServer:
+    """Serve the metrics from `collect()` in the Prometheus text format on GET /metrics"""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            ## Skip the request headers
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] in ("/", "/metrics"):
+                status, body = "200 OK", render_prometheus(collect()).encode("utf-8")
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode("latin-1")
+                + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except Exception as e:
+            logging.error(f"Error serving metrics: {e}")
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+    return server
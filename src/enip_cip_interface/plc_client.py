@@ -0,0 +1,158 @@
+import asyncio
+import functools
+import logging
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from pylogix import PLC
+from pylogix.lgx_response import Response
+
+from .app_config import get_config_value
+from .cip_client import ATOMIC_TYPES, DEFAULT_CONNECTION_SIZE, STRUCT_TYPE
+from .tag_cache import TagInfo, base_tag_name, parse_identity
+
+"""
+Awaitable PLC client for the sync engine.
+
+pylogix is entirely blocking, so every PLC connection gets its own single worker thread.
+All calls on the underlying `PLC` object are made on that thread, which keeps pylogix
+single-threaded per connection while the asyncio event loop stays free to service other
+PLCs, channel subscriptions and the ENIP server.
+"""
+
+class PlcClient:
+
+    def __init__(self, plc_config: Any, name: str, address: str = None):
+        self.plc_config = plc_config
+        self.name = name
+        self.address = address or plc_config.address.value
+
+        self._comm: PLC = None
+        self._executor: ThreadPoolExecutor = None
+
+    async def __aenter__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"plc-{self.name}")
+        try:
+            await self._call(self._open)
+        except BaseException:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        try:
+            await self._call(self._close)
+        except Exception as e:
+            logging.warning(f"Error closing PLC connection for {self.name}: {e}")
+        finally:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _call(self, func: Callable, *args):
+        if self._executor is None:
+            raise RuntimeError(f"PLC client for {self.name} is not open")
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    ## Worker thread functions
+    def _open(self):
+        comm = PLC()
+        comm.IPAddress = self.address
+        comm.Port = self.plc_config.port.value
+        comm.Micro800 = self.plc_config.micro800.value
+        comm.SocketTimeout = self.plc_config.timeout.value
+        ## pylogix always reads and writes over a CIP connection, re-opening it if it is lost.
+        ## Left unset it tries a Large Forward Open of 4002 bytes and falls back to 504, so only
+        ## override the size when a different one is configured.
+        connection_size = get_config_value(self.plc_config.connection_size, DEFAULT_CONNECTION_SIZE)
+        if connection_size != DEFAULT_CONNECTION_SIZE:
+            comm.ConnectionSize = connection_size
+        try:
+            comm.UserTag = self.plc_config.username.value
+            comm.PasswordTag = self.plc_config.password.value
+        except Exception as e:
+            logging.warning(f"Failed to set UserTag/PasswordTag for {self.name}: {e}")
+        self._comm = comm
+
+    def _close(self):
+        if self._comm is not None:
+            self._comm.Close()
+            self._comm = None
+
+    def _check_connected(self, results: Dict[str, Response]) -> Dict[str, Response]:
+        """pylogix reports a lost connection as a failure of every tag, raise it as the connection error it is"""
+        if results and not self._comm.conn.SocketConnected:
+            statuses = sorted({str(r.Status) for r in results.values()})
+            raise ConnectionError(f"Lost connection to {self.address}: {', '.join(statuses)}")
+        return results
+
+    def _probe(self):
+        ## Get Attributes All of the Identity object, which every controller answers
+        response = self._comm.Message(0x01, 0x01, 0x01)
+        if not self._comm.conn.SocketConnected:
+            raise ConnectionError(f"No connection to {self.address}: {response.Status}")
+
+    def _controller_key(self) -> Optional[str]:
+        ## Get Attributes All of the Identity object, the CIP reply data starts after the 44 byte header
+        response = self._comm.Message(0x01, 0x01, 0x01)
+        if response.Status != "Success" or not response.Value:
+            return None
+        key = parse_identity(response.Value[44:])
+        response = self._comm.Message(0x03, 0xAC, 0x01, [1, 2, 3, 4, 10])
+        if response.Status == "Success" and response.Value:
+            key += f":{response.Value[44:].hex()}"
+        return key
+
+    def _list_tags(self) -> Dict[str, TagInfo]:
+        try:
+            response = self._comm.GetTagList(allTags=False)
+        except struct.error as e:
+            ## pylogix fails to parse the reply when the controller ends the session rather than answer,
+            ## so close the connection for the next request to open a new one
+            self._comm.Close()
+            raise ConnectionError(f"Failed to read tag list from {self.name}: {e}") from e
+        if response.Status != "Success":
+            raise ConnectionError(f"Failed to read tag list from {self.name}: {response.Status}")
+        tags = {}
+        for tag in response.Value or []:
+            if ":" in tag.TagName:
+                continue
+            type_code = STRUCT_TYPE if tag.Struct else tag.SymbolType
+            size = 0
+            if type_code in ATOMIC_TYPES:
+                size = struct.calcsize(ATOMIC_TYPES[type_code][1])
+            tags[tag.TagName] = TagInfo(tag.TagName, type_code, None, size, tag.InstanceID, tag.Size)
+        return tags
+
+    ## Awaitable interface
+    async def read(self, read_plan: Any) -> Dict[str, Response]:
+        return self._check_connected(await self._call(read_plan.execute, self._comm))
+
+    async def write(self, write_plan: Any) -> Dict[str, Response]:
+        return self._check_connected(await self._call(write_plan.execute, self._comm))
+
+    async def probe(self):
+        """Check the connection is alive with a small request, raising ConnectionError if it is not."""
+        await self._call(self._probe)
+
+    async def controller_key(self) -> Optional[str]:
+        return await self._call(self._controller_key)
+
+    async def list_tags(self) -> Dict[str, TagInfo]:
+        return await self._call(self._list_tags)
+
+    def load_tag_metadata(self, tags: Dict[str, TagInfo]):
+        """Seed pylogix's known tag types, eg. from the tag metadata cache."""
+        for name, info in tags.items():
+            ## pylogix needs the reply size of structures, which the tag list does not give
+            if info.type_code in ATOMIC_TYPES or info.size:
+                self._comm.KnownTags.setdefault(base_tag_name(name), (info.type_code, info.size))
+
+    def tag_metadata(self) -> Dict[str, TagInfo]:
+        """The tag types learnt so far, for the tag metadata cache."""
+        return {
+            name: TagInfo(name, type_code, None, size)
+            for name, (type_code, size) in dict(self._comm.KnownTags).items()
+        }
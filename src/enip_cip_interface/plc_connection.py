@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Callable, List
+
+from .metrics import REGISTRY
+
+"""
+Connection management for a PLC sync task.
+
+Reconnecting straight away after every failure turns a flapping link into a storm of EtherNet/IP
+sessions being registered and torn down. A `PlcConnection` keeps one client open for as long as
+it works, and paces reconnection:
+
+- After a failure the next attempt goes to the next address, so a PLC with a secondary address
+  (eg. the partner chassis of a redundant ControlLogix pair) is tried there straight away.
+- Once every address has failed in turn, attempts back off exponentially with jitter, up to the
+  maximum reconnect delay. The backoff resets after a successful sync cycle.
+- While waiting for the next sync cycle the connection is probed with a small identity request
+  whenever it has been idle for the health check period, so a dead link is found and recovered
+  before the cycle that needs it rather than by it.
+
+Only connection level errors are handled here. Tags that fail to read or write are reported per
+tag by the sync task and never cost the connection.
+"""
+
+## Errors that mean the connection to the PLC has failed, rather than a request or a tag
+CONNECTION_ERRORS = (ConnectionError, OSError, asyncio.TimeoutError)
+
+CONNECTS = REGISTRY.counter("plc_connects_total", "Connections opened to each PLC address", ("plc", "address"))
+CONNECTION_FAILURES = REGISTRY.counter("plc_connection_failures_total", "Failed or lost connections to each PLC address", ("plc", "address"))
+FAILOVERS = REGISTRY.counter("plc_failovers_total", "Times a PLC connection moved to another address after a failure", ("plc",))
+PROBES = REGISTRY.counter("plc_health_probes_total", "Health probes sent to each PLC while its connection was idle", ("plc",))
+CONNECTED = REGISTRY.gauge("plc_connected", "Whether a PLC address has an open connection", ("plc", "address"))
+
+
+class Backoff:
+    """Exponential backoff with jitter. Each delay is between half and all of the current ceiling."""
+
+    def __init__(self, initial: float, maximum: float):
+        self.initial = max(initial, 0.001)
+        self.maximum = max(maximum, self.initial)
+        self.attempts = 0
+
+    def next_delay(self) -> float:
+        ceiling = min(self.maximum, self.initial * 2 ** min(self.attempts, 32))
+        self.attempts += 1
+        return random.uniform(ceiling / 2, ceiling)
+
+    def reset(self):
+        self.attempts = 0
+
+
+class PlcConnection:
+
+    def __init__(
+            self,
+            plc_name: str,
+            addresses: List[str],
+            create_client: Callable[[str], Any],
+            reconnect_delay: float = 0.5,
+            max_reconnect_delay: float = 30.0,
+            health_check_period: float = 5.0,
+        ):
+        self.plc_name = plc_name
+        self.addresses = addresses
+        self.create_client = create_client # Creates an unopened client for an address
+        self.backoff = Backoff(reconnect_delay, max_reconnect_delay)
+        self.health_check_period = health_check_period
+
+        self.client = None
+        self.address_index = 0
+        self.failures = 0 # Failed attempts since the last successful sync cycle
+        self.last_active = 0.0 # Monotonic time the connection last did something successfully
+
+    @property
+    def address(self) -> str:
+        return self.addresses[self.address_index]
+
+    async def connect(self):
+        """The open client, connecting (and reconnecting as often as it takes) if there is none."""
+        while self.client is None:
+            ## Try every address in turn before backing off
+            if self.failures and self.failures % len(self.addresses) == 0:
+                delay = self.backoff.next_delay()
+                logging.info(f"{self.plc_name} PLC TASK: Reconnecting to {self.address} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+            client = self.create_client(self.address)
+            try:
+                await client.__aenter__()
+            except CONNECTION_ERRORS as e:
+                self._failed(e)
+                continue
+            try:
+                ## Some clients only connect on their first request, so make one
+                await client.probe()
+            except CONNECTION_ERRORS as e:
+                await self._close_client(client)
+                self._failed(e)
+                continue
+
+            logging.info(f"{self.plc_name} PLC TASK: Connected to {self.address}")
+            CONNECTS.labels(self.plc_name, self.address).inc()
+            CONNECTED.labels(self.plc_name, self.address).set(1)
+            self.client = client
+            self.last_active = time.monotonic()
+        return self.client
+
+    def healthy(self):
+        """Record a successful sync cycle, resetting the backoff"""
+        self.failures = 0
+        self.backoff.reset()
+        self.last_active = time.monotonic()
+
+    async def connection_lost(self, error: Exception):
+        await self.close()
+        self._failed(error)
+
+    def _failed(self, error: Exception):
+        logging.warning(f"{self.plc_name} PLC TASK: Connection to {self.address} failed: {error}")
+        CONNECTION_FAILURES.labels(self.plc_name, self.address).inc()
+        self.failures += 1
+        if len(self.addresses) > 1:
+            self.address_index = (self.address_index + 1) % len(self.addresses)
+            FAILOVERS.labels(self.plc_name).inc()
+            logging.info(f"{self.plc_name} PLC TASK: Failing over to {self.address}")
+
+    async def idle_until(self, deadline: float):
+        """Wait until a monotonic deadline, probing the connection whenever it has been idle for the health check period"""
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            wake = deadline
+            if self.health_check_period > 0 and self.client is not None:
+                probe_due = self.last_active + self.health_check_period
+                if probe_due <= now:
+                    PROBES.labels(self.plc_name).inc()
+                    await self.client.probe()
+                    self.last_active = time.monotonic()
+                    continue
+                wake = min(wake, probe_due)
+            await asyncio.sleep(wake - now)
+
+    async def close(self):
+        client, self.client = self.client, None
+        if client is not None:
+            CONNECTED.labels(self.plc_name, self.address).set(0)
+            await self._close_client(client)
+
+    async def _close_client(self, client: Any):
+        try:
+            await client.__aexit__(None, None, None)
+        except Exception as e:
+            logging.debug(f"{self.plc_name} PLC TASK: Error closing connection to {self.address}: {e}")
@@ -1,10 +1,115 @@
 import asyncio
 import logging
-from typing import Any, Dict
+from collections import deque
+from typing import Any, Deque, Dict, List, Tuple
 import time
 
-from enip_cip_interface.app_config import EnipTagSyncMode
+from enip_cip_interface.app_config import PlcClientBackend, get_config_value
+from enip_cip_interface.cip_client import AsyncCipClient
+from enip_cip_interface.metrics import REGISTRY
+from enip_cip_interface.plc_client import PlcClient
+from enip_cip_interface.plc_connection import CONNECTION_ERRORS, PlcConnection
+from enip_cip_interface.scheduler import MultiRateScheduler, RateClass
+from enip_cip_interface.sync_plan import MappingGroup, SyncPlan, TagMapping
+from enip_cip_interface.tag_cache import TagMetadataCache
 from pylogix import PLC
+from pylogix.lgx_response import Response
+
+CYCLE_SECONDS = REGISTRY.histogram("plc_sync_cycle_seconds", "Time taken by each PLC sync cycle", ("plc",))
+BATCH_SECONDS = REGISTRY.histogram("plc_batch_seconds", "Time taken by the batch of reads or writes to each PLC in a sync cycle, from the first request sent to the last reply", ("plc", "operation"))
+TAG_ERRORS = REGISTRY.counter("plc_tag_errors_total", "Tags a PLC failed to read or write", ("plc", "operation"))
+SYNC_ERRORS = REGISTRY.counter("plc_sync_errors_total", "Sync cycles that failed with an error other than losing the connection", ("plc",))
+LATENESS_SECONDS = REGISTRY.histogram("plc_sync_lateness_seconds", "How late each poll class's sync cycle started after its deadline", ("plc", "period"))
+JITTER_SECONDS = REGISTRY.histogram("plc_sync_jitter_seconds", "How far the time between a poll class's sync cycles strayed from its period", ("plc", "period"))
+OVERRUNS = REGISTRY.counter("plc_sync_overruns_total", "Sync cycles that finished after the poll class's next deadline", ("plc", "period"))
+MISSED_DEADLINES = REGISTRY.counter("plc_sync_missed_deadlines_total", "Poll class deadlines that passed while a sync cycle overran", ("plc", "period"))
+WIRE_BYTES = REGISTRY.counter("plc_bytes_total", "Bytes sent to and received from each PLC, by the native asyncio client", ("plc", "direction"))
+
+## PLC config that only takes effect when the connection is reopened
+CONNECTION_SETTINGS = (
+    "address", "secondary_address", "port", "micro800", "username", "password", "timeout", "client",
+    "max_outstanding_requests", "connected_messaging", "connection_size",
+    "reconnect_delay", "max_reconnect_delay", "health_check_period",
+)
+
+class ReadPlan:
+    """
+    The set of PLC tags to read in a single sync cycle.
+
+    Tags are de-duplicated and read with a single call to `PLC.Read`, which packs them into
+    as few Multiple Service Packet requests as the negotiated connection size allows.
+    Results are scattered back by tag name so each mapping can look up its own value.
+    """
+
+    def __init__(self, plc_tags: List[str] = None):
+        self.tags: List[str] = []
+        self._seen = set()
+        for tag in plc_tags or []:
+            self.add(tag)
+
+    def add(self, plc_tag: str):
+        if plc_tag is None or plc_tag in self._seen:
+            return
+        self._seen.add(plc_tag)
+        self.tags.append(plc_tag)
+
+    def __len__(self):
+        return len(self.tags)
+
+    def execute(self, comm: PLC) -> Dict[str, Response]:
+        if not self.tags:
+            return {}
+        responses = comm.Read(self.tags)
+        if isinstance(responses, Response):
+            responses = [responses]
+
+        results = {}
+        for tag, response in zip(self.tags, responses):
+            results[tag] = response
+        ## pylogix stops at the first packet that gets no reply, so fill in whatever was not answered
+        for tag in self.tags[len(results):]:
+            results[tag] = Response(tag, None, "No response from PLC")
+        return results
+
+
+class WritePlan:
+    """
+    The set of PLC tag writes to make at the end of a single sync cycle.
+
+    Writes are collected while the mappings are evaluated and sent together, packed into
+    Multiple Service Packet requests. If a tag is written more than once, the last value wins.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, Any] = {}
+        self.agreed_tags = set()
+
+    def add(self, plc_tag: str, value: Any, agreed: bool = False):
+        if plc_tag is None or value is None:
+            return
+        self.values[plc_tag] = value
+        if agreed:
+            self.agreed_tags.add(plc_tag)
+
+    def __len__(self):
+        return len(self.values)
+
+    def execute(self, comm: PLC) -> Dict[str, Response]:
+        if not self.values:
+            return {}
+        items = list(self.values.items())
+        if comm.Micro800:
+            ## Micro800 controllers do not support multi-service writes
+            responses = [comm.Write(tag, value) for tag, value in items]
+        else:
+            responses = comm.Write(items)
+
+        results = {}
+        for (tag, _), response in zip(items, responses):
+            results[tag] = response
+        for tag, value in items[len(results):]:
+            results[tag] = Response(tag, value, "No response from PLC")
+        return results
 
 
 class PlcSyncTask:
@@ -14,9 +119,25 @@ class PlcSyncTask:
         self.plc_config = plc_config
 
         self._task = None
-        self.task_run_times = {} # A dict of the timestamp and the time in seconds the task took to run
+        self.task_run_times: Deque[Tuple[float, float]] = deque(maxlen=10) # The timestamp and the time in seconds of the last cycles
 
         self.last_sync_agreed_values = {}
+        self.last_written_values = {} # PLC tag -> (value, timestamp) of the last acknowledged write
+        self.last_reported_values = {} # Doover tag -> (value, timestamp) of the last value queued for publishing
+        self.pending_publish = {} # Doover tag -> (doover path, value), held until the next publish
+        self.last_publish_time = 0
+        self.doover_versions: Dict[float, int] = {} # Poll period -> tag snapshot version its write only mappings are written up to
+
+        self.plan: SyncPlan = None
+        self.read_plan: ReadPlan = None
+        self.read_plans: Dict[Tuple[float, ...], ReadPlan] = {} # Merged read plans for each set of co-due rate classes
+        self.scheduler: MultiRateScheduler = None
+        self._last_overrun_log: Dict[float, float] = {}
+        self.tag_cache: TagMetadataCache = None
+        self._wire_bytes_counted = (0, 0) # Bytes (sent, received) by the current client already added to the metrics
+        self.connection: PlcConnection = None
+        self.plan_changed = False # Set when a config update changes the tag mappings or their timing
+        self.connection_changed = False # Set when a config update changes the connection settings
 
     @property
     def plc_name(self):
@@ -37,140 +158,378 @@ class PlcSyncTask:
 
     @property
     def average_task_time(self):
-        if not self.task_run_times or len(self.task_run_times) == 0:
+        if not self.task_run_times:
             return 0
-        return sum(self.task_run_times.values()) / len(self.task_run_times)
+        return sum(duration for _, duration in self.task_run_times) / len(self.task_run_times)
 
     @property
     def sync_speed_hz(self):
         if not self.task_run_times:
             return 0
-        timestamps = list(self.task_run_times.keys())
-        timestamps.sort()
-        dt = timestamps[-1] - timestamps[0]
+        dt = self.task_run_times[-1][0] - self.task_run_times[0][0]
         if dt == 0:
             return 0
-        return len(timestamps) / dt
+        return len(self.task_run_times) / dt
 
-    async def _run(self):
-        sync_period_secs = self.plc_config.sync_period.value
+    @property
+    def tag_namespace_separator(self):
+        return get_config_value(self.app.config.tag_namespace_separator, "__")
+
+    @staticmethod
+    def connection_signature(plc_config: Any) -> tuple:
+        return tuple(get_config_value(getattr(plc_config, name)) for name in CONNECTION_SETTINGS)
+
+    def update_config(self, plc_config: Any):
+        """
+        Swap in a new PLC config. If the tag mappings changed the sync plan is recompiled before
+        the next cycle, and if the connection settings changed the connection is reopened.
+        """
+        if self.connection_signature(plc_config) != self.connection_signature(self.plc_config):
+            self.connection_changed = True
+        self.plc_config = plc_config
+        if self.plan is not None and self.plan.signature != SyncPlan.config_signature(plc_config, self.tag_namespace_separator):
+            self.plan_changed = True
+
+    def refresh_plan(self):
+        """Compile the tag mappings into a sync plan, unless the config is unchanged since the last compile."""
+        separator = self.tag_namespace_separator
+        self.plan_changed = False
+        if self.plan is not None and self.plan.signature == SyncPlan.config_signature(self.plc_config, separator):
+            return self.plan
+        self.plan = SyncPlan(self.plc_config, separator)
+        self.doover_versions = {}
+        self.read_plan = ReadPlan(self.plan.read_tags)
+        self.read_plans = {tuple(self.plan.rate_groups): self.read_plan}
+        self.scheduler = MultiRateScheduler(self.plan.rate_groups, time.monotonic(), self.plan.overrun_policy)
+        logging.info(f"{self.plc_name} PLC TASK: Compiled sync plan with {len(self.plan)} tag mappings, reading {len(self.read_plan)} tags at {len(self.plan.rate_groups)} poll rates")
+        return self.plan
+
+    def get_read_plan(self, periods: Tuple[float, ...]) -> ReadPlan:
+        """The merged read plan for a set of co-due rate classes, built once per combination."""
+        read_plan = self.read_plans.get(periods)
+        if read_plan is None:
+            read_plan = ReadPlan()
+            for period in periods:
+                for plc_tag in self.plan.rate_groups[period].read_tags:
+                    read_plan.add(plc_tag)
+            self.read_plans[periods] = read_plan
+        return read_plan
 
+    @property
+    def rate_class_stats(self):
+        """Timing and overrun statistics for each poll period."""
+        if self.scheduler is None:
+            return {}
+        return self.scheduler.stats()
+
+    def record_timing(self, ran: List[RateClass], overran: List[RateClass]):
+        """Add the timing of the rate classes just run to the metrics"""
+        plc_name = self.plc_name
+        for rc in ran:
+            LATENESS_SECONDS.labels(plc_name, rc.period).observe(rc.last_lateness)
+            if rc.last_jitter is not None:
+                JITTER_SECONDS.labels(plc_name, rc.period).observe(rc.last_jitter)
+        for rc in overran:
+            OVERRUNS.labels(plc_name, rc.period).inc()
+            MISSED_DEADLINES.labels(plc_name, rc.period).inc(rc.last_missed)
+
+    def log_overruns(self, overran: List[RateClass], now: float):
+        for rc in overran:
+            ## At most one warning a minute per rate class, the counters carry the full picture
+            if now - self._last_overrun_log.get(rc.period, -60) >= 60:
+                self._last_overrun_log[rc.period] = now
+                logging.warning(
+                    f"{self.plc_name} PLC TASK: {rc.period}s poll class overran, took {rc.last_duration:.3f}s. "
+                    f"{rc.overruns} overruns, {rc.missed} missed deadlines, {rc.skipped} skipped cycles in {rc.runs} runs"
+                )
+
+    async def load_tag_cache(self, client: PlcClient | AsyncCipClient):
+        """Seed the client with cached tag metadata, rebuilding the cache if the controller or program has changed."""
+        if self.tag_cache is None:
+            directory = get_config_value(self.app.config.tag_cache_directory)
+            self.tag_cache = TagMetadataCache.for_plc(directory, self.plc_name)
+            if self.tag_cache is None:
+                return
+
+        ## The cache is only an optimisation, never let discovery problems stop the sync
+        try:
+            controller_key = await client.controller_key()
+        except Exception as e:
+            logging.warning(f"{self.plc_name} PLC TASK: Failed to identify controller, not using the tag metadata cache: {e}")
+            return
+
+        if self.tag_cache.load(controller_key) and len(self.tag_cache):
+            logging.info(f"{self.plc_name} PLC TASK: Loaded {len(self.tag_cache)} tags from the tag metadata cache")
+        elif controller_key is not None:
+            try:
+                self.tag_cache.merge(await client.list_tags())
+                logging.info(f"{self.plc_name} PLC TASK: Read {len(self.tag_cache)} tags from the controller tag list")
+            except Exception as e:
+                logging.info(f"{self.plc_name} PLC TASK: Controller tag list unavailable, tag types will be learnt from reads: {e}")
+            self.tag_cache.save()
+        client.load_tag_metadata(self.tag_cache.tags)
+
+    def save_tag_cache(self, client: PlcClient | AsyncCipClient):
+        if self.tag_cache is not None and self.tag_cache.merge(client.tag_metadata()):
+            self.tag_cache.save()
+
+    def create_client(self, address: str = None):
+        backend = get_config_value(self.plc_config.client)
+        if backend == PlcClientBackend.ASYNCIO:
+            max_outstanding = get_config_value(self.plc_config.max_outstanding_requests)
+            return AsyncCipClient.from_config(self.plc_config, max_outstanding=max_outstanding, address=address)
+        return PlcClient(self.plc_config, self.plc_name, address=address)
+
+    def create_connection(self) -> PlcConnection:
+        addresses = [self.plc_config.address.value]
+        secondary = get_config_value(self.plc_config.secondary_address)
+        if secondary and secondary not in addresses:
+            addresses.append(secondary)
+        return PlcConnection(
+            self.plc_name,
+            addresses,
+            self.create_client,
+            reconnect_delay=get_config_value(self.plc_config.reconnect_delay, 0.5),
+            max_reconnect_delay=get_config_value(self.plc_config.max_reconnect_delay, 30.0),
+            health_check_period=get_config_value(self.plc_config.health_check_period, 5.0),
+        )
+
+    async def _run(self):
         logging.info(f"Starting PLC sync task for {self.plc_name}: {self.plc_config.address.value}:{self.plc_config.port.value}. With {len(self.plc_config.tag_mappings.elements)} tag mappings.")
 
+        connection = self.connection = self.create_connection()
         while True:
             try:
-                with PLC() as comm:
-                    comm.IPAddress = self.plc_config.address.value
-                    comm.Port = self.plc_config.port.value
-                    comm.Micro800 = self.plc_config.micro800.value
-                    comm.SocketTimeout = self.plc_config.timeout.value
-                    try:
-                        comm.UserTag = self.plc_config.username.value
-                        comm.PasswordTag = self.plc_config.password.value
-                    except Exception as e:
-                        logging.warning(f"Failed to set UserTag/PasswordTag for {self.plc_name}: {e}")
-
-                    while True:
-                        start_time = time.time()
-                        await self._sync_from_plc(comm)
+                if self.connection_changed:
+                    logging.info(f"{self.plc_name} PLC TASK: Connection settings changed, reconnecting")
+                    self.connection_changed = False
+                    await connection.close()
+                    connection = self.connection = self.create_connection()
+                self.refresh_plan()
+                client = await connection.connect()
+                self._wire_bytes_counted = (0, 0)
+                await self.load_tag_cache(client)
+                self.scheduler.restart(time.monotonic())
+                cache_saved = False
+                ## Until a config update needs a new plan or connection
+                while not self.plan_changed and not self.connection_changed:
+                    ## Run every rate class that is due together, so their reads share one batch
+                    started = time.monotonic()
+                    due = self.scheduler.due(started)
+                    if due:
+                        try:
+                            await self._sync_from_plc(client, [rc.period for rc in due])
+                        except CONNECTION_ERRORS:
+                            raise
+                        except Exception as e:
+                            ## Only losing the connection costs the connection
+                            logging.exception(f"Error syncing PLC {self.plc_name}: {e}", exc_info=True)
+                            SYNC_ERRORS.labels(self.plc_name).inc()
+                        else:
+                            connection.healthy()
+                        finished = time.monotonic()
+                        overran = self.scheduler.complete(due, started, finished)
+                        self.record_timing(due, overran)
+                        self.log_overruns(overran, finished)
+
+                        ## Persist any tag types learnt in the first cycle of each connection
+                        if not cache_saved:
+                            self.save_tag_cache(client)
+                            cache_saved = True
 
                         ## Record some analytics about the task run time
-                        self.task_run_times[start_time] = time.time() - start_time
-                        while len(self.task_run_times) > 10:
-                            self.task_run_times.pop(min(self.task_run_times.keys()))
+                        self.task_run_times.append((started, finished - started))
+                        CYCLE_SECONDS.labels(self.plc_name).observe(finished - started)
+                        self.count_wire_bytes(client)
 
-                        sleep_time = sync_period_secs - (time.time() - start_time) 
-                        if sleep_time > 0:
-                            await asyncio.sleep(sleep_time)
+                    await connection.idle_until(self.scheduler.next_deadline())
 
             except asyncio.CancelledError:
                 logging.info(f"PLC sync task for {self.plc_name} cancelled")
+                await connection.close()
                 break
+            except CONNECTION_ERRORS as e:
+                await connection.connection_lost(e)
             except Exception as e:
                 logging.exception(f"Error syncing PLC: {e}", exc_info=True)
+                SYNC_ERRORS.labels(self.plc_name).inc()
+                await connection.close()
                 await asyncio.sleep(1)
 
     ## Sync Helpers
-    def get_sync_values(self, tag_mapping: Any, comm: PLC):
-        plc_response = comm.Read(tag_mapping.plc_tag.value)
-        if plc_response.Status == "Success":
-            plc_value = plc_response.Value
-        else:
-            logging.warning(f"Failed to read PLC tag {tag_mapping.plc_tag.value}: {plc_response.Status}")
-            plc_value = None
-        doover_value = self.app.retreive_doover_tag_value(tag_mapping.doover_tag.value)
-        last_agreed = self.last_sync_agreed_values.get(tag_mapping.plc_tag.value, None)
+    def get_read_value(self, tag_mapping: TagMapping, read_results: Dict[str, Response]):
+        plc_response = read_results.get(tag_mapping.plc_tag)
+        if plc_response is None:
+            return None
+        if plc_response.Status != "Success":
+            logging.warning(f"Failed to read PLC tag {tag_mapping.plc_tag}: {plc_response.Status}")
+            TAG_ERRORS.labels(self.plc_name, "read").inc()
+            return None
+        return plc_response.Value
+
+    def get_sync_values(self, tag_mapping: TagMapping, read_results: Dict[str, Response]):
+        plc_value = self.get_read_value(tag_mapping, read_results)
+        doover_value = self.app.retreive_doover_path_value(tag_mapping.doover_path)
+        last_agreed = self.last_sync_agreed_values.get(tag_mapping.plc_tag, None)
         return plc_value, doover_value, last_agreed
     
-    def propogate_to_plc(self, tag_mapping: Any, tag_value: Any, comm: PLC):
-        logging.info(f"{self.plc_name} PLC TASK: Propogating to PLC: {tag_mapping.plc_tag.value} -> {tag_value}")
-        comm.Write(tag_mapping.plc_tag.value, tag_value)
-        self.last_sync_agreed_values[tag_mapping.plc_tag.value] = tag_value
+    def propogate_to_plc(self, tag_mapping: TagMapping, tag_value: Any, write_plan: WritePlan):
+        logging.info(f"{self.plc_name} PLC TASK: Propogating to PLC: {tag_mapping.plc_tag} -> {tag_value}")
+        write_plan.add(tag_mapping.plc_tag, tag_value, agreed=True)
     
-    def propogate_to_doover(self, tag_mapping: Any, tag_value: Any):
-        logging.info(f"{self.plc_name} PLC TASK: Propogating to Doover: {tag_mapping.plc_tag.value} -> {tag_value}")
-        self.last_sync_agreed_values[tag_mapping.plc_tag.value] = tag_value
-        channel_msg = self.app.to_channel_message(tag_mapping.doover_tag.value, tag_value)
-        return channel_msg
-
-    def has_changed(self, value1: Any, value2: Any, float_tolerance: float = 0.01):
-        if isinstance(value1, float) and isinstance(value2, float):
-            return abs(value1 - value2) > float_tolerance
-        return value1 != value2
+    def propogate_to_doover(self, tag_mapping: TagMapping, tag_value: Any, now: float):
+        logging.info(f"{self.plc_name} PLC TASK: Propogating to Doover: {tag_mapping.plc_tag} -> {tag_value}")
+        self.last_sync_agreed_values[tag_mapping.plc_tag] = tag_value
+        self.report_value(tag_mapping, tag_value, now)
+
+    def report_value(self, tag_mapping: TagMapping, tag_value: Any, now: float):
+        self.pending_publish[tag_mapping.doover_tag] = (tag_mapping.doover_path, tag_value)
+        self.last_reported_values[tag_mapping.doover_tag] = (tag_value, now)
+
+    def should_report(self, tag_mapping: TagMapping, tag_value: Any, now: float):
+        last_reported = self.last_reported_values.get(tag_mapping.doover_tag)
+        if last_reported is None:
+            return True
+        last_value, last_ts = last_reported
+        if self.has_changed(last_value, tag_value, tag_mapping):
+            return True
+        heartbeat_period = tag_mapping.heartbeat_period
+        return bool(heartbeat_period) and now - last_ts >= heartbeat_period
+
+    def should_write(self, plc_tag: str, tag_value: Any, now: float):
+        last_written = self.last_written_values.get(plc_tag)
+        if last_written is None:
+            return True
+        last_value, last_ts = last_written
+        ## Writes are never deadbanded, any change to the value the PLC holds has to be written
+        if type(last_value) is not type(tag_value) or last_value != tag_value:
+            return True
+        refresh_period = self.plan.write_refresh_period
+        return bool(refresh_period) and now - last_ts >= refresh_period
+
+    def apply_write_results(self, write_plan: WritePlan, write_results: Dict[str, Response], now: float) -> bool:
+        """Remember the acknowledged writes, returning whether every write succeeded"""
+        all_written = True
+        for plc_tag, value in write_plan.values.items():
+            response = write_results.get(plc_tag)
+            if response is None or response.Status != "Success":
+                status = response.Status if response is not None else "No response from PLC"
+                logging.warning(f"Failed to write PLC tag {plc_tag}: {status}")
+                TAG_ERRORS.labels(self.plc_name, "write").inc()
+                all_written = False
+                continue
+            self.last_written_values[plc_tag] = (value, now)
+            if plc_tag in write_plan.agreed_tags:
+                self.last_sync_agreed_values[plc_tag] = value
+        return all_written
+
+    def to_plc_mappings(self, period: float, group: MappingGroup) -> List[TagMapping]:
+        """
+        The write only mappings of a rate class to check this cycle. Once every value is written,
+        only mappings whose Doover value has changed since can need writing, unless writes are refreshed.
+        """
+        version = self.doover_versions.get(period)
+        if version is None or self.plan.write_refresh_period:
+            return group.to_plc
+        changed = self.app.tag_snapshot.changed_since(version)
+        if changed is None or len(changed) >= len(group.to_plc_by_path):
+            return group.to_plc
+        return [m for path in changed for m in group.to_plc_by_path.get(path, ())]
+
+    def count_wire_bytes(self, client: PlcClient | AsyncCipClient):
+        """Add the bytes the client has sent and received since the last cycle to the metrics. pylogix does not count them."""
+        sent, received = getattr(client, "bytes_sent", 0), getattr(client, "bytes_received", 0)
+        counted_sent, counted_received = self._wire_bytes_counted
+        if sent > counted_sent:
+            WIRE_BYTES.labels(self.plc_name, "sent").inc(sent - counted_sent)
+        if received > counted_received:
+            WIRE_BYTES.labels(self.plc_name, "received").inc(received - counted_received)
+        self._wire_bytes_counted = (sent, received)
+
+    def has_changed(self, value1: Any, value2: Any, tag_mapping: TagMapping = None):
+        if isinstance(value1, bool) or isinstance(value2, bool):
+            return value1 != value2
+        if not isinstance(value1, (int, float)) or not isinstance(value2, (int, float)):
+            return value1 != value2
+
+        deadband = 0.01
+        if tag_mapping is not None:
+            deadband = tag_mapping.deadband
+            if tag_mapping.deadband_percent:
+                deadband = abs(value1) * deadband / 100
+        return abs(value1 - value2) > deadband
 
 
     ## Main Sync Function
-    async def _sync_from_plc(self, comm: PLC):
+    async def _sync_from_plc(self, client: PlcClient | AsyncCipClient, periods: List[float] = None):
         logging.debug(f"Syncing from PLC {self.plc_name}...")
 
-        updates = []
-
-        for tag_mapping in self.plc_config.tag_mappings.elements:
-
-            if tag_mapping.mode.value == EnipTagSyncMode.SYNC_PLC_PREFERRED:
-                plc_value, doover_value, last_agreed = self.get_sync_values(tag_mapping, comm)
-                if plc_value is not None:
-                    if last_agreed is None or self.has_changed(last_agreed, plc_value) or doover_value is None:
-                        updates.append(self.propogate_to_doover(tag_mapping, plc_value))
-                    elif doover_value is not None and self.has_changed(last_agreed, doover_value):
-                        self.propogate_to_plc(tag_mapping, doover_value, comm)
-
-            elif tag_mapping.mode.value == EnipTagSyncMode.SYNC_DOOVER_PREFERRED:
-                plc_value, doover_value, last_agreed = self.get_sync_values(tag_mapping, comm)
-                if plc_value is not None:
-                    if last_agreed is None or self.has_changed(last_agreed, doover_value):
-                        self.propogate_to_plc(tag_mapping, doover_value, comm)
-                    elif self.has_changed(last_agreed, plc_value):
-                        updates.append(self.propogate_to_doover(tag_mapping, plc_value))
-
-            elif tag_mapping.mode.value == EnipTagSyncMode.FROM_PLC:
-                result = comm.Read(tag_mapping.plc_tag.value)
-                if result.Status == "Success" and result.Value is not None:
-                    channel_msg = self.app.to_channel_message(tag_mapping.doover_tag.value, result.Value)
-                    updates.append(channel_msg)
-
-            elif tag_mapping.mode.value == EnipTagSyncMode.TO_PLC:
-                result = self.app.retreive_doover_tag_value(tag_mapping.doover_tag.value)
-                if result is not None:
-                    t = comm.Write(tag_mapping.plc_tag.value, result)
-
-
-        updates_to_publish: Dict[str, Any] = {}
-
-        for update in updates:
-            key = next(iter(update))
-            if key in updates_to_publish:
-                updates_to_publish[key].update(update[key])
-            else:
-                updates_to_publish[key] = update[key]
-
-        logging.debug(f"Synced from PLC {self.plc_name}: {updates_to_publish}")
-        if updates_to_publish:
-            logging.info(f"{self.plc_name} PLC TASK: Publishing updates to channel: {updates_to_publish}")
-            await self.app.device_agent.publish_to_channel_async(
-                "tag_values",
-                updates_to_publish,
-                record_log=False,
-                max_age=None,
-            )
-            logging.info(f"{self.plc_name} PLC TASK: Finished Publish")
\ No newline at end of file
+        plan = self.plan if self.plan is not None else self.refresh_plan()
+        if periods is None:
+            periods = list(plan.rate_groups)
+        write_plan = WritePlan()
+        doover_version = self.app.tag_snapshot.version
+
+        ## Reads for every rate class due this cycle go out together
+        started = time.monotonic()
+        read_results = await client.read(self.get_read_plan(tuple(periods)))
+        BATCH_SECONDS.labels(self.plc_name, "read").observe(time.monotonic() - started)
+        now = time.time()
+
+        for period in periods:
+            self._process_group(plan.rate_groups[period], read_results, write_plan, now, self.to_plc_mappings(period, plan.rate_groups[period]))
+
+        ## Send every changed value to the PLC together, and only remember the acknowledged ones
+        all_written = True
+        if write_plan:
+            started = time.monotonic()
+            write_results = await client.write(write_plan)
+            BATCH_SECONDS.labels(self.plc_name, "write").observe(time.monotonic() - started)
+            all_written = self.apply_write_results(write_plan, write_results, time.time())
+
+        ## Failed writes are retried, so only move on once everything is written
+        if all_written:
+            for period in periods:
+                self.doover_versions[period] = doover_version
+
+        await self._maybe_publish(now)
+
+    def _process_group(self, group: MappingGroup, read_results: Dict[str, Response], write_plan: WritePlan, now: float, to_plc: List[TagMapping] = None):
+        for tag_mapping in group.sync_plc_preferred:
+            plc_value, doover_value, last_agreed = self.get_sync_values(tag_mapping, read_results)
+            if plc_value is not None:
+                if last_agreed is None or self.has_changed(last_agreed, plc_value, tag_mapping) or doover_value is None:
+                    self.propogate_to_doover(tag_mapping, plc_value, now)
+                elif doover_value is not None and self.has_changed(last_agreed, doover_value, tag_mapping):
+                    self.propogate_to_plc(tag_mapping, doover_value, write_plan)
+
+        for tag_mapping in group.sync_doover_preferred:
+            plc_value, doover_value, last_agreed = self.get_sync_values(tag_mapping, read_results)
+            if plc_value is not None:
+                if last_agreed is None or self.has_changed(last_agreed, doover_value, tag_mapping):
+                    self.propogate_to_plc(tag_mapping, doover_value, write_plan)
+                elif self.has_changed(last_agreed, plc_value, tag_mapping):
+                    self.propogate_to_doover(tag_mapping, plc_value, now)
+
+        ## Report by exception, only values outside the deadband or due a heartbeat are published
+        for tag_mapping in group.from_plc:
+            plc_value = self.get_read_value(tag_mapping, read_results)
+            if plc_value is not None and self.should_report(tag_mapping, plc_value, now):
+                self.report_value(tag_mapping, plc_value, now)
+
+        for tag_mapping in (group.to_plc if to_plc is None else to_plc):
+            result = self.app.retreive_doover_path_value(tag_mapping.doover_path)
+            if result is not None and self.should_write(tag_mapping.plc_tag, result, now):
+                write_plan.add(tag_mapping.plc_tag, result)
+
+    async def _maybe_publish(self, now: float):
+        if not self.pending_publish:
+            return
+        if now - self.last_publish_time < self.plan.min_publish_interval:
+            return
+
+        ## The application owns publishing, this is a list of (doover path, value) pairs
+        await self.app.publish_plc_values(self.plc_name, list(self.pending_publish.values()))
+        self.pending_publish = {}
+        self.last_publish_time = now
+        logging.info(f"{self.plc_name} PLC TASK: Finished Publish")
@@ -0,0 +1,277 @@
+import asyncio
+import logging
+import multiprocessing
+import queue
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .app_config import plc_config_name
+from .doover_tags import DooverTagAccess, TagPath, TagSnapshot
+from .metrics import REGISTRY
+from .plc_sync import PlcSyncTask
+from .sync_plan import SyncPlan
+
+"""
+Sharded PLC sync across worker processes.
+
+With hundreds of PLCs, encoding and decoding packets in a single process is limited to one core
+by the GIL. In sharded mode the PLCs are spread across a pool of worker processes, each running
+ordinary `PlcSyncTask`s on its own event loop.
+
+The main process keeps sole ownership of the device agent. It forwards each worker the part of the
+tag_values aggregate its PLCs map whenever that part changes, and workers send back compact
+batches of (doover path, value) pairs which the main process coalesces and publishes. Workers also
+report their sync statistics and a snapshot of their metrics periodically.
+"""
+
+STATS_INTERVAL = 5.0 # Seconds between each worker reporting its task statistics
+MONITOR_INTERVAL = 5.0 # Seconds between checking that every worker process is alive
+
+
+class WorkerConfig:
+    """The application config a PLC sync task needs, in a form that can be sent to a worker process."""
+
+    def __init__(self, config: Any):
+        self.tag_namespace_separator = config.tag_namespace_separator
+        self.tag_cache_directory = config.tag_cache_directory
+
+
+class PlcWorkerApp(DooverTagAccess):
+    """Stands in for the application inside a worker process."""
+
+    def __init__(self, config: WorkerConfig, results: multiprocessing.Queue):
+        self.config = config
+        self.results = results
+        self.tag_snapshot = TagSnapshot()
+
+    async def publish_plc_values(self, plc_name: str, values: List[Tuple[Tuple[str, ...], Any]]):
+        self.results.put(("values", plc_name, values))
+
+
+class RemotePlcSyncTask:
+    """The main process's view of a PLC sync task running in a worker process."""
+
+    def __init__(self, plc_name: str, worker_id: int):
+        self.plc_name = plc_name
+        self.worker_id = worker_id
+        self.sync_speed_hz = 0.0
+        self.average_task_time = 0.0
+        self.rate_class_stats = {}
+
+    def update_stats(self, stats: Dict[str, Any]):
+        self.sync_speed_hz = stats["sync_speed_hz"]
+        self.average_task_time = stats["average_task_time"]
+        self.rate_class_stats = stats["rate_class_stats"]
+
+
+def worker_main(worker_id: int, config: WorkerConfig, plc_configs: List[Any], commands: multiprocessing.Queue, results: multiprocessing.Queue, log_level: int):
+    logging.basicConfig(level=log_level, format=f"%(asctime)s plc-worker-{worker_id} %(levelname)s %(message)s")
+    try:
+        asyncio.run(_worker_loop(worker_id, config, plc_configs, commands, results))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(worker_id: int, config: WorkerConfig, plc_configs: List[Any], commands: multiprocessing.Queue, results: multiprocessing.Queue):
+    app = PlcWorkerApp(config, results)
+    tasks = [PlcSyncTask(app, plc_config) for plc_config in plc_configs]
+    for task in tasks:
+        await task.start()
+
+    loop = asyncio.get_running_loop()
+    last_stats = 0
+    try:
+        while True:
+            try:
+                command = await loop.run_in_executor(None, commands.get, True, STATS_INTERVAL)
+            except queue.Empty:
+                command = None
+
+            if command is not None:
+                kind, payload = command
+                if kind == "stop":
+                    break
+                if kind == "tag_values":
+                    app.tag_snapshot.update(payload)
+                elif kind == "config":
+                    ## The payload holds every PLC this worker now syncs
+                    for task in list(tasks):
+                        plc_config = payload.pop(task.plc_name, None)
+                        if plc_config is None:
+                            logging.info(f"PLC {task.plc_name} removed from config, stopping its sync task")
+                            await task.stop()
+                            tasks.remove(task)
+                        else:
+                            task.update_config(plc_config)
+                    for plc_config in payload.values():
+                        task = PlcSyncTask(app, plc_config)
+                        await task.start()
+                        tasks.append(task)
+
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                last_stats = time.monotonic()
+                for task in tasks:
+                    results.put(("stats", task.plc_name, {
+                        "sync_speed_hz": task.sync_speed_hz,
+                        "average_task_time": task.average_task_time,
+                        "rate_class_stats": task.rate_class_stats,
+                    }))
+                results.put(("metrics", worker_id, REGISTRY.snapshot()))
+    finally:
+        for task in tasks:
+            await task.stop()
+
+
+class PlcWorkerPool:
+
+    def __init__(self, app: Any, plc_configs: List[Any], num_workers: int):
+        self.app = app
+        self.num_workers = max(1, min(num_workers, len(plc_configs)))
+
+        self._context = multiprocessing.get_context("spawn")
+        self._results: multiprocessing.Queue = self._context.Queue()
+        self._commands: List[multiprocessing.Queue] = []
+        self._processes: List[Optional[multiprocessing.Process]] = []
+        self._reader_task: asyncio.Task = None
+        self._shard_paths: List[Set[TagPath]] = [] # The Doover paths mapped by each worker's PLCs
+        self._shard_values: List[Optional[Dict[str, Any]]] = [] # The tag values last sent to each worker
+        self.metrics: Dict[int, List[tuple]] = {} # The latest metrics snapshot from each worker
+
+        self.shards: List[List[Any]] = [[] for _ in range(self.num_workers)]
+        self.tasks: Dict[str, RemotePlcSyncTask] = {}
+        self.add_to_shards(plc_configs)
+
+    def add_to_shards(self, plc_configs: List[Any]):
+        """Spread the PLCs so each worker has a similar number of tag mappings"""
+        loads = [sum(max(1, len(p.tag_mappings.elements)) for p in shard) for shard in self.shards]
+        for plc_config in sorted(plc_configs, key=lambda p: len(p.tag_mappings.elements), reverse=True):
+            worker_id = loads.index(min(loads))
+            self.shards[worker_id].append(plc_config)
+            loads[worker_id] += max(1, len(plc_config.tag_mappings.elements))
+            plc_name = plc_config_name(plc_config)
+            self.tasks[plc_name] = RemotePlcSyncTask(plc_name, worker_id)
+
+    async def start(self):
+        self._shard_paths = [self.mapped_paths(shard) for shard in self.shards]
+        self._shard_values = [None] * self.num_workers
+        for worker_id in range(self.num_workers):
+            self._commands.append(self._context.Queue())
+            self._processes.append(None)
+            self._start_worker(worker_id)
+        self._reader_task = asyncio.create_task(self._read_results())
+
+    async def stop(self):
+        for commands in self._commands:
+            commands.put(("stop", None))
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            self._reader_task = None
+        for process in self._processes:
+            if process is not None:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+
+    def _start_worker(self, worker_id: int):
+        process = self._context.Process(
+            target=worker_main,
+            args=(
+                worker_id,
+                WorkerConfig(self.app.config),
+                self.shards[worker_id],
+                self._commands[worker_id],
+                self._results,
+                logging.getLogger().getEffectiveLevel(),
+            ),
+            name=f"plc-worker-{worker_id}",
+            daemon=True,
+        )
+        process.start()
+        self._processes[worker_id] = process
+        if self._shard_values[worker_id] is not None:
+            self._commands[worker_id].put(("tag_values", self._shard_values[worker_id]))
+        logging.info(f"Started PLC worker {worker_id} (pid {process.pid}) with {len(self.shards[worker_id])} PLCs")
+
+    def mapped_paths(self, shard: List[Any]) -> Set[TagPath]:
+        """The Doover paths mapped by a shard's PLCs, leaving out any inside another mapped path"""
+        separator = self.app.config.tag_namespace_separator.value
+        paths = {mapping.doover_path for plc_config in shard for mapping in SyncPlan(plc_config, separator).mappings}
+        return {path for path in paths if not any(path[:i] in paths for i in range(1, len(path)))}
+
+    def update_tag_values(self, changed: Set[TagPath]):
+        """
+        Forward the app's tag snapshot to the workers after it has been updated. Each worker is only
+        sent the values its PLCs map, and only when one of them has changed.
+        """
+        tag_snapshot = self.app.tag_snapshot
+        for worker_id, paths in enumerate(self._shard_paths):
+            if self._shard_values[worker_id] is not None and paths.isdisjoint(changed):
+                continue
+            values = [(path, tag_snapshot.get(path)) for path in sorted(paths) if path in tag_snapshot.index]
+            self._shard_values[worker_id] = self.app.paths_to_channel_message(values)
+            self._commands[worker_id].put(("tag_values", self._shard_values[worker_id]))
+
+    def update_configs(self, plc_configs: List[Any]):
+        """
+        Send each worker the new config of its PLCs after a deployment config update. A removed
+        PLC is dropped from its worker, and an added one goes to the worker with the least to do.
+        """
+        by_name = {plc_config_name(plc_config): plc_config for plc_config in plc_configs}
+        for plc_name in set(self.tasks) - set(by_name):
+            removed = self.tasks.pop(plc_name)
+            logging.info(f"PLC {plc_name} removed from config, stopping its sync task in worker {removed.worker_id}")
+        for shard in self.shards:
+            shard[:] = [by_name.pop(plc_config_name(plc_config)) for plc_config in shard if plc_config_name(plc_config) in by_name]
+        self.add_to_shards(list(by_name.values()))
+
+        for worker_id, shard in enumerate(self.shards):
+            configs = {plc_config_name(plc_config): plc_config for plc_config in shard}
+            self._commands[worker_id].put(("config", configs))
+            self._shard_paths[worker_id] = self.mapped_paths(shard)
+            self._shard_values[worker_id] = None
+        self.update_tag_values(set())
+
+    def _check_workers(self):
+        for worker_id, process in enumerate(self._processes):
+            if process is not None and not process.is_alive():
+                logging.error(f"PLC worker {worker_id} exited with code {process.exitcode}, restarting")
+                self._start_worker(worker_id)
+
+    async def _read_results(self):
+        loop = asyncio.get_running_loop()
+        last_check = time.monotonic()
+        while True:
+            try:
+                try:
+                    results = [await loop.run_in_executor(None, self._results.get, True, MONITOR_INTERVAL)]
+                except queue.Empty:
+                    results = []
+                ## Drain whatever else is waiting so it can be published together
+                while True:
+                    try:
+                        results.append(self._results.get_nowait())
+                    except queue.Empty:
+                        break
+
+                values = []
+                plc_names = []
+                for kind, source, payload in results:
+                    if kind == "values":
+                        values.extend(payload)
+                        plc_names.append(source)
+                    elif kind == "stats" and source in self.tasks:
+                        self.tasks[source].update_stats(payload)
+                    elif kind == "metrics":
+                        self.metrics[source] = payload
+                if values:
+                    await self.app.publish_plc_values(", ".join(plc_names), values)
+
+                if time.monotonic() - last_check >= MONITOR_INTERVAL:
+                    last_check = time.monotonic()
+                    self._check_workers()
+
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logging.exception(f"Error handling PLC worker results: {e}", exc_info=True)
+                await asyncio.sleep(1)
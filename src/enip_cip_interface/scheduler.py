@@ -0,0 +1,158 @@
+import math
+from typing import Dict, Iterable, List
+
+from .app_config import OverrunPolicy
+
+"""
+Multi-rate scheduler for PLC sync cycles.
+
+Each distinct poll period is a rate class with its own deadline on the monotonic clock, so neither
+a slow cycle nor a step in the wall clock (eg. from NTP) moves it. Deadlines advance by whole
+periods from when the class started, so a cycle that runs a little late does not push every later
+cycle back.
+
+A class whose cycle finishes after its next deadline has overrun, and what happens to the
+deadlines it missed depends on the overrun policy:
+
+- skip: the missed ticks are dropped, and the class carries on at its next deadline on the
+  original grid. Samples stay evenly spaced, with gaps where ticks were dropped.
+- catch up: the missed ticks are run back to back until the class is on time again, so no sample
+  is lost, though they are taken late. At most `MAX_CATCH_UP` ticks are kept, any more are dropped.
+- stretch: the next cycle runs straight away, and the grid restarts from there, so the period
+  stretches to fit the slow cycle rather than keeping to the original grid.
+
+Every run records how late it started (lateness) and how far the time since the previous run
+strayed from the period (jitter), along with the overruns and missed deadlines.
+"""
+
+MAX_CATCH_UP = 10 # Missed ticks kept to run late under the catch up policy
+
+class RateClass:
+    __slots__ = (
+        "period",
+        "next_due",
+        "runs",
+        "overruns",
+        "missed",
+        "skipped",
+        "last_missed",
+        "last_started",
+        "last_lateness",
+        "max_lateness",
+        "last_jitter",
+        "max_jitter",
+        "total_jitter",
+        "jitter_samples",
+        "last_duration",
+        "max_duration",
+    )
+
+    def __init__(self, period: float, now: float):
+        self.period = period
+        self.next_due = now
+        self.runs = 0
+        self.overruns = 0
+        self.missed = 0 # Deadlines that passed while a cycle overran
+        self.skipped = 0 # Missed ticks that were dropped rather than run late
+        self.last_missed = 0
+        self.last_started = None
+        self.last_lateness = 0.0 # Seconds between the deadline and the cycle starting
+        self.max_lateness = 0.0
+        self.last_jitter = None # Seconds between the period and the time since the previous cycle started, if there was one
+        self.max_jitter = 0.0
+        self.total_jitter = 0.0
+        self.jitter_samples = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "period": self.period,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "missed_deadlines": self.missed,
+            "skipped": self.skipped,
+            "last_lateness": self.last_lateness,
+            "max_lateness": self.max_lateness,
+            "last_jitter": self.last_jitter or 0.0,
+            "mean_jitter": self.total_jitter / self.jitter_samples if self.jitter_samples else 0.0,
+            "max_jitter": self.max_jitter,
+            "last_duration": self.last_duration,
+            "max_duration": self.max_duration,
+        }
+
+    def __repr__(self):
+        return f"RateClass({self.period}s, runs={self.runs}, overruns={self.overruns})"
+
+
+class MultiRateScheduler:
+
+    def __init__(self, periods: Iterable[float], now: float, overrun_policy: str = OverrunPolicy.SKIP):
+        self.overrun_policy = overrun_policy
+        self.rate_classes: Dict[float, RateClass] = {
+            period: RateClass(period, now) for period in sorted(set(periods))
+        }
+
+    def restart(self, now: float):
+        """Make every rate class due now, eg. after (re)connecting. Statistics are kept."""
+        for rc in self.rate_classes.values():
+            rc.next_due = now
+            ## The gap while reconnecting is not jitter
+            rc.last_started = None
+
+    def due(self, now: float) -> List[RateClass]:
+        """The rate classes whose deadline has passed, to be run together in one cycle."""
+        return [rc for rc in self.rate_classes.values() if rc.next_due <= now]
+
+    def next_deadline(self) -> float:
+        return min(rc.next_due for rc in self.rate_classes.values())
+
+    def complete(self, rate_classes: List[RateClass], started: float, finished: float) -> List[RateClass]:
+        """Advance the deadlines of the rate classes just run, returning any that overran."""
+        overran = []
+        duration = finished - started
+        for rc in rate_classes:
+            rc.runs += 1
+            rc.last_lateness = started - rc.next_due
+            rc.max_lateness = max(rc.max_lateness, rc.last_lateness)
+            rc.last_jitter = None
+            if rc.last_started is not None:
+                rc.last_jitter = abs(started - rc.last_started - rc.period)
+                rc.max_jitter = max(rc.max_jitter, rc.last_jitter)
+                rc.total_jitter += rc.last_jitter
+                rc.jitter_samples += 1
+            rc.last_started = started
+            rc.last_duration = duration
+            rc.max_duration = max(rc.max_duration, duration)
+
+            rc.next_due += rc.period
+            rc.last_missed = 0
+            if rc.next_due > finished:
+                continue
+
+            ## Ticks that are now due, and of those the deadlines that passed while this cycle ran.
+            ## Any before it started were counted by the cycle that overran them (eg. catching up).
+            behind = math.floor((finished - rc.next_due) / rc.period) + 1
+            already_passed = 0 if rc.next_due > started else math.floor((started - rc.next_due) / rc.period) + 1
+            missed = max(0, behind - already_passed)
+            if missed:
+                rc.last_missed = missed
+                rc.missed += missed
+                rc.overruns += 1
+                overran.append(rc)
+
+            if self.overrun_policy == OverrunPolicy.CATCH_UP:
+                ## Leave the missed ticks due, dropping any beyond the most that are caught up
+                dropped = max(0, behind - MAX_CATCH_UP)
+                rc.next_due += dropped * rc.period
+                rc.skipped += dropped
+            elif self.overrun_policy == OverrunPolicy.STRETCH:
+                rc.next_due = finished
+                rc.skipped += behind
+            else:
+                rc.next_due += behind * rc.period
+                rc.skipped += behind
+        return overran
+
+    def stats(self) -> Dict[float, Dict[str, float]]:
+        return {period: rc.stats() for period, rc in self.rate_classes.items()}
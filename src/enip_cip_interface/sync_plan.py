@@ -0,0 +1,124 @@
+from typing import Any, Dict, List, Tuple
+
+from .app_config import DeadbandType, EnipTagSyncMode, OverrunPolicy, get_config_value
+
+"""
+Compiled execution plan for a PLC's tag mappings.
+
+Reading pydoover config elements is comparatively slow, and the sync engine used to walk them
+for every mapping on every cycle. A `SyncPlan` reads the config once into compact slotted
+records, grouped by sync mode, so a cycle only touches plain attributes. Mappings are also
+grouped by poll period, so the scheduler can run each rate class on its own.
+"""
+
+class TagMapping:
+    __slots__ = (
+        "mode",
+        "doover_tag",
+        "doover_path",
+        "plc_tag",
+        "deadband",
+        "deadband_percent",
+        "heartbeat_period",
+        "poll_period",
+    )
+
+    def __init__(
+            self,
+            mode: str,
+            doover_tag: str,
+            doover_path: Tuple[str, ...],
+            plc_tag: str,
+            deadband: float = 0.01,
+            deadband_percent: bool = False,
+            heartbeat_period: float = 0.0,
+            poll_period: float = 1.0,
+        ):
+        self.mode = mode
+        self.doover_tag = doover_tag
+        self.doover_path = doover_path
+        self.plc_tag = plc_tag
+        self.deadband = deadband
+        self.deadband_percent = deadband_percent
+        self.heartbeat_period = heartbeat_period
+        self.poll_period = poll_period
+
+    @classmethod
+    def from_config(cls, tag_mapping: Any, separator: str, default_poll_period: float = 1.0):
+        doover_tag = tag_mapping.doover_tag.value
+        return cls(
+            mode=tag_mapping.mode.value,
+            doover_tag=doover_tag,
+            doover_path=tuple(doover_tag.split(separator)),
+            plc_tag=tag_mapping.plc_tag.value,
+            deadband=get_config_value(tag_mapping.deadband, 0.0),
+            deadband_percent=get_config_value(tag_mapping.deadband_type) == DeadbandType.PERCENT,
+            heartbeat_period=get_config_value(tag_mapping.heartbeat_period, 0.0),
+            poll_period=get_config_value(tag_mapping.poll_period, 0.0) or default_poll_period,
+        )
+
+    def __repr__(self):
+        return f"{self.plc_tag} <{self.mode}> {self.doover_tag}"
+
+
+class MappingGroup:
+    """A set of tag mappings split by sync mode, with the PLC tags they need read."""
+
+    def __init__(self, mappings: List[TagMapping]):
+        self.mappings = mappings
+        self.from_plc = [m for m in self.mappings if m.mode == EnipTagSyncMode.FROM_PLC]
+        self.to_plc = [m for m in self.mappings if m.mode == EnipTagSyncMode.TO_PLC]
+        self.sync_plc_preferred = [m for m in self.mappings if m.mode == EnipTagSyncMode.SYNC_PLC_PREFERRED]
+        self.sync_doover_preferred = [m for m in self.mappings if m.mode == EnipTagSyncMode.SYNC_DOOVER_PREFERRED]
+
+        ## Write only mappings by the Doover path they write from, so a cycle can visit just the changed ones
+        self.to_plc_by_path: Dict[Tuple[str, ...], List[TagMapping]] = {}
+        for mapping in self.to_plc:
+            self.to_plc_by_path.setdefault(mapping.doover_path, []).append(mapping)
+
+        ## Every PLC tag that has to be read each cycle, de-duplicated and in mapping order
+        self.read_tags: List[str] = list(dict.fromkeys(
+            m.plc_tag for m in self.mappings if m.mode != EnipTagSyncMode.TO_PLC and m.plc_tag is not None
+        ))
+
+    def __len__(self):
+        return len(self.mappings)
+
+
+class SyncPlan(MappingGroup):
+
+    def __init__(self, plc_config: Any, separator: str):
+        self.signature = self.config_signature(plc_config, separator)
+
+        self.sync_period: float = get_config_value(plc_config.sync_period, 1.0)
+        self.write_refresh_period: float = get_config_value(plc_config.write_refresh_period, 0.0)
+        self.min_publish_interval: float = get_config_value(plc_config.min_publish_interval, 0.0)
+        self.overrun_policy: str = get_config_value(plc_config.overrun_policy, OverrunPolicy.SKIP)
+
+        super().__init__([
+            TagMapping.from_config(tag_mapping, separator, self.sync_period)
+            for tag_mapping in plc_config.tag_mappings.elements
+        ])
+
+        ## One group per poll period, so each rate class can be run on its own
+        rate_groups: Dict[float, List[TagMapping]] = {}
+        for mapping in self.mappings:
+            rate_groups.setdefault(mapping.poll_period, []).append(mapping)
+        self.rate_groups: Dict[float, MappingGroup] = {
+            period: MappingGroup(mappings) for period, mappings in sorted(rate_groups.items())
+        } or {self.sync_period: MappingGroup([])}
+
+    @staticmethod
+    def config_signature(plc_config: Any, separator: str) -> tuple:
+        """A hashable snapshot of the config a plan was compiled from, used to detect changes."""
+        return (
+            separator,
+            get_config_value(plc_config.sync_period),
+            get_config_value(plc_config.write_refresh_period),
+            get_config_value(plc_config.min_publish_interval),
+            get_config_value(plc_config.overrun_policy),
+            tuple(
+                tuple(get_config_value(element) for element in tag_mapping._elements.values())
+                for tag_mapping in plc_config.tag_mappings.elements
+            ),
+        )
@@ -0,0 +1,131 @@
+import json
+import logging
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+"""
+Persistent cache of PLC tag metadata.
+
+Both PLC clients have to learn the data type of every tag before they can pack reads efficiently
+or encode writes, and that knowledge used to be lost on every reconnect. The cache keeps it on
+disk per PLC, keyed by the controller's identity and change token, so a reconnect (or a restart)
+against the same, unchanged program needs no discovery round trips at all.
+
+The cache is filled from the controller tag list where the controller supports it, and topped
+up with any types the clients learn from ordinary reads.
+"""
+
+CACHE_VERSION = 1
+
+_INDEX_OR_BIT = re.compile(r"(\[[\d,\s]+\]|\.\d+)$")
+
+
+def base_tag_name(tag: str) -> str:
+    """Strip a trailing array index or bit number, eg. `Tank.Level[3]` -> `Tank.Level`."""
+    while True:
+        stripped = _INDEX_OR_BIT.sub("", tag)
+        if stripped == tag:
+            return tag
+        tag = stripped
+
+
+def parse_identity(data: bytes) -> str:
+    """Build a controller key from an Identity object Get Attributes All reply."""
+    vendor, _, product_code, major, minor, _, serial = struct.unpack_from("<HHHBBHI", data, 0)
+    return f"{vendor}:{product_code}:{major}.{minor}:{serial:08X}"
+
+
+class TagInfo:
+    __slots__ = ("name", "type_code", "struct_handle", "size", "instance_id", "array_size")
+
+    def __init__(
+            self,
+            name: str,
+            type_code: int,
+            struct_handle: Optional[int] = None,
+            size: int = 0,
+            instance_id: Optional[int] = None,
+            array_size: int = 0,
+        ):
+        self.name = name
+        self.type_code = type_code
+        self.struct_handle = struct_handle
+        self.size = size
+        self.instance_id = instance_id
+        self.array_size = array_size
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__ if k != "name"}
+
+    @classmethod
+    def from_dict(cls, name: str, data: Dict[str, Any]):
+        return cls(name, **{k: v for k, v in data.items() if k in cls.__slots__})
+
+    def __repr__(self):
+        return f"TagInfo({self.name}, type=0x{self.type_code:02X}, size={self.size}, instance={self.instance_id})"
+
+
+class TagMetadataCache:
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.controller_key: Optional[str] = None
+        self.tags: Dict[str, TagInfo] = {}
+
+    @classmethod
+    def for_plc(cls, directory: str, plc_name: str):
+        if not directory:
+            return None
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", plc_name)
+        return cls(Path(directory) / f"{safe_name}.json")
+
+    def load(self, controller_key: Optional[str]) -> bool:
+        """Load the cache from disk, returning True if it matches the given controller key."""
+        self.controller_key = controller_key
+        self.tags = {}
+        if controller_key is None or not self.path.exists():
+            return False
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Failed to load tag metadata cache {self.path}: {e}")
+            return False
+        if data.get("version") != CACHE_VERSION or data.get("controller_key") != controller_key:
+            logging.info(f"Tag metadata cache {self.path} is for a different controller or program, discarding")
+            return False
+        self.tags = {name: TagInfo.from_dict(name, info) for name, info in data.get("tags", {}).items()}
+        return True
+
+    def save(self):
+        if self.controller_key is None:
+            return
+        data = {
+            "version": CACHE_VERSION,
+            "controller_key": self.controller_key,
+            "tags": {name: info.to_dict() for name, info in self.tags.items()},
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            ## Write to a temporary file first so a crash never leaves a truncated cache behind
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.warning(f"Failed to save tag metadata cache {self.path}: {e}")
+
+    def merge(self, tags: Dict[str, TagInfo]) -> bool:
+        """Add any tags not already cached, returning True if anything was added."""
+        added = False
+        for name, info in tags.items():
+            if name not in self.tags:
+                self.tags[name] = info
+                added = True
+        return added
+
+    def __len__(self):
+        return len(self.tags)
@@ -0,0 +1,296 @@
+import re
+import struct
+from multiprocessing import Lock, shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+"""
+Typed tag table in shared memory for the ENIP server.
+
+The main process and the cpppo server process both map the same block of shared memory, so
+reading or writing a tag value is a plain memory access on either side rather than a round trip
+to a manager process.
+
+Every tag has a fixed slot, laid out when the table is created:
+
+    [ sequence (uint32) | padding (uint32) | reads (uint64) | writes (uint64) |
+      last read (double) | last write (double) | element 0 | element 1 | ... ]
+
+Strings are stored in fixed size slots of a length (uint16) followed by `STRING_SIZE` bytes, and
+longer strings are truncated. Each slot is guarded by a seqlock: a writer makes the sequence odd,
+writes the value and makes it even again, and a reader retries until it sees the same even
+sequence before and after copying the value. Writers on both sides share a lock so they never
+interleave on a slot; readers never take it.
+
+Tables are created with spare space after their tags, so tags added while the server runs are laid
+out in an existing table rather than each needing a new block that every server process has to
+map. The slots of removed tags are reused by later tags of the same size.
+
+The read and write counters record requests from ENIP clients, and are only updated by the server
+process. Each is a separate field so counting a read never disturbs a concurrent write count,
+though two clients reading the same tag at the same moment can still miss a count.
+"""
+
+STRING_SIZE = 82 # Characters in a Logix STRING
+SLOT_HEADER = struct.Struct("<IIQQdd")
+SEQUENCE = struct.Struct("<I")
+COUNTER = struct.Struct("<Q")
+TIMESTAMP = struct.Struct("<d")
+## Offsets of the telemetry fields within a slot
+READS, WRITES, LAST_READ, LAST_WRITE = 8, 16, 24, 32
+MAX_READ_ATTEMPTS = 1000
+SPARE_SIZE = 64 * 1024 # Bytes left free in a new table for tags added later
+
+## cpppo type name: element format
+ELEMENT_FORMATS = {
+    "BOOL": "<?",
+    "SINT": "<b",
+    "INT": "<h",
+    "DINT": "<i",
+    "LINT": "<q",
+    "REAL": "<f",
+    "LREAL": "<d",
+    "STRING": f"<H{STRING_SIZE}s",
+}
+
+INTEGER_TYPES = ("SINT", "INT", "DINT", "LINT") # Narrowest first
+FLOAT_TYPES = ("REAL", "LREAL")
+
+_ARRAY_TYPE = re.compile(r"^(\w+)\[(\d+)\]$")
+
+
+def split_tag_type(tag_type: str) -> Tuple[str, Optional[int]]:
+    """Split a tag type into its element type and array length, eg. `DINT[10]` -> (`DINT`, 10). Scalars have no length."""
+    match = _ARRAY_TYPE.match(tag_type)
+    if match:
+        return match.group(1), int(match.group(2))
+    return tag_type, None
+
+
+def _convert_element(base_type: str, value: Any) -> Any:
+    if base_type == "BOOL":
+        return bool(value)
+    if base_type in INTEGER_TYPES:
+        return round(value)
+    if base_type in FLOAT_TYPES:
+        return float(value)
+    return value
+
+
+class TagSlot:
+    __slots__ = ("name", "tag_type", "base_type", "count", "offset", "element", "size")
+
+    def __init__(self, name: str, tag_type: str, offset: int):
+        self.name = name
+        self.tag_type = tag_type
+        self.base_type, count = split_tag_type(tag_type)
+        self.count = 1 if count is None else count
+        if self.base_type not in ELEMENT_FORMATS:
+            raise ValueError(f"Unsupported tag type {tag_type} for tag {name}")
+        self.offset = offset
+        self.element = struct.Struct(ELEMENT_FORMATS[self.base_type])
+        self.size = SLOT_HEADER.size + self.element.size * self.count
+
+    @property
+    def span(self) -> int:
+        """The space the slot takes in the table, keeping every slot 8 byte aligned"""
+        return (self.size + 7) & ~7
+
+    @property
+    def is_array(self):
+        return _ARRAY_TYPE.match(self.tag_type) is not None
+
+    def encode(self, value: Any) -> bytes:
+        values = value if isinstance(value, (list, tuple)) else [value]
+        if len(values) != self.count:
+            raise ValueError(f"Tag {self.name} holds {self.count} elements, got {len(values)}")
+        if self.base_type == "STRING":
+            encoded = [str(v).encode("utf-8")[:STRING_SIZE] for v in values]
+            return b"".join(self.element.pack(len(e), e) for e in encoded)
+        try:
+            return b"".join(self.element.pack(_convert_element(self.base_type, v)) for v in values)
+        except (TypeError, ValueError, OverflowError, struct.error) as e:
+            raise ValueError(f"Cannot store {value!r} in {self.tag_type} tag {self.name}: {e}")
+
+    def decode(self, data: bytes) -> List[Any]:
+        if self.base_type == "STRING":
+            return [raw[:length].decode("utf-8", errors="replace") for length, raw in self.element.iter_unpack(data)]
+        return [v for (v,) in self.element.iter_unpack(data)]
+
+
+class TagTable:
+
+    def __init__(
+            self,
+            tag_types: Dict[str, str],
+            name: Optional[str] = None,
+            lock: Any = None,
+            offsets: Optional[Dict[str, int]] = None,
+            spare: int = 0,
+        ):
+        """
+        Create a table for the given {tag name: cpppo type} layout, with `spare` bytes free for
+        tags added later, or attach to an existing one by name. Both sides must use the same
+        layout, so attach with the offsets of the owner's slots if tags have been added or removed.
+        """
+        self.tag_types: Dict[str, str] = {}
+        self.slots: Dict[str, TagSlot] = {}
+        self.used = 0 # The end of the last slot, later tags are laid out after it
+        self._holes: Dict[int, List[int]] = {} # Slot span: offsets of the slots left by removed tags
+        self._place(tag_types, offsets)
+
+        self._owner = name is None
+        if self._owner:
+            self._shm = shared_memory.SharedMemory(create=True, size=max(self.used + spare, 1))
+        else:
+            ## Child processes share the owner's resource tracker, so attaching leaves the block
+            ## registered once and only the owner's unlink releases it
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._buf = self._shm.buf
+        self.lock = lock if lock is not None else Lock()
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    @property
+    def offsets(self) -> Dict[str, int]:
+        return {tag_name: slot.offset for tag_name, slot in self.slots.items()}
+
+    def attach_args(self) -> tuple:
+        """Arguments for attaching to this table from another process: TagTable(*table.attach_args())."""
+        return self.tag_types, self.name, self.lock, self.offsets
+
+    @staticmethod
+    def size_of(tag_types: Dict[str, str]) -> int:
+        """The space the tags take laid out in a table"""
+        return sum(TagSlot(tag_name, tag_type, 0).span for tag_name, tag_type in tag_types.items())
+
+    def fits(self, tag_types: Dict[str, str]) -> bool:
+        """Whether the tags can be added to the table, in the slots of removed tags or its spare space"""
+        holes = {span: len(offsets) for span, offsets in self._holes.items()}
+        needed = 0
+        for tag_name, tag_type in tag_types.items():
+            span = TagSlot(tag_name, tag_type, 0).span
+            if holes.get(span):
+                holes[span] -= 1
+            else:
+                needed += span
+        return self.used + needed <= self._shm.size
+
+    def add(self, tag_types: Dict[str, str], offsets: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """
+        Lay out more tags in the table, returning the offset of each. Tables attached in other
+        processes have to be given the same offsets.
+        """
+        if offsets is None and not self.fits(tag_types):
+            raise ValueError(f"No room for {len(tag_types)} more tags in tag table {self.name}")
+        offsets = self._place(tag_types, offsets)
+        if self._owner:
+            ## A reused slot still holds the counts of the tag it belonged to
+            for offset in offsets.values():
+                SLOT_HEADER.pack_into(self._buf, offset, SEQUENCE.unpack_from(self._buf, offset)[0], 0, 0, 0, 0.0, 0.0)
+        return offsets
+
+    def remove(self, tag_names: List[str]):
+        """Remove tags from the table, leaving their slots free for later tags"""
+        for tag_name in tag_names:
+            slot = self.slots.pop(tag_name, None)
+            if slot is not None:
+                del self.tag_types[tag_name]
+                self._holes.setdefault(slot.span, []).append(slot.offset)
+
+    def _place(self, tag_types: Dict[str, str], offsets: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        placed = {}
+        for tag_name, tag_type in tag_types.items():
+            if offsets is not None:
+                offset = offsets[tag_name]
+            else:
+                span = TagSlot(tag_name, tag_type, 0).span
+                holes = self._holes.get(span)
+                offset = holes.pop() if holes else self.used
+            slot = TagSlot(tag_name, tag_type, offset)
+            self.slots[tag_name] = slot
+            self.tag_types[tag_name] = tag_type
+            self.used = max(self.used, offset + slot.span)
+            placed[tag_name] = offset
+        return placed
+
+    def __contains__(self, tag_name: str):
+        return tag_name in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def read_elements(self, tag_name: str) -> List[Any]:
+        slot = self.slots[tag_name]
+        start = slot.offset + SLOT_HEADER.size
+        end = slot.offset + slot.size
+        for _ in range(MAX_READ_ATTEMPTS):
+            sequence = SEQUENCE.unpack_from(self._buf, slot.offset)[0]
+            if sequence & 1:
+                continue
+            data = bytes(self._buf[start:end])
+            if SEQUENCE.unpack_from(self._buf, slot.offset)[0] == sequence:
+                return slot.decode(data)
+        raise TimeoutError(f"Tag {tag_name} is being written too often to read consistently")
+
+    def read(self, tag_name: str) -> Any:
+        """Read a tag's value, a list for array tags."""
+        values = self.read_elements(tag_name)
+        return values if self.slots[tag_name].is_array else values[0]
+
+    def write(self, tag_name: str, value: Any):
+        slot = self.slots[tag_name]
+        data = slot.encode(value)
+        with self.lock:
+            self._store(slot, data)
+
+    def write_elements(self, tag_name: str, key: int | slice, value: Any) -> bool:
+        """
+        Set an element, or a slice of elements, of a tag's value, returning whether it changed.
+        The current value is read and written back under the writers' lock, so writes to other
+        elements of the same tag from other processes are never lost.
+        """
+        slot = self.slots[tag_name]
+        start = slot.offset + SLOT_HEADER.size
+        with self.lock:
+            ## Writers hold the lock, so the value cannot change while it is read
+            elements = slot.decode(bytes(self._buf[start:slot.offset + slot.size]))
+            previous = list(elements)
+            elements[key] = value
+            if elements == previous:
+                return False
+            self._store(slot, slot.encode(elements))
+        return True
+
+    def _store(self, slot: TagSlot, data: bytes):
+        """Write a slot's value under its seqlock, the caller holds the writers' lock"""
+        start = slot.offset + SLOT_HEADER.size
+        sequence = SEQUENCE.unpack_from(self._buf, slot.offset)[0]
+        SEQUENCE.pack_into(self._buf, slot.offset, (sequence + 1) & 0xFFFFFFFF)
+        self._buf[start:start + len(data)] = data
+        SEQUENCE.pack_into(self._buf, slot.offset, (sequence + 2) & 0xFFFFFFFF)
+
+    def count_read(self, tag_name: str, now: float):
+        offset = self.slots[tag_name].offset
+        COUNTER.pack_into(self._buf, offset + READS, COUNTER.unpack_from(self._buf, offset + READS)[0] + 1)
+        TIMESTAMP.pack_into(self._buf, offset + LAST_READ, now)
+
+    def count_write(self, tag_name: str, now: float):
+        offset = self.slots[tag_name].offset
+        COUNTER.pack_into(self._buf, offset + WRITES, COUNTER.unpack_from(self._buf, offset + WRITES)[0] + 1)
+        TIMESTAMP.pack_into(self._buf, offset + LAST_WRITE, now)
+
+    def stats(self, tag_name: str) -> Dict[str, Any]:
+        """Client read and write counts for a tag, and when it was last read and written."""
+        _, _, reads, writes, last_read, last_write = SLOT_HEADER.unpack_from(self._buf, self.slots[tag_name].offset)
+        return {"reads": reads, "writes": writes, "last_read": last_read, "last_write": last_write}
+
+    def close(self):
+        self._shm.close()
+        self._buf = None
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
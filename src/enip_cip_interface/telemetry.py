@@ -0,0 +1,121 @@
+import struct
+import threading
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional
+
+"""
+Fixed size request telemetry for the ENIP server, kept in shared memory.
+
+The cpppo server process counts every request against the client that made it, in a table with
+a fixed number of client records. Each connection is served by a single thread, so every record
+has a single writer and the counts stay exact without any locking on the request path. When the
+table is full the least recently seen client is evicted, and its counts are folded into the
+totals in the table header so the overall counts never go backwards.
+
+The main process only ever reads the table, and works out rates from the difference between two
+samples, so the cost of telemetry does not grow with the request rate.
+"""
+
+CLIENT_SLOTS = 32
+HOST_SIZE = 46 # Long enough for any IPv6 address
+HEADER = struct.Struct("<QQ") # reads, writes of evicted clients
+CLIENT_RECORD = struct.Struct(f"<{HOST_SIZE}sHQQQdd") # host, port, requests, reads, writes, first_seen, last_seen
+
+
+class ClientTable:
+
+    def __init__(self, name: Optional[str] = None, slots: int = CLIENT_SLOTS):
+        """Create a client table, or attach to an existing one by name."""
+        self._owner = name is None
+        if self._owner:
+            size = HEADER.size + CLIENT_RECORD.size * slots
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._shm.buf[:size] = bytes(size)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+        self._buf = self._shm.buf
+        self.slots = (self._shm.size - HEADER.size) // CLIENT_RECORD.size
+
+        ## Only used by the server process, to assign records to clients
+        self._assign_lock = threading.Lock()
+        self._client_slots: Dict[Any, int] = {}
+
+    @property
+    def name(self) -> str:
+        return self._shm.name
+
+    def _offset(self, slot: int) -> int:
+        return HEADER.size + CLIENT_RECORD.size * slot
+
+    def _unpack(self, slot: int) -> tuple:
+        return CLIENT_RECORD.unpack_from(self._buf, self._offset(slot))
+
+    def client_slot(self, addr: Any, now: float) -> int:
+        """The record for a client address, assigning one if the client is new."""
+        slot = self._client_slots.get(addr)
+        if slot is not None:
+            return slot
+        with self._assign_lock:
+            records = [self._unpack(i) for i in range(self.slots)]
+            free = [i for i, record in enumerate(records) if not record[5]]
+            if free:
+                slot = free[0]
+            else:
+                ## Evict the least recently seen client, keeping its counts in the totals
+                slot = min(range(self.slots), key=lambda i: records[i][6])
+                reads, writes = HEADER.unpack_from(self._buf, 0)
+                HEADER.pack_into(self._buf, 0, reads + records[slot][3], writes + records[slot][4])
+                self._client_slots = {a: s for a, s in self._client_slots.items() if s != slot}
+
+            host, port = (addr[0], addr[1]) if isinstance(addr, tuple) else (str(addr), 0)
+            CLIENT_RECORD.pack_into(
+                self._buf, self._offset(slot), str(host).encode("utf-8")[:HOST_SIZE], port, 0, 0, 0, now, now
+            )
+            self._client_slots[addr] = slot
+        return slot
+
+    def count_request(self, slot: int, now: float):
+        host, port, requests, reads, writes, first_seen, _ = self._unpack(slot)
+        CLIENT_RECORD.pack_into(self._buf, self._offset(slot), host, port, requests + 1, reads, writes, first_seen, now)
+
+    def count_read(self, slot: int):
+        host, port, requests, reads, writes, first_seen, last_seen = self._unpack(slot)
+        CLIENT_RECORD.pack_into(self._buf, self._offset(slot), host, port, requests, reads + 1, writes, first_seen, last_seen)
+
+    def count_write(self, slot: int):
+        host, port, requests, reads, writes, first_seen, last_seen = self._unpack(slot)
+        CLIENT_RECORD.pack_into(self._buf, self._offset(slot), host, port, requests, reads, writes + 1, first_seen, last_seen)
+
+    def clients(self) -> List[Dict[str, Any]]:
+        result = []
+        for slot in range(self.slots):
+            host, port, requests, reads, writes, first_seen, last_seen = self._unpack(slot)
+            if not first_seen:
+                continue
+            result.append({
+                "client": f"{host.rstrip(bytes(1)).decode('utf-8', errors='replace')}:{port}",
+                "requests": requests,
+                "reads": reads,
+                "writes": writes,
+                "first_seen": first_seen,
+                "last_seen": last_seen,
+            })
+        return result
+
+    def totals(self) -> tuple:
+        """Total (reads, writes) by every client since the table was created."""
+        reads, writes = HEADER.unpack_from(self._buf, 0)
+        for slot in range(self.slots):
+            record = self._unpack(slot)
+            reads += record[3]
+            writes += record[4]
+        return reads, writes
+
+    def close(self):
+        self._shm.close()
+        self._buf = None
+        if self._owner:
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,62 @@
+"""
+Shared fixtures, including a live ENIP server to run the PLC clients against.
+"""
+
+import socket
+import time
+
+import pytest
+
+from enip_cip_interface.enip_server import EnipServer, EnipTag
+
+SERVER_TAGS = {"Level": 1.5, "Count": 7, **{f"Tag{i}": float(i) for i in range(40)}}
+## How the server is run: one process, several worker processes sharing the port, or a thread
+SERVER_MODES = {"process": {}, "workers": {"workers": 2}, "thread": {"run_in_thread": True}}
+
+
+def free_port() -> int:
+    """A port nothing is using for TCP or UDP, so a server never waits on the last one to let go"""
+    ## A fixed port can also be handed out as the local end of a client connection
+    while True:
+        with socket.socket() as tcp, socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+            tcp.bind(("127.0.0.1", 0))
+            port = tcp.getsockname()[1]
+            try:
+                udp.bind(("127.0.0.1", port))
+            except OSError:
+                continue
+            return port
+
+
+def wait_for_port(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"Nothing listening on port {port} after {timeout}s")
+
+
+@pytest.fixture(scope="session")
+def enip_server():
+    port = free_port()
+    server = EnipServer(port=port, tags=[EnipTag(name, value) for name, value in SERVER_TAGS.items()])
+    try:
+        wait_for_port(port)
+        yield server
+    finally:
+        server.stop()
+
+
+@pytest.fixture(params=list(SERVER_MODES))
+def enip_server_mode(request):
+    """A server of its own, with a scalar and an array tag, run in each mode in turn"""
+    port = free_port()
+    server = EnipServer(port=port, tags=[EnipTag("Level", 1.5), EnipTag("Levels", [0.0] * 16)], **SERVER_MODES[request.param])
+    try:
+        wait_for_port(port)
+        yield server
+    finally:
+        server.stop()
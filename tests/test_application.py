@@ -0,0 +1,70 @@
+"""
+Tests for forwarding ENIP client writes to the tag_values channel.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from enip_cip_interface.application import EnipCipInterfaceApplication
+from enip_cip_interface.cip_client import AsyncCipClient
+from enip_cip_interface.doover_tags import TagSnapshot
+
+
+class FakeDeviceAgent:
+
+    def __init__(self):
+        self.published = []
+
+    async def publish_to_channel_async(self, channel_name, message, **kwargs):
+        self.published.append((channel_name, message))
+
+
+@pytest.mark.parametrize("enip_server_mode", ["thread"], indirect=True)
+def test_a_burst_of_client_writes_is_published_once(enip_server_mode):
+    server = enip_server_mode
+    server.update_tags({"app__pump__speed": 1.0, "app__valve": 0}, [])
+
+    app = object.__new__(EnipCipInterfaceApplication)
+    app.config = SimpleNamespace(
+        tag_namespace_separator=SimpleNamespace(value="__"),
+        enip_write_coalesce_window=SimpleNamespace(value=0.05),
+    )
+    app.enip_server = server
+    app.device_agent = FakeDeviceAgent()
+    app.tag_snapshot = TagSnapshot()
+    app.tag_snapshot.update({"app": {"pump": {"speed": 1.0, "state": "on"}, "valve": 0}})
+    pool_updates = []
+    app._plc_worker_pool = SimpleNamespace(update_tag_values=pool_updates.append)
+
+    async def run():
+        async with AsyncCipClient("127.0.0.1", port=server.port, timeout=2.0) as client:
+            for _ in range(50):
+                if "app__valve" in await client.read_tags(["app__valve"]):
+                    break
+                await asyncio.sleep(0.1)
+            for tag_name, value in [("app__pump__speed", 3.0), ("app__valve", 1), ("app__pump__speed", 4.0)]:
+                assert (await client.write_tag(tag_name, value)).Status == "Success"
+
+        task = asyncio.ensure_future(app.enip_write_task())
+        try:
+            for _ in range(50):
+                if app.device_agent.published:
+                    break
+                await asyncio.sleep(0.05)
+            ## Long enough for a second publish to show up if the writes were split
+            await asyncio.sleep(0.2)
+        finally:
+            task.cancel()
+            await task
+
+    asyncio.run(run())
+    assert app.device_agent.published == [("tag_values", {"app": {"pump": {"speed": 4.0}, "valve": 1}})]
+    assert server.pop_write_operations() == []
+
+    ## The local snapshot is updated without waiting for the channel to echo the writes back
+    assert app.tag_snapshot.get(("app", "pump", "speed")) == 4.0
+    assert app.tag_snapshot.get(("app", "pump", "state")) == "on"
+    assert app.tag_snapshot.get(("app", "valve")) == 1
+    assert pool_updates == [{("app",), ("app", "pump"), ("app", "pump", "speed"), ("app", "valve")}]
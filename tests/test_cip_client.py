@@ -0,0 +1,179 @@
+"""
+Tests for the native asyncio CIP client, its encoding helpers and requests against the bundled ENIP server.
+"""
+
+import asyncio
+import struct
+import time
+
+import pytest
+
+from enip_cip_interface.cip_client import (
+    AsyncCipClient,
+    TagType,
+    decode_value,
+    encode_tag_path,
+    encode_value,
+    FORWARD_OPEN,
+    LARGE_FORWARD_OPEN,
+    PARTIAL_TRANSFER,
+    READ_TAG_FRAGMENTED,
+    SUCCESS,
+    UNCONNECTED_MESSAGE_SIZE,
+)
+
+
+def test_encode_tag_path():
+    path, bit = encode_tag_path("Tank.Level[3]")
+    assert path == b"\x91\x04Tank" + b"\x91\x05Level\x00" + b"\x28\x03"
+    assert bit is None
+
+    path, bit = encode_tag_path("Status.7")
+    assert path == b"\x91\x06Status"
+    assert bit == 7
+
+    ## Controller scoped tags with a known symbol instance are addressed by instance
+    path, bit = encode_tag_path("Tank.Level", {"Tank": 0x1234})
+    assert path == b"\x20\x6b\x25\x00\x34\x12" + b"\x91\x05Level\x00"
+
+
+def test_value_round_trip():
+    for tag_type, value in [
+        (TagType(0xC4), -123456),
+        (TagType(0xCA), 1.5),
+        (TagType(0xC1), True),
+        (TagType(0xD0), "pump"),
+        (TagType(0xA0, 0x0FCE), "logix string"),
+    ]:
+        assert decode_value(tag_type, encode_value(tag_type, value, "tag")) == value
+
+
+def test_pack_requests_respects_message_size():
+    client = AsyncCipClient("127.0.0.1")
+    requests = [(i, b"\x4c\x03" + b"x" * 20, 8) for i in range(100)]
+    packets = client.pack_requests(requests)
+
+    assert [key for packet in packets for key, _, _ in packet] == list(range(100))
+    for packet in packets:
+        request_size = 8 + sum(len(r) + 2 for _, r, _ in packet)
+        assert request_size <= UNCONNECTED_MESSAGE_SIZE
+
+
+def test_connected_packets_use_negotiated_size():
+    client = AsyncCipClient("127.0.0.1")
+    assert client._forward_open_request(4002)[0] == LARGE_FORWARD_OPEN
+    assert client._forward_open_request(500)[0] == FORWARD_OPEN
+
+    requests = [(i, b"\x4c\x03" + b"x" * 20, 8) for i in range(100)]
+    unconnected = client.pack_requests(requests)
+
+    ## Pretend a Large Forward Open has succeeded
+    client._ot_connection_id = 1
+    client._negotiated_size = 4002
+    assert client.message_size == 4000
+    connected = client.pack_requests(requests)
+    assert len(connected) == 1 < len(unconnected)
+
+
+def test_partial_reads_are_completed_with_fragmented_reads():
+    payload = struct.pack("<10i", *range(10))
+    client = AsyncCipClient("127.0.0.1")
+    offsets = []
+
+    async def send_packet(requests):
+        return [(PARTIAL_TRANSFER, b"\xc4\x00" + payload[:16])]
+
+    async def send(request):
+        offset = struct.unpack_from("<I", request, len(request) - 4)[0]
+        offsets.append(offset)
+        end = min(offset + 16, len(payload))
+        status = SUCCESS if end == len(payload) else PARTIAL_TRANSFER
+        return bytes([READ_TAG_FRAGMENTED | 0x80, 0, status, 0]) + b"\xc4\x00" + payload[offset:end]
+
+    client.send_packet = send_packet
+    client.send = send
+    response = asyncio.run(client.read_tags(["Big"]))["Big"]
+    assert response.Status == "Success"
+    assert response.Value == list(range(10))
+    assert offsets == [16, 32]
+    assert client.known_types["Big"].size == len(payload)
+
+
+def test_truncated_reads_are_not_reported_as_success():
+    client = AsyncCipClient("127.0.0.1")
+
+    async def send_packet(requests):
+        return [(PARTIAL_TRANSFER, b"\xc4\x00\x01\x00\x00\x00")]
+
+    async def send(request):
+        ## The controller refuses the fragmented read
+        return bytes([READ_TAG_FRAGMENTED | 0x80, 0, 0x08, 0])
+
+    client.send_packet = send_packet
+    client.send = send
+    response = asyncio.run(client.read_tags(["Big"]))["Big"]
+    assert response.Status != "Success"
+    assert response.Value is None
+    assert "Big" not in client.known_types
+
+
+class PeakDict(dict):
+    """Records the most requests that were ever waiting for a reply at once"""
+    peak = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.peak = max(self.peak, len(self))
+
+
+@pytest.mark.parametrize("connected", [False, True])
+def test_pipelined_requests_against_the_enip_server(enip_server, connected):
+    tags = [f"Tag{i}" for i in range(40)]
+
+    async def run():
+        async with AsyncCipClient("127.0.0.1", port=enip_server.port, timeout=2.0, max_outstanding=8, connected=connected) as client:
+            assert client.is_connected == connected
+            pending = PeakDict()
+            if connected:
+                client._pending_connected = pending
+            else:
+                client._pending = pending
+
+            ## Single tag reads in flight together on one session, each matched back to its own request
+            responses = await asyncio.gather(*(client.read_tags([tag]) for tag in tags))
+            assert pending.peak > 1
+            for tag, response in zip(tags, responses):
+                assert response[tag].Status == "Success"
+                assert response[tag].Value == enip_server.read_tag(tag)
+
+            ## A batch read packs many tags into each request
+            batch = await client.read_tags(tags + ["Count"])
+            assert [batch[tag].Value for tag in tags] == [float(i) for i in range(40)]
+            assert batch["Count"].Value == 7
+
+            written = await client.write_tags({"Tag39": 139.0, "Tag38": 138.0})
+            assert all(r.Status == "Success" for r in written.values())
+            assert (await client.read_tags(["Tag39"]))["Tag39"].Value == 139.0
+            await client.write_tags({"Tag39": 39.0, "Tag38": 38.0})
+
+    asyncio.run(run())
+
+
+def test_requests_time_out_when_the_controller_does_not_answer():
+    async def silent(reader, writer):
+        while await reader.read(65536):
+            pass
+
+    async def run():
+        server = await asyncio.start_server(silent, "127.0.0.1", 0)
+        client = AsyncCipClient("127.0.0.1", port=server.sockets[0].getsockname()[1], timeout=0.2)
+        started = time.monotonic()
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await client.open()
+            assert time.monotonic() - started < 1.0
+        finally:
+            await client.close()
+            server.close()
+
+    asyncio.run(run())
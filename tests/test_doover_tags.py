@@ -0,0 +1,48 @@
+"""
+Tests for building tag_values channel messages from tag paths, and the indexed tag snapshot.
+"""
+
+from enip_cip_interface.doover_tags import DooverTagAccess, TagSnapshot
+
+
+def test_deep_paths_keep_their_siblings():
+    tags = DooverTagAccess()
+    assert tags.path_to_channel_message(("app", "pump", "speed"), 3.0) == {"app": {"pump": {"speed": 3.0}}}
+    assert tags.path_to_channel_message(("global",), True) == {"global": True}
+
+    message = tags.paths_to_channel_message([
+        (("app", "pump", "speed"), 3.0),
+        (("app", "pump", "state"), "on"),
+        (("app", "valve", "open"), True),
+        (("app", "pump", "speed"), 4.0),
+        (("global",), 1),
+    ])
+    assert message == {
+        "app": {"pump": {"speed": 4.0, "state": "on"}, "valve": {"open": True}},
+        "global": 1,
+    }
+
+
+def test_snapshot_indexes_paths_and_tracks_changes():
+    snapshot = TagSnapshot(history=2)
+    snapshot.update({"app": {"pump": {"speed": 3, "on": True}}, "flag": 1})
+    assert snapshot.get(("app", "pump", "speed")) == 3
+    assert snapshot.get(("app", "pump")) == {"speed": 3, "on": True}
+    assert snapshot.get(("app", "pump", "speed", "deeper")) is None
+    assert snapshot.get(("missing",), "default") == "default"
+    version = snapshot.version
+
+    assert snapshot.update({"app": {"pump": {"speed": 3, "on": True}}, "flag": 1}) == set()
+    assert snapshot.version == version
+
+    ## A value changing type is a change, and a change marks the dicts above it
+    snapshot.update({"app": {"pump": {"speed": 3, "on": True}}, "flag": True})
+    snapshot.update({"app": {"pump": {"speed": 4}}, "flag": True})
+    assert snapshot.changed_since(version) == {
+        ("flag",), ("app",), ("app", "pump"), ("app", "pump", "speed"), ("app", "pump", "on"),
+    }
+    assert snapshot.changed_since(snapshot.version) == set()
+
+    ## Changes older than the history are unknown
+    snapshot.update({})
+    assert snapshot.changed_since(version) is None
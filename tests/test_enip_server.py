@@ -0,0 +1,177 @@
+"""
+Tests for the ENIP server's tag handling.
+"""
+
+import asyncio
+import contextlib
+import os
+import threading
+import time
+
+import pytest
+
+from enip_cip_interface.cip_client import AsyncCipClient
+from enip_cip_interface.enip_server import EnipTag, diff_tag_values
+
+
+def test_diff_only_reports_changed_leaves():
+    previous = {"a": 1.0, "b": True, "c": "x", "d": [1.0, 2.0]}
+    current = {"a": 1.0, "b": 1, "d": [1.0, 3.0], "e": False}
+
+    changed, removed = diff_tag_values(previous, current)
+    ## b changes type from BOOL, even though True == 1
+    assert changed == {"b": 1, "d": [1.0, 3.0], "e": False}
+    assert removed == ["c"]
+    assert diff_tag_values(current, dict(current)) == ({}, [])
+
+
+def test_tag_type_follows_value():
+    tag = EnipTag("level", current_value=1.5)
+    assert tag.tag_type == "REAL"
+    tag.current_value = [True, False]
+    assert tag.tag_type == "BOOL[2]"
+    assert not hasattr(tag, "__dict__")
+
+
+def test_numeric_types_are_inferred_and_kept_stable():
+    assert EnipTag("counter", current_value=16777217).tag_type == "DINT"
+    assert EnipTag("total", current_value=2**40).tag_type == "LINT"
+    assert EnipTag("trend", current_value=[1, 2.5, 3]).tag_type == "REAL[3]"
+    assert EnipTag("mixed", current_value=[1, "a"]).tag_type == "STRING[2]"
+    assert EnipTag("precise", current_value=[0.1, 0.2], tag_type="LREAL").tag_type == "LREAL[2]"
+
+    ## A whole number does not turn a REAL tag into a DINT, and a DINT only ever widens
+    tag = EnipTag("level", current_value=20.5)
+    tag.current_value = 20
+    assert tag.tag_type == "REAL"
+    tag = EnipTag("counter", current_value=2**40)
+    tag.current_value = 5
+    assert tag.tag_type == "LINT"
+
+
+def test_parse_tag_type_overrides():
+    from enip_cip_interface.application import EnipCipInterfaceApplication
+
+    parsed = EnipCipInterfaceApplication.parse_enip_tag_types("app__total=lint, app__trend = LREAL,, bad=FLOAT")
+    assert parsed == {"app__total": "LINT", "app__trend": "LREAL"}
+
+
+async def read_until(client, tag, expected, timeout=5.0):
+    """Read a tag until it has the expected value, as tag changes reach the server asynchronously"""
+    deadline = time.monotonic() + timeout
+    while True:
+        response = (await client.read_tags([tag]))[tag]
+        value = response.Value if response.Status == "Success" else None
+        if value == expected or time.monotonic() > deadline:
+            return value
+        await asyncio.sleep(0.05)
+
+
+def test_tags_are_added_removed_and_retyped_on_a_running_server(enip_server_mode):
+    server = enip_server_mode
+    segments = list(server._segments)
+
+    async def run():
+        async with AsyncCipClient("127.0.0.1", port=server.port, timeout=2.0) as client:
+            ## Tags added a few at a time fill the existing table rather than each mapping a new one
+            for i in range(0, 20, 4):
+                server.update_tags({f"Added{i + j}": float(i + j) for j in range(4)})
+            assert server._segments == segments
+            assert await read_until(client, "Added19", 19.0) == 19.0
+            response = await client.read_tags([f"Added{i}" for i in range(20)])
+            assert [response[f"Added{i}"].Value for i in range(20)] == [float(i) for i in range(20)]
+
+            ## A removed tag's slot is reused by the next tag of the same size
+            offset = server._tag_segments["Added0"].slots["Added0"].offset
+            server.update_tags({}, removed=["Added0"])
+            assert await read_until(client, "Added0", None) is None
+            server.update_tags({"Added20": 20.0})
+            assert server._tag_segments["Added20"].slots["Added20"].offset == offset
+            assert await read_until(client, "Added20", 20.0) == 20.0
+
+            server.update_tags({"Added1": "one"})
+            assert await read_until(client, "Added1", "one") == "one"
+            assert server.read_tag("Added1") == "one"
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("enip_server_mode", ["workers"], indirect=True)
+def test_element_writes_through_different_workers_are_not_lost(enip_server_mode):
+    server = enip_server_mode
+
+    async def write_element(client, index):
+        for value in range(1, 21):
+            response = await client.write_tag(f"Levels[{index}]", float(value))
+            assert response.Status == "Success"
+
+    async def run():
+        ## The port is open once the first worker listens, wait until every worker has answered a read
+        deadline = time.monotonic() + 10
+        while not all(table.totals()[0] for table in server._clients):
+            assert time.monotonic() < deadline, "Not every worker is listening"
+            async with AsyncCipClient("127.0.0.1", port=server.port, timeout=2.0) as client:
+                assert (await client.read_tags(["Level"]))["Level"].Value == 1.5
+
+        async with contextlib.AsyncExitStack() as stack:
+            ## The kernel spreads the connections between the workers listening on the port
+            clients = [
+                await stack.enter_async_context(AsyncCipClient("127.0.0.1", port=server.port, timeout=2.0))
+                for _ in range(16)
+            ]
+
+            await asyncio.gather(*(write_element(client, i) for i, client in enumerate(clients)))
+            response = await clients[0].read_tags([f"Levels[{i}]" for i in range(16)])
+            assert [response[f"Levels[{i}]"].Value for i in range(16)] == [20.0] * 16
+
+    asyncio.run(run())
+    assert server.read_tag("Levels") == [20.0] * 16
+
+
+@pytest.mark.parametrize("enip_server_mode", ["process", "workers"], indirect=True)
+def test_stop_waits_for_the_server_processes_to_exit(enip_server_mode):
+    server = enip_server_mode
+    pids = [process.pid for process in server._processes]
+    server.stop()
+    assert server._processes == [] and server._controls == []
+    for pid in pids:
+        ## A reaped process no longer exists, not even as a zombie
+        with pytest.raises(ProcessLookupError):
+            os.kill(pid, 0)
+
+
+@pytest.mark.parametrize("enip_server_mode", ["thread"], indirect=True)
+def test_server_on_a_thread_serves_clients_and_stops(enip_server_mode):
+    server = enip_server_mode
+    thread = server._processes[0]
+
+    async def run():
+        async with AsyncCipClient("127.0.0.1", port=server.port, timeout=2.0) as client:
+            assert (await client.read_tags(["Level"]))["Level"].Value == 1.5
+            assert (await client.write_tag("Level", 2.5)).Status == "Success"
+
+    asyncio.run(run())
+    assert server.read_tag("Level") == 2.5
+    assert [(op.tag_name, op.value) for op in server.pop_write_operations()] == [("Level", 2.5)]
+
+    server.stop()
+    assert not thread.is_alive()
+    ## cpppo's UDP thread only notices it has been stopped when a packet arrives, which stop sends
+    assert not [t for t in threading.enumerate() if "enip_srv" in t.name]
+
+
+def test_client_writes_wake_the_write_task(enip_server_mode):
+    server = enip_server_mode
+
+    async def run():
+        waiter = asyncio.ensure_future(server.await_write_received())
+        async with AsyncCipClient("127.0.0.1", port=server.port, timeout=2.0) as client:
+            assert (await client.write_tag("Level", 3.5)).Status == "Success"
+            written = time.monotonic()
+            await asyncio.wait_for(waiter, 2.0)
+            return time.monotonic() - written
+
+    ## The write task used to poll for writes every 200 ms
+    assert asyncio.run(run()) < 0.05
+    assert [(op.tag_name, op.value) for op in server.pop_write_operations()] == [("Level", 3.5)]
+    assert server.pop_write_operations() == []
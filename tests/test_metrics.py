@@ -0,0 +1,66 @@
+"""
+Tests for the metrics registry and its Prometheus rendering.
+"""
+
+import asyncio
+
+from enip_cip_interface.metrics import MetricsRegistry, compact_metrics, render_prometheus, start_metrics_server
+
+
+def make_registry():
+    registry = MetricsRegistry()
+    cycle = registry.histogram("cycle_seconds", "Cycle time", ("plc",), buckets=(0.01, 0.1))
+    errors = registry.counter("errors_total", "Errors", ("plc", "operation"))
+    tags = registry.gauge("tags", "Tags")
+    for value in (0.005, 0.01, 0.05, 2.0):
+        cycle.labels("pump").observe(value)
+    errors.labels("pump", "read").inc()
+    errors.labels("pump", "read").inc(2)
+    tags.set(12)
+    return registry
+
+
+def test_prometheus_rendering():
+    text = render_prometheus([make_registry().snapshot()])
+
+    assert "# TYPE cycle_seconds histogram" in text
+    ## Buckets are cumulative, and a value on a bound falls in that bucket
+    assert 'cycle_seconds_bucket{plc="pump",le="0.01"} 2' in text
+    assert 'cycle_seconds_bucket{plc="pump",le="0.1"} 3' in text
+    assert 'cycle_seconds_bucket{plc="pump",le="+Inf"} 4' in text
+    assert 'cycle_seconds_count{plc="pump"} 4' in text
+    assert 'errors_total{plc="pump",operation="read"} 3' in text
+    assert "\ntags 12\n" in text
+
+
+def test_snapshots_from_several_processes_are_merged():
+    worker = MetricsRegistry()
+    worker.counter("errors_total", "Errors", ("plc", "operation")).labels("tank", "write").inc()
+    snapshots = [make_registry().snapshot(), worker.snapshot()]
+
+    assert render_prometheus(snapshots).count("# TYPE errors_total counter") == 1
+    compact = compact_metrics(snapshots)
+    assert compact["errors_total"] == {"pump,read": 3, "tank,write": 1}
+    assert compact["cycle_seconds"]["pump"] == {"count": 4, "mean": (0.005 + 0.01 + 0.05 + 2.0) / 4}
+    assert compact["tags"] == {"": 12}
+
+
+def test_metrics_endpoint():
+    async def scrape():
+        server = await start_metrics_server(0, lambda: [make_registry().snapshot()], host="127.0.0.1")
+        port = server.sockets[0].getsockname()[1]
+        try:
+            responses = []
+            for path in ("/metrics", "/other"):
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+                responses.append(await reader.read())
+                writer.close()
+            return responses
+        finally:
+            server.close()
+
+    metrics, missing = asyncio.run(scrape())
+    assert metrics.startswith(b"HTTP/1.1 200 OK")
+    assert b"errors_total" in metrics
+    assert missing.startswith(b"HTTP/1.1 404")
@@ -0,0 +1,58 @@
+"""
+Tests for the pylogix PLC client, run against a live ENIP server.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+from enip_cip_interface.app_config import EnipCipInterfaceConfig
+from enip_cip_interface.plc_client import PlcClient
+from enip_cip_interface.plc_sync import ReadPlan, WritePlan
+
+
+def make_plc_config(port):
+    plc_config = object.__new__(EnipCipInterfaceConfig).construct_plc()
+    plc_config.load_data({"name": "test", "address": "127.0.0.1", "port": port, "micro800": False, "timeout": 2.0})
+    return plc_config
+
+
+@pytest.mark.parametrize("enip_server_mode", ["process"], indirect=True)
+def test_client_reads_writes_and_lists_on_its_own_thread(enip_server_mode):
+    server = enip_server_mode
+
+    async def run():
+        async with PlcClient(make_plc_config(server.port), "test") as client:
+            ## Every pylogix call is made on the client's single worker thread
+            thread = await client._call(threading.current_thread)
+            assert thread.name.startswith("plc-test") and thread is not threading.current_thread()
+
+            ## A tag the controller does not have fails on its own, the connection is still good
+            results = await client.read(ReadPlan(["Level", "Levels[3]", "Missing"]))
+            assert (results["Level"].Value, results["Levels[3]"].Value) == (1.5, 0.0)
+            assert results["Missing"].Status != "Success"
+
+            write_plan = WritePlan()
+            write_plan.add("Level", 2.5)
+            write_plan.add("Levels[3]", 4.0)
+            assert {tag: r.Status for tag, r in (await client.write(write_plan)).items()} == {"Level": "Success", "Levels[3]": "Success"}
+            results = await client.read(ReadPlan(["Level", "Levels[3]"]))
+            assert (results["Level"].Value, results["Levels[3]"].Value) == (2.5, 4.0)
+
+            key = await client.controller_key()
+            assert key is not None and key == await client.controller_key()
+
+            ## cpppo has no tag list and ends the session, the next request opens a new one
+            with pytest.raises(ConnectionError):
+                await client.list_tags()
+            assert (await client.read(ReadPlan(["Level"])))["Level"].Value == 2.5
+
+            await client.probe()
+            server.stop()
+            with pytest.raises(ConnectionError):
+                await client.probe()
+            with pytest.raises(ConnectionError, match="Lost connection"):
+                await client.read(ReadPlan(["Level"]))
+
+    asyncio.run(run())
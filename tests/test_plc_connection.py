@@ -0,0 +1,156 @@
+"""
+Tests for PLC connection management: failover, backoff and idle health probes.
+"""
+
+import asyncio
+import queue
+from types import SimpleNamespace
+
+from enip_cip_interface import plc_connection
+from enip_cip_interface.app_config import EnipCipInterfaceConfig
+from enip_cip_interface.cip_client import AsyncCipClient
+from enip_cip_interface.plc_connection import Backoff, PlcConnection
+from enip_cip_interface.plc_sync import PlcSyncTask
+from enip_cip_interface.plc_worker import PlcWorkerApp
+
+
+class FakeClient:
+
+    def __init__(self, address, log, up):
+        self.address = address
+        self.log = log
+        self.up = up
+
+    async def __aenter__(self):
+        self.log.append(("open", self.address))
+        return self
+
+    async def __aexit__(self, *args):
+        self.log.append(("close", self.address))
+
+    async def probe(self):
+        self.log.append(("probe", self.address))
+        if not self.up.get(self.address):
+            raise ConnectionError(f"{self.address} is down")
+
+
+def test_backoff_doubles_to_the_maximum_and_resets():
+    backoff = Backoff(0.5, 3.0)
+    delays = [backoff.next_delay() for _ in range(5)]
+    for delay, ceiling in zip(delays, [0.5, 1.0, 2.0, 3.0, 3.0]):
+        assert ceiling / 2 <= delay <= ceiling
+    backoff.reset()
+    assert backoff.next_delay() <= 0.5
+
+
+def test_fails_over_and_only_backs_off_once_every_address_has_failed(monkeypatch):
+    sleeps = []
+
+    async def fake_sleep(delay):
+        sleeps.append(delay)
+        ## The secondary comes up after the first backoff
+        up["secondary"] = True
+
+    monkeypatch.setattr(plc_connection.asyncio, "sleep", fake_sleep)
+    log = []
+    up = {}
+    connection = PlcConnection("pump", ["primary", "secondary"], lambda address: FakeClient(address, log, up), reconnect_delay=1.0)
+
+    client = asyncio.run(connection.connect())
+    assert client.address == "secondary"
+    assert [address for event, address in log if event == "open"] == ["primary", "secondary", "primary", "secondary"]
+    assert len(sleeps) == 1
+
+    ## After a successful cycle, losing the connection moves straight on to the other address
+    connection.healthy()
+    up["primary"] = True
+    asyncio.run(connection.connection_lost(ConnectionError("gone")))
+    assert asyncio.run(connection.connect()).address == "primary"
+    assert len(sleeps) == 1
+
+
+def test_idle_connection_is_probed():
+    log = []
+    connection = PlcConnection("pump", ["plc"], lambda address: FakeClient(address, log, {"plc": True}), health_check_period=0.01)
+
+    async def run():
+        loop = asyncio.get_running_loop()
+        await connection.connect()
+        await connection.idle_until(loop.time() + 0.05)
+
+    asyncio.run(run())
+    ## One probe to connect, then at least one while idle
+    assert sum(event == "probe" for event, _ in log) >= 2
+
+
+class StallingProxy:
+    """Forwards connections to the ENIP server until stalled, then silently drops everything both ways."""
+
+    def __init__(self, port):
+        self.port = port
+        self.stalled = False
+        self.server = None
+
+    async def start(self) -> int:
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def handle(self, reader, writer):
+        upstream_reader, upstream_writer = await asyncio.open_connection("127.0.0.1", self.port)
+
+        async def pipe(source, destination):
+            try:
+                while data := await source.read(65536):
+                    if not self.stalled:
+                        destination.write(data)
+                        await destination.drain()
+            except ConnectionError:
+                pass
+            finally:
+                destination.close()
+
+        await asyncio.gather(pipe(reader, upstream_writer), pipe(upstream_reader, writer))
+
+
+async def wait_until(condition, timeout=10.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "Timed out waiting"
+        await asyncio.sleep(0.05)
+
+
+def test_stalled_controller_fails_over_to_the_secondary_address(enip_server):
+    plc_config = object.__new__(EnipCipInterfaceConfig).construct_plc()
+    plc_config.load_data({
+        "name": "stall",
+        "address": "stalled",
+        "secondary_address": "direct",
+        "port": enip_server.port,
+        "micro800": False,
+        "sync_period": 0.1,
+        "reconnect_delay": 0.1,
+        "tag_mappings": [{"mode": "Read from PLC", "plc_tag": "Level", "doover_tag": "tank__level"}],
+    })
+    config = SimpleNamespace(tag_namespace_separator=SimpleNamespace(value="__"), tag_cache_directory=SimpleNamespace(value=""))
+    task = PlcSyncTask(PlcWorkerApp(config, results=queue.Queue()), plc_config)
+    proxy = StallingProxy(enip_server.port)
+    ports = {"direct": enip_server.port}
+    task.create_client = lambda address=None: AsyncCipClient("127.0.0.1", port=ports[address], timeout=0.3)
+
+    async def run():
+        ports["stalled"] = await proxy.start()
+        await task.start()
+        try:
+            await wait_until(lambda: task.connection is not None and task.connection.client is not None and task.task_run_times)
+            assert task.connection.address == "stalled"
+
+            ## The connection stays open but nothing is answered, which has to be noticed without a socket error
+            proxy.stalled = True
+            await wait_until(lambda: task.connection.address == "direct" and task.connection.client is not None)
+            last_run = task.task_run_times[-1][0]
+            await wait_until(lambda: task.task_run_times[-1][0] > last_run)
+        finally:
+            await task.stop()
+            proxy.server.close()
+
+    asyncio.run(run())
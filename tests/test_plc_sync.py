@@ -0,0 +1,244 @@
+"""
+Tests for the PLC sync engine helpers.
+
+These use a fake pylogix connection so no PLC is required.
+"""
+
+import asyncio
+import queue
+from types import SimpleNamespace
+
+from pylogix.lgx_response import Response
+
+from enip_cip_interface.app_config import EnipCipInterfaceConfig
+from enip_cip_interface.plc_sync import PlcSyncTask, ReadPlan, WritePlan
+from enip_cip_interface.plc_worker import PlcWorkerApp
+from enip_cip_interface.sync_plan import SyncPlan
+
+
+def make_plc_config(*extra_mappings, **mapping):
+    # pydoover schemas share their element map between instances, so only build the PLC element
+    plc_config = object.__new__(EnipCipInterfaceConfig).construct_plc()
+    plc_config.load_data({
+        "name": "test-plc",
+        "tag_mappings": [{"mode": "Read from PLC", "plc_tag": "Level", "doover_tag": "tank__level", **mapping}, *extra_mappings],
+    })
+    return plc_config
+
+
+class FakeComm:
+    Micro800 = False
+
+    def __init__(self, values, answered=None):
+        self.values = values
+        self.answered = answered
+        self.read_calls = []
+        self.write_calls = []
+
+    def Read(self, tags):
+        self.read_calls.append(list(tags))
+        tags = tags[:self.answered] if self.answered is not None else tags
+        return [Response(t, self.values.get(t), 0 if t in self.values else 4) for t in tags]
+
+    def Write(self, items):
+        self.write_calls.append(list(items))
+        return [Response(t, v, 0 if t in self.values else 4) for t, v in items]
+
+
+class FakeClient:
+
+    def __init__(self, comm):
+        self.comm = comm
+
+    async def read(self, read_plan):
+        return read_plan.execute(self.comm)
+
+    async def write(self, write_plan):
+        return write_plan.execute(self.comm)
+
+
+def test_read_plan_dedupes_and_reads_once():
+    comm = FakeComm({"a": 1, "b": 2.5})
+    plan = ReadPlan(["a", "b", "a", None])
+    assert plan.tags == ["a", "b"]
+
+    results = plan.execute(comm)
+    assert comm.read_calls == [["a", "b"]]
+    assert results["a"].Value == 1
+    assert results["b"].Value == 2.5
+
+
+def test_read_plan_reports_failures_per_tag():
+    comm = FakeComm({"a": 1}, answered=2)
+    results = ReadPlan(["a", "missing", "c"]).execute(comm)
+
+    assert results["a"].Status == "Success"
+    assert results["missing"].Status != "Success"
+    assert results["c"].Value is None
+    assert results["c"].Status == "No response from PLC"
+
+
+def test_write_plan_batches_and_reports_acknowledgements():
+    comm = FakeComm({"a": 1, "b": 2})
+    plan = WritePlan()
+    plan.add("a", 5)
+    plan.add("b", None)
+    plan.add("missing", 3, agreed=True)
+    plan.add("a", 6)
+
+    results = plan.execute(comm)
+    assert comm.write_calls == [[("a", 6), ("missing", 3)]]
+    assert results["a"].Status == "Success"
+    assert results["missing"].Status != "Success"
+    assert plan.agreed_tags == {"missing"}
+
+
+def test_report_by_exception_deadband_and_heartbeat():
+    plc_config = make_plc_config(deadband=5.0, deadband_type="Percent", heartbeat_period=60.0)
+    task = PlcSyncTask(app=None, plc_config=plc_config)
+    mapping = SyncPlan(plc_config, "__").from_plc[0]
+
+    assert task.should_report(mapping, 100.0, now=0)
+    task.report_value(mapping, 100.0, now=0)
+    assert not task.should_report(mapping, 104.0, now=1)
+    assert task.should_report(mapping, 106.0, now=1)
+    assert task.should_report(mapping, 100.0, now=61)
+
+
+def test_sync_plan_groups_mappings_and_reads():
+    plc_config = make_plc_config(
+        {"mode": "Write to PLC", "plc_tag": "Setpoint", "doover_tag": "tank__setpoint"},
+        {"mode": "Sync (PLC Preferred)", "plc_tag": "Level", "doover_tag": "app__tank__level_sync", "poll_period": 0.1},
+        deadband=2.0,
+    )
+    plan = SyncPlan(plc_config, "__")
+
+    assert len(plan) == 3
+    assert [m.plc_tag for m in plan.from_plc] == ["Level"]
+    assert [m.plc_tag for m in plan.to_plc] == ["Setpoint"]
+    assert plan.sync_plc_preferred[0].doover_path == ("app", "tank", "level_sync")
+    assert plan.from_plc[0].deadband == 2.0
+    assert plan.read_tags == ["Level"]
+
+    ## Mappings without a poll period use the PLC's sync period
+    assert list(plan.rate_groups) == [0.1, 1.0]
+    assert [m.plc_tag for m in plan.rate_groups[1.0].mappings] == ["Level", "Setpoint"]
+    assert plan.rate_groups[1.0].read_tags == ["Level"]
+
+    assert plan.signature == SyncPlan.config_signature(plc_config, "__")
+    assert plan.signature != SyncPlan.config_signature(plc_config, ".")
+
+
+def test_write_only_mappings_are_only_revisited_when_their_doover_value_changes():
+    plc_config = make_plc_config(*[
+        {"mode": "Write to PLC", "plc_tag": plc_tag, "doover_tag": f"tank__{plc_tag.lower()}"}
+        for plc_tag in ("Setpoint", "Speed", "Mode")
+    ])
+    app = PlcWorkerApp(SimpleNamespace(tag_namespace_separator=SimpleNamespace(value="__")), results=queue.Queue())
+    task = PlcSyncTask(app, plc_config)
+    comm = FakeComm({"Level": 1.0, "Setpoint": 0, "Speed": 0, "Mode": 0})
+    client = FakeClient(comm)
+
+    app.tag_snapshot.update({"tank": {"setpoint": 10, "speed": 20, "mode": 1}})
+    asyncio.run(task._sync_from_plc(client))
+    assert comm.write_calls == [[("Setpoint", 10), ("Speed", 20), ("Mode", 1)]]
+    group = task.plan.rate_groups[1.0]
+    assert task.to_plc_mappings(1.0, group) == []
+
+    app.tag_snapshot.update({"tank": {"setpoint": 10, "speed": 25, "mode": 1}})
+    assert [m.plc_tag for m in task.to_plc_mappings(1.0, group)] == ["Speed"]
+    asyncio.run(task._sync_from_plc(client))
+    assert comm.write_calls[-1] == [("Speed", 25)]
+
+    ## A failed write is retried until it succeeds
+    del comm.values["Mode"]
+    app.tag_snapshot.update({"tank": {"setpoint": 10, "speed": 25, "mode": 2}})
+    asyncio.run(task._sync_from_plc(client))
+    comm.values["Mode"] = 1
+    asyncio.run(task._sync_from_plc(client))
+    assert comm.write_calls[-2:] == [[("Mode", 2)], [("Mode", 2)]]
+    assert task.to_plc_mappings(1.0, group) == []
+
+
+def test_config_updates_recompile_the_plan_and_reopen_the_connection():
+    def plc_config(address, *plc_tags):
+        plc_config = object.__new__(EnipCipInterfaceConfig).construct_plc()
+        plc_config.load_data({
+            "name": "test-plc",
+            "address": address,
+            "port": 44818,
+            "sync_period": 0.02,
+            "tag_mappings": [{"mode": "Read from PLC", "plc_tag": t, "doover_tag": f"tank__{t.lower()}"} for t in plc_tags],
+        })
+        return plc_config
+
+    config = SimpleNamespace(tag_namespace_separator=SimpleNamespace(value="__"), tag_cache_directory=SimpleNamespace(value=""))
+    task = PlcSyncTask(PlcWorkerApp(config, results=queue.Queue()), plc_config("10.0.0.1", "Level"))
+    comm = FakeComm({"Level": 1.0, "Speed": 2.0})
+    opened = []
+
+    class ConnectedClient(FakeClient):
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def probe(self):
+            pass
+
+        async def controller_key(self):
+            return None
+
+    def create_client(address=None):
+        opened.append(address)
+        return ConnectedClient(comm)
+
+    task.create_client = create_client
+
+    async def wait_for_read(tags):
+        for _ in range(200):
+            if comm.read_calls and comm.read_calls[-1] == tags:
+                return
+            await asyncio.sleep(0.01)
+        raise AssertionError(f"{tags} never read, last read {comm.read_calls[-1:]}")
+
+    async def run():
+        await task.start()
+        try:
+            await wait_for_read(["Level"])
+
+            ## Unchanged settings keep the plan and the connection
+            plan = task.plan
+            task.update_config(plc_config("10.0.0.1", "Level"))
+            assert not task.plan_changed and not task.connection_changed
+            assert task.plan is plan
+
+            task.update_config(plc_config("10.0.0.1", "Level", "Speed"))
+            await wait_for_read(["Level", "Speed"])
+            assert opened == ["10.0.0.1"]
+
+            task.update_config(plc_config("10.0.0.2", "Level", "Speed"))
+            for _ in range(200):
+                if task.connection.address == "10.0.0.2" and task.connection.client is not None:
+                    break
+                await asyncio.sleep(0.01)
+            assert opened == ["10.0.0.1", "10.0.0.2"]
+        finally:
+            await task.stop()
+
+    asyncio.run(run())
+
+
+def test_small_setpoint_changes_are_written():
+    plc_config = make_plc_config({"mode": "Write to PLC", "plc_tag": "Setpoint", "doover_tag": "tank__setpoint"})
+    app = PlcWorkerApp(SimpleNamespace(tag_namespace_separator=SimpleNamespace(value="__")), results=queue.Queue())
+    task = PlcSyncTask(app, plc_config)
+    comm = FakeComm({"Level": 1.0, "Setpoint": 0.0})
+    client = FakeClient(comm)
+
+    app.tag_snapshot.update({"tank": {"setpoint": 1.0}})
+    asyncio.run(task._sync_from_plc(client))
+    app.tag_snapshot.update({"tank": {"setpoint": 1.005}})
+    asyncio.run(task._sync_from_plc(client))
+    assert comm.write_calls == [[("Setpoint", 1.0)], [("Setpoint", 1.005)]]
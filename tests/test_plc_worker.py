@@ -0,0 +1,125 @@
+"""
+Tests for sharding PLC sync across worker processes, without starting any processes.
+"""
+
+import asyncio
+import queue
+from types import SimpleNamespace
+
+from enip_cip_interface import plc_worker
+from enip_cip_interface.app_config import EnipCipInterfaceConfig, plc_config_name
+from enip_cip_interface.doover_tags import DooverTagAccess, TagSnapshot
+from enip_cip_interface.plc_worker import PlcWorkerApp, PlcWorkerPool
+
+
+def make_plc_config(name, num_mappings):
+    plc_config = object.__new__(EnipCipInterfaceConfig).construct_plc()
+    plc_config.load_data({
+        "name": name,
+        "tag_mappings": [{"mode": "Write to PLC", "plc_tag": f"t{i}", "doover_tag": f"app__t{i}"} for i in range(num_mappings)],
+    })
+    return plc_config
+
+
+def test_pool_balances_plcs_by_mapping_count():
+    plc_configs = [make_plc_config("big", 10), make_plc_config("a", 4), make_plc_config("b", 4), make_plc_config("c", 3)]
+    pool = PlcWorkerPool(app=None, plc_configs=plc_configs, num_workers=2)
+
+    assert [[p.name.value for p in shard] for shard in pool.shards] == [["big"], ["a", "b", "c"]]
+    assert pool.tasks["c"].worker_id == 1
+
+    ## Never more workers than PLCs
+    assert PlcWorkerPool(app=None, plc_configs=plc_configs[:1], num_workers=4).num_workers == 1
+
+
+def test_worker_app_reads_tags_and_queues_values():
+    results = queue.Queue()
+    app = PlcWorkerApp(config=None, results=results)
+    app.tag_snapshot.update({"app": {"pump": {"speed": 3}}, "flag": True})
+
+    assert app.retreive_doover_path_value(("app", "pump", "speed")) == 3
+    assert app.retreive_doover_path_value(("flag",)) is True
+    assert app.retreive_doover_path_value(("app", "missing")) is None
+
+    asyncio.run(app.publish_plc_values("plc", [(("app", "level"), 1.5)]))
+    assert results.get_nowait() == ("values", "plc", [(("app", "level"), 1.5)])
+
+
+def test_workers_are_only_sent_the_tag_values_their_plcs_map():
+    config = SimpleNamespace(tag_namespace_separator=SimpleNamespace(value="__"))
+    app = SimpleNamespace(config=config, tag_snapshot=TagSnapshot(), paths_to_channel_message=DooverTagAccess().paths_to_channel_message)
+    pool = PlcWorkerPool(app=app, plc_configs=[make_plc_config("a", 2), make_plc_config("b", 1)], num_workers=2)
+    pool._shard_paths = [pool.mapped_paths(shard) for shard in pool.shards]
+    pool._shard_values = [None, None]
+    pool._commands = [queue.Queue(), queue.Queue()]
+
+    def sent():
+        return [commands.get_nowait()[1] if not commands.empty() else None for commands in pool._commands]
+
+    pool.update_tag_values(app.tag_snapshot.update({"app": {"t0": 1, "t1": 2, "other": 3}}))
+    assert sent() == [{"app": {"t0": 1, "t1": 2}}, {"app": {"t0": 1}}]
+
+    pool.update_tag_values(app.tag_snapshot.update({"app": {"t0": 1, "t1": 5, "other": 4}}))
+    assert sent() == [{"app": {"t0": 1, "t1": 5}}, None]
+
+
+POLLING_TASKS = {} # The latest stand-in task for each PLC, by name
+
+
+class PollingTask:
+    """Stands in for a PLC sync task, counting the times it would have polled its PLC"""
+
+    def __init__(self, app, plc_config):
+        self.plc_name = plc_config_name(plc_config)
+        self.polls = 0
+        self.sync_speed_hz = self.average_task_time = 0.0
+        self.rate_class_stats = {}
+        self._task = None
+        POLLING_TASKS[self.plc_name] = self
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        self._task = None
+
+    def update_config(self, plc_config):
+        pass
+
+    async def _run(self):
+        while True:
+            self.polls += 1
+            await asyncio.sleep(0.01)
+
+
+def test_removed_plcs_stop_being_polled(monkeypatch):
+    monkeypatch.setattr(plc_worker, "PlcSyncTask", PollingTask)
+    config = SimpleNamespace(tag_namespace_separator=SimpleNamespace(value="__"))
+    app = SimpleNamespace(config=config, tag_snapshot=TagSnapshot(), paths_to_channel_message=DooverTagAccess().paths_to_channel_message)
+    plc_configs = [make_plc_config("a", 2), make_plc_config("b", 1)]
+    pool = PlcWorkerPool(app=app, plc_configs=plc_configs, num_workers=1)
+    pool._shard_paths = [pool.mapped_paths(shard) for shard in pool.shards]
+    pool._shard_values = [None]
+    pool._commands = [queue.Queue()]
+
+    async def run():
+        worker = asyncio.ensure_future(plc_worker._worker_loop(0, config, pool.shards[0], pool._commands[0], queue.Queue()))
+        await asyncio.sleep(0.05)
+        removed = POLLING_TASKS["b"]
+        assert removed.polls > 0
+
+        pool.update_configs([plc_configs[0], make_plc_config("c", 1)])
+        await asyncio.sleep(0.05)
+        polls = removed.polls
+        await asyncio.sleep(0.05)
+        assert removed.polls == polls and removed._task is None
+        assert POLLING_TASKS["c"].polls > 0
+
+        pool._commands[0].put(("stop", None))
+        await asyncio.wait_for(worker, 5.0)
+
+    asyncio.run(run())
+    assert sorted(pool.tasks) == ["a", "c"]
+    assert [[plc_config_name(p) for p in shard] for shard in pool.shards] == [["a", "c"]]
+    assert pool.tasks["c"].worker_id == 0
@@ -0,0 +1,66 @@
+"""
+Tests for the multi-rate PLC sync scheduler.
+"""
+
+from enip_cip_interface.app_config import OverrunPolicy
+from enip_cip_interface.scheduler import MultiRateScheduler
+
+
+def test_co_due_classes_run_together_without_drift():
+    scheduler = MultiRateScheduler([0.5, 1.0, 0.5], now=0.0)
+    assert list(scheduler.rate_classes) == [0.5, 1.0]
+
+    due = scheduler.due(0.0)
+    assert [rc.period for rc in due] == [0.5, 1.0]
+    ## A cycle that starts late does not push later deadlines back
+    assert scheduler.complete(due, started=0.1, finished=0.2) == []
+    assert scheduler.next_deadline() == 0.5
+
+    assert [rc.period for rc in scheduler.due(0.5)] == [0.5]
+    assert [rc.period for rc in scheduler.due(1.0)] == [0.5, 1.0]
+
+
+def test_overrun_skips_missed_ticks_and_counts_them():
+    scheduler = MultiRateScheduler([0.5], now=0.0)
+    due = scheduler.due(0.0)
+
+    overran = scheduler.complete(due, started=0.0, finished=1.2)
+    assert overran == due
+    stats = scheduler.stats()[0.5]
+    assert stats["overruns"] == 1
+    assert stats["skipped"] == 2
+    assert stats["max_duration"] == 1.2
+    assert scheduler.next_deadline() == 1.5
+
+
+def test_overrun_policies():
+    catch_up = MultiRateScheduler([0.5], now=0.0, overrun_policy=OverrunPolicy.CATCH_UP)
+    catch_up.complete(catch_up.due(0.0), started=0.0, finished=1.2)
+    ## The missed ticks at 0.5 and 1.0 are still due, and run back to back
+    assert catch_up.next_deadline() == 0.5
+    catch_up.complete(catch_up.due(1.2), started=1.2, finished=1.3)
+    assert catch_up.next_deadline() == 1.0
+    stats = catch_up.stats()[0.5]
+    assert (stats["overruns"], stats["missed_deadlines"], stats["skipped"]) == (1, 2, 0)
+
+    stretch = MultiRateScheduler([0.5], now=0.0, overrun_policy=OverrunPolicy.STRETCH)
+    stretch.complete(stretch.due(0.0), started=0.0, finished=1.2)
+    ## The next cycle runs straight away, and the schedule carries on from there
+    assert stretch.next_deadline() == 1.2
+    stretch.complete(stretch.due(1.2), started=1.2, finished=1.3)
+    assert stretch.next_deadline() == 1.7
+    assert stretch.stats()[0.5]["skipped"] == 2
+
+
+def test_jitter_is_measured_between_starts():
+    scheduler = MultiRateScheduler([1.0], now=0.0)
+    for started in (0.0, 1.1, 2.0):
+        scheduler.complete(scheduler.due(started), started=started, finished=started + 0.01)
+    stats = scheduler.stats()[1.0]
+    assert abs(stats["max_jitter"] - 0.1) < 1e-9
+    assert abs(stats["mean_jitter"] - 0.1) < 1e-9
+
+    ## The gap while reconnecting is not counted as jitter
+    scheduler.restart(10.0)
+    scheduler.complete(scheduler.due(10.0), started=10.0, finished=10.01)
+    assert scheduler.rate_classes[1.0].last_jitter is None
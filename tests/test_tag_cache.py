@@ -0,0 +1,34 @@
+"""
+Tests for the persistent PLC tag metadata cache.
+"""
+
+from enip_cip_interface.tag_cache import TagInfo, TagMetadataCache, base_tag_name
+
+
+def test_base_tag_name():
+    assert base_tag_name("Level") == "Level"
+    assert base_tag_name("Tank.Level[3]") == "Tank.Level"
+    assert base_tag_name("Status.7") == "Status"
+    assert base_tag_name("Arr[1,2].3") == "Arr"
+
+
+def test_cache_round_trip_is_keyed_by_controller(tmp_path):
+    cache = TagMetadataCache.for_plc(str(tmp_path), "plc 1")
+    assert cache.load("controller-a") is False
+
+    assert cache.merge({"Level": TagInfo("Level", 0xCA, size=4, instance_id=12)})
+    assert not cache.merge({"Level": TagInfo("Level", 0xC4, size=4)})
+    cache.save()
+
+    reloaded = TagMetadataCache.for_plc(str(tmp_path), "plc 1")
+    assert reloaded.load("controller-a") is True
+    info = reloaded.tags["Level"]
+    assert (info.type_code, info.size, info.instance_id) == (0xCA, 4, 12)
+
+    ## A different controller or program change discards the cached tags
+    assert reloaded.load("controller-b") is False
+    assert len(reloaded) == 0
+
+
+def test_cache_disabled_without_directory():
+    assert TagMetadataCache.for_plc("", "plc") is None
@@ -0,0 +1,93 @@
+"""
+Tests for the shared-memory ENIP tag table.
+"""
+
+import threading
+
+import pytest
+
+from enip_cip_interface.tag_table import STRING_SIZE, TagTable
+
+
+def test_values_round_trip_between_attached_tables():
+    table = TagTable({"flag": "BOOL", "level": "REAL", "name": "STRING", "levels": "REAL[3]"})
+    try:
+        other = TagTable(*table.attach_args())
+        table.write("flag", True)
+        table.write("level", 1.5)
+        table.write("name", "x" * (STRING_SIZE + 10))
+        other.write("levels", [1.0, 2.0, 3.0])
+
+        assert other.read("flag") is True
+        assert other.read("level") == 1.5
+        assert other.read("name") == "x" * STRING_SIZE
+        assert table.read("levels") == [1.0, 2.0, 3.0]
+        assert table.read_elements("level") == [1.5]
+        other.close()
+    finally:
+        table.close()
+
+
+def test_rejects_wrong_element_count_and_unknown_types():
+    table = TagTable({"levels": "REAL[2]"})
+    try:
+        with pytest.raises(ValueError):
+            table.write("levels", [1.0])
+    finally:
+        table.close()
+    with pytest.raises(ValueError):
+        TagTable({"blob": "UDT"})
+
+
+def test_integer_types_convert_and_range_check():
+    table = TagTable({"count": "DINT", "small": "SINT[2]", "precise": "LREAL"})
+    try:
+        table.write("count", 16777217)
+        table.write("small", [1.6, -3])
+        table.write("precise", 0.1)
+        assert table.read("count") == 16777217
+        assert table.read("small") == [2, -3]
+        assert table.read("precise") == 0.1
+        with pytest.raises(ValueError):
+            table.write("small", [1000, 0])
+    finally:
+        table.close()
+
+
+def test_tags_are_added_in_spare_space_and_reuse_removed_slots():
+    table = TagTable({"level": "REAL"}, spare=TagTable.size_of({"count": "DINT", "name": "STRING"}))
+    try:
+        offsets = table.add({"count": "DINT", "name": "STRING"})
+        assert not table.fits({"other": "STRING"})
+        with pytest.raises(ValueError):
+            table.add({"other": "STRING"})
+
+        table.remove(["count"])
+        assert table.add({"speed": "REAL"}) == {"speed": offsets["count"]}
+        table.write("speed", 2.5)
+
+        other = TagTable(*table.attach_args())
+        assert other.read("speed") == 2.5
+        assert other.offsets == table.offsets
+        other.close()
+    finally:
+        table.close()
+
+
+def test_element_writes_keep_concurrent_writes_to_other_elements():
+    table = TagTable({"levels": "REAL[2]"})
+    try:
+        other = TagTable(*table.attach_args())
+        with table.lock:
+            ## Another process writes the other element while the element write waits for the lock
+            writer = threading.Thread(target=other.write_elements, args=("levels", 1, 2.0))
+            writer.start()
+            writer.join(0.1)
+            assert writer.is_alive()
+            table._store(table.slots["levels"], table.slots["levels"].encode([1.0, 0.0]))
+        writer.join()
+        assert table.read("levels") == [1.0, 2.0]
+        assert not other.write_elements("levels", 1, 2.0)
+        other.close()
+    finally:
+        table.close()
@@ -0,0 +1,38 @@
+"""
+Tests for the ENIP server's shared-memory request telemetry.
+"""
+
+from enip_cip_interface.tag_table import TagTable
+from enip_cip_interface.telemetry import ClientTable
+
+
+def test_evicted_clients_keep_their_counts_in_the_totals():
+    table = ClientTable(slots=2)
+    try:
+        reader = ClientTable(table.name)
+        for port, reads in ((1000, 3), (1001, 1), (1002, 2)):
+            slot = table.client_slot(("10.0.0.1", port), now=float(port))
+            table.count_request(slot, now=float(port))
+            for _ in range(reads):
+                table.count_read(slot)
+        table.count_write(slot)
+
+        ## The first client was evicted, but still counts towards the totals
+        assert sorted(c["client"] for c in reader.clients()) == ["10.0.0.1:1001", "10.0.0.1:1002"]
+        assert reader.totals() == (6, 1)
+        reader.close()
+    finally:
+        table.close()
+
+
+def test_tag_counters_do_not_disturb_values():
+    table = TagTable({"level": "REAL"})
+    try:
+        table.write("level", 2.5)
+        table.count_read("level", now=10.0)
+        table.count_read("level", now=11.0)
+        table.count_write("level", now=12.0)
+        assert table.read("level") == 2.5
+        assert table.stats("level") == {"reads": 2, "writes": 1, "last_read": 11.0, "last_write": 12.0}
+    finally:
+        table.close()